@@ -3,6 +3,10 @@ ASGI config for health_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it (e.g. ``uvicorn health_project.asgi:application``) at least for
+/notifications/stream/, whose server-sent events hold a connection open
+per browser tab and would tie up a thread each under WSGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -132,7 +132,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tracker.middleware.CachedAuthenticationMiddleware',
+    'tracker.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "django.middleware.locale.LocaleMiddleware",
@@ -151,6 +152,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "tracker.context_processors.notification_settings",
             ],
         },
     },
@@ -218,16 +220,55 @@ os.makedirs(BASE_DIR / 'logs', exist_ok=True)
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Rate Limiting Settings
+RATE_LIMIT_ENABLED = True
 RATE_LIMIT_DEFAULTS = {
     'api': {'limit': 100, 'period': 3600},  # 100 requests per hour
-    'login': {'limit': 5, 'period': 300},   # 5 login attempts per 5 minutes
+    'login': {'limit': 5, 'period': 300, 'scope': 'ip', 'methods': ['POST']},   # 5 login attempts per 5 minutes
     'export': {'limit': 10, 'period': 3600}, # 10 exports per hour
 }
+# Workers take budget from the shared counters `size` tokens at a time and
+# answer checks locally until the lease is spent. Leases shrink so that the
+# workers together never admit more than `max_overadmission` of a limit
+# beyond it; `workers` should match gunicorn_config.workers. Small limits
+# (login, export) always go to the cache.
+RATE_LIMIT_LEASE = {'size': 10, 'max_overadmission': 0.3, 'workers': 3}
+# URL name -> RATE_LIMIT_DEFAULTS class; other api/ routes use 'api'
+RATE_LIMITED_VIEWS = {
+    'login': 'login',
+    'export_csv': 'export',
+    'export_pdf': 'export',
+}
+
+# Concurrency limits for expensive views (see decorators.bulkhead). At most
+# `per_worker` of a bulkhead's requests run in one process, and each takes
+# its view's cost out of `cluster` units shared by all workers. Requests
+# over capacity wait up to `queue_timeout` seconds (`max_queue` per process)
+# before getting a 503. Keep per_worker below gunicorn's threads.
+BULKHEADS = {
+    'reports': {'per_worker': 1, 'cluster': 4, 'max_queue': 1, 'queue_timeout': 1.0},
+}
+
+# Pub/sub behind the notification event stream. LocalBroker only reaches
+# streams in the publishing process; CacheBroker relays events through the
+# cache to every ASGI worker, including those created by management commands
+NOTIFICATION_BROKER = 'tracker.events.LocalBroker'
+
+# Serve the unread badge through /notifications/stream/ instead of polling.
+# Only enable this under an ASGI server: a sync WSGI worker thread is held by
+# every open tab for STREAM_MAX_AGE and the events are never flushed
+NOTIFICATION_SSE_ENABLED = False
 
 # Backup Settings
 BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
 BACKUP_INTERVAL = 24 * 3600  # 24 hours
-MAX_BACKUPS = 7  # Keep last 7 backups
+# Grandfather-father-son retention: newest backup of each of the last N days, weeks and months
+BACKUP_RETENTION = {'daily': 7, 'weekly': 4, 'monthly': 3}
+BACKUP_COMPRESSION = 'auto'  # zstd (needs zstandard), gzip, or auto
+
+# Notification retention: archive_notifications moves read notifications
+# older than this to gzipped JSON lines files and deletes them
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive', 'notifications')
 
 # Authentication settings
 LOGIN_REDIRECT_URL = 'dashboard'
@@ -237,6 +278,8 @@ LOGIN_URL = 'login'
 AUTH_USER_MODEL = 'tracker.CustomUser'  # Uncommented
 
 # Session settings
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 SESSION_COOKIE_AGE = 86400  # 24 hours in seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
@@ -278,13 +321,18 @@ LOGGING = {
 }
 
 # Authentication Backends
+# EmailBackend also accepts usernames; a second backend would repeat the
+# lookup and the password hash on every failed login
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'tracker.backends.EmailBackend',
 ]
 
 # Email Configuration
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# Email is queued in the database and delivered by `manage.py
+# send_queued_email` through EMAIL_DELIVERY_BACKEND, here a local debugging
+# SMTP server on EMAIL_PORT (use the console backend to print instead)
+EMAIL_BACKEND = 'tracker.mail.QueuedEmailBackend'
+EMAIL_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'localhost'
 EMAIL_PORT = 1025
 EMAIL_HOST_USER = ''
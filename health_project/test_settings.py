@@ -82,4 +82,7 @@ CHART_DPI = 100  # Lower DPI for faster test execution
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 TEST_OUTPUT_VERBOSE = True
 TEST_OUTPUT_DESCRIPTIONS = True
-TEST_OUTPUT_DIR = 'test_output' 
\ No newline at end of file
+TEST_OUTPUT_DIR = 'test_output' 
+
+# Tests share one cache, so limits are only enforced where a test enables them
+RATE_LIMIT_ENABLED = False
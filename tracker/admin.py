@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, HealthRecord, DailyReminderSetting, FoodRecommendation
+from .models import CustomUser, HealthRecord, DailyReminderSetting, FoodRecommendation, HealthAnomaly
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -42,4 +42,11 @@ class DailyReminderSettingAdmin(admin.ModelAdmin):
     list_display = ('user', 'reminder_time', 'send_email', 'send_in_app')
     search_fields = ('user__username',)
 
+@admin.register(HealthAnomaly)
+class HealthAnomalyAdmin(admin.ModelAdmin):
+    list_display = ('record', 'metric', 'method', 'value', 'zscore', 'mad_score', 'detected_at')
+    list_filter = ('metric', 'method')
+    search_fields = ('record__user__username',)
+    readonly_fields = ('detected_at',)
+
 admin.site.register(FoodRecommendation)
@@ -0,0 +1,167 @@
+from itertools import groupby
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .models import WEIGHT_MILESTONE_KG
+
+METRICS = ('weight', 'sleep_hours', 'water_intake')
+
+DEFAULT_WINDOW = 14
+ZSCORE_THRESHOLD = 3.0
+MAD_THRESHOLD = 3.5
+
+# Scale of a standard normal expressed in MAD units
+MAD_TO_SIGMA = 1.4826
+
+# Smallest spread we trust per metric, so a perfectly flat baseline
+# (e.g. always 8h of sleep) does not turn every small change into infinity
+MIN_SCALE = {
+    'weight': 0.5,
+    'sleep_hours': 0.5,
+    'water_intake': 0.25,
+}
+
+
+def rolling_scores(values, window: int = DEFAULT_WINDOW, min_scale: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every reading against the rolling baseline of the readings before it.
+
+    Args:
+        values: Sequence of readings ordered by date
+        window: Number of previous readings forming the baseline
+        min_scale: Lower bound for the standard deviation / robust sigma
+
+    Returns:
+        tuple: (zscores, mad_scores) aligned with values, NaN where the
+        baseline is not yet full
+    """
+    values = np.asarray(values, dtype=float)
+    zscores = np.full(values.size, np.nan)
+    mad_scores = np.full(values.size, np.nan)
+    if values.size <= window:
+        return zscores, mad_scores
+
+    # windows[i] holds values[i:i + window], the baseline for values[i + window]
+    windows = sliding_window_view(values[:-1], window)
+    current = values[window:]
+
+    std = np.maximum(windows.std(axis=1, ddof=1), min_scale)
+    median = np.median(windows, axis=1)
+    sigma = np.maximum(np.median(np.abs(windows - median[:, None]), axis=1) * MAD_TO_SIGMA, min_scale)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscores[window:] = np.where(std > 0, (current - windows.mean(axis=1)) / std, 0.0)
+        mad_scores[window:] = np.where(sigma > 0, (current - median) / sigma, 0.0)
+    return zscores, mad_scores
+
+
+def detect_metric_anomalies(metric: str, values, window: int = DEFAULT_WINDOW,
+                            z_threshold: float = ZSCORE_THRESHOLD,
+                            mad_threshold: float = MAD_THRESHOLD) -> List[Dict]:
+    """
+    Find anomalous readings in one metric series.
+
+    Weight additionally keeps the absolute swing rule used by
+    HealthRecord.save, so a jump of WEIGHT_MILESTONE_KG between consecutive
+    readings is flagged even before a full baseline exists.
+
+    Args:
+        metric: Name of the HealthRecord field
+        values: Sequence of readings ordered by date
+        window: Number of previous readings forming the baseline
+        z_threshold: Absolute z-score above which a reading is flagged
+        mad_threshold: Absolute robust score above which a reading is flagged
+
+    Returns:
+        list: One dict per flagged reading with index, method and scores
+    """
+    values = np.asarray(values, dtype=float)
+    zscores, mad_scores = rolling_scores(values, window, MIN_SCALE.get(metric, 0.0))
+
+    swings = np.zeros(values.size, dtype=bool)
+    if metric == 'weight' and values.size > 1:
+        swings[1:] = np.abs(np.diff(values)) >= WEIGHT_MILESTONE_KG
+
+    with np.errstate(invalid='ignore'):
+        mad_hits = np.abs(mad_scores) >= mad_threshold
+        z_hits = np.abs(zscores) >= z_threshold
+
+    anomalies = []
+    for index in np.flatnonzero(mad_hits | z_hits | swings):
+        if mad_hits[index]:
+            method = 'MAD'
+        elif z_hits[index]:
+            method = 'ZSCORE'
+        else:
+            method = 'SWING'
+        anomalies.append({
+            'index': int(index),
+            'method': method,
+            'value': float(values[index]),
+            'zscore': None if np.isnan(zscores[index]) else round(float(zscores[index]), 3),
+            'mad_score': None if np.isnan(mad_scores[index]) else round(float(mad_scores[index]), 3),
+        })
+    return anomalies
+
+
+def iter_user_series(queryset=None, chunk_size: int = 2000) -> Iterator[Tuple[int, Dict]]:
+    """
+    Stream every user's records once, grouped per user.
+
+    Args:
+        queryset: Optional HealthRecord queryset to restrict the scan
+        chunk_size: Rows fetched per database round-trip
+
+    Yields:
+        tuple: (user_id, {metric: {'ids': [...], 'dates': [...], 'values': [...]}})
+    """
+    from .models import HealthRecord
+
+    if queryset is None:
+        queryset = HealthRecord.objects.all()
+    rows = queryset.order_by('user_id', 'date', 'id').values_list(
+        'user_id', 'id', 'date', *METRICS
+    ).iterator(chunk_size=chunk_size)
+
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        series = {metric: {'ids': [], 'dates': [], 'values': []} for metric in METRICS}
+        for row in user_rows:
+            for offset, metric in enumerate(METRICS, start=3):
+                if row[offset] is not None:
+                    series[metric]['ids'].append(row[1])
+                    series[metric]['dates'].append(row[2])
+                    series[metric]['values'].append(row[offset])
+        yield user_id, series
+
+
+def analyse_user(payload) -> Tuple[int, List[Dict]]:
+    """
+    Run anomaly detection over one user's series.
+
+    Kept free of database access so it can run in worker processes.
+
+    Args:
+        payload: (user_id, series, options) where options holds window,
+            z_threshold, mad_threshold and since (earliest date to flag)
+
+    Returns:
+        tuple: (user_id, list of flag dicts with record_id and metric)
+    """
+    user_id, series, options = payload
+    since = options.get('since')
+    flags = []
+    for metric, data in series.items():
+        for anomaly in detect_metric_anomalies(
+            metric,
+            data['values'],
+            window=options.get('window', DEFAULT_WINDOW),
+            z_threshold=options.get('z_threshold', ZSCORE_THRESHOLD),
+            mad_threshold=options.get('mad_threshold', MAD_THRESHOLD),
+        ):
+            index = anomaly.pop('index')
+            if since and data['dates'][index] < since:
+                continue
+            anomaly.update(record_id=data['ids'][index], metric=metric, date=data['dates'][index])
+            flags.append(anomaly)
+    return user_id, flags
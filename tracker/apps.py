@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class TrackerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tracker"
+
+    def ready(self):
+        from django.contrib.auth.signals import user_logged_in
+        from django.db.models.signals import post_delete, post_save
+        from .backends import invalidate_cached_user, update_last_login
+        from .events import notification_saved
+
+        # EmailBackend saves last_login together with the rest of a login
+        user_logged_in.disconnect(dispatch_uid='update_last_login')
+        user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
+
+        user_model = self.get_model('CustomUser')
+        post_save.connect(invalidate_cached_user, sender=user_model, dispatch_uid='invalidate_cached_user')
+        post_delete.connect(invalidate_cached_user, sender=user_model, dispatch_uid='invalidate_cached_user')
+
+        # Push new notifications to open notification streams
+        post_save.connect(notification_saved, sender=self.get_model('Notification'), dispatch_uid='notification_saved')
@@ -1,43 +1,181 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
-from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user, get_user_model
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import update_last_login as django_update_last_login
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F, Q
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+# Failed attempts within LOCKOUT_DURATION of the first that lock an account,
+# and for how long
+MAX_FAILED_ATTEMPTS = 5
+LOCKOUT_DURATION = timezone.timedelta(minutes=15)
+
+# Signed-in users are cached between requests. Saving or deleting a user
+# drops the entry; the timeout bounds staleness from writes that bypass
+# signals, such as restoring a backup.
+USER_CACHE_TIMEOUT = 300
+
+
+def failure_key(user_id):
+    return f'login_failures:{user_id}'
+
+
+def cache_is_shared():
+    """Whether the default cache is seen by every worker process, unlike the local-memory and dummy caches."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def record_failure(user):
+    """
+    Atomically count a failed login; returns the failures in the current window.
+
+    The count lives in the cache when every worker shares it. A local-memory
+    cache would count per process and forget on restart, so the count is
+    then kept in the user row instead, starting over once an earlier lock
+    has expired.
+    """
+    if cache_is_shared():
+        key = failure_key(user.pk)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, LOCKOUT_DURATION.total_seconds()):
+                return 1
+            return cache.incr(key)
+
+    rows = type(user)._default_manager.filter(pk=user.pk)
+    if user.account_locked_until:
+        rows.update(failed_login_attempts=1, account_locked_until=None, last_modified=timezone.now())
+        return 1
+    rows.update(failed_login_attempts=F('failed_login_attempts') + 1, last_modified=timezone.now())
+    return rows.values_list('failed_login_attempts', flat=True).first()
+
 
 class EmailBackend(ModelBackend):
+    """
+    Authenticate with a username or an email address.
+
+    A login costs one indexed lookup, one password hash and one UPDATE of
+    the fields it changes. last_login is part of that UPDATE, so login()
+    does not write the row again (see update_last_login).
+
+    Failed attempts are counted in the cache if it is shared, so that the
+    row is only written when they lock the account (see record_failure).
+    Locked accounts are rejected before hashing.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            # Try to fetch the user by email or username
-            user = UserModel.objects.get(
-                Q(email=username) | Q(username=username)
-            )
-            
-            # Check if account is locked
-            if user.account_locked_until and user.account_locked_until > timezone.now():
-                return None
-                
-            # Check password
-            if user.check_password(password):
-                # Reset failed login attempts on successful login
-                user.failed_login_attempts = 0
-                user.account_locked_until = None
-                user.last_login_ip = self.get_client_ip(request)
-                user.save()
-                return user
-            else:
-                # Increment failed login attempts
-                user.failed_login_attempts += 1
-                if user.failed_login_attempts >= 5:
-                    user.account_locked_until = timezone.now() + timezone.timedelta(minutes=15)
-                user.save()
-                return None
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # Both columns are unique; only identifiers that can be an email
+        # address need the second index
+        lookup = Q(username=username) | Q(email=username) if '@' in username else Q(username=username)
+        candidates = list(UserModel._default_manager.filter(lookup)[:2])
+        user = next((c for c in candidates if c.username == username), candidates[0] if candidates else None)
+        if user is None:
+            # Hash anyway, so unknown usernames take as long as known ones
+            UserModel().set_password(password)
             return None
 
+        now = timezone.now()
+        # Check if account is locked
+        if user.account_locked_until and user.account_locked_until > now:
+            return None
+
+        update_fields = ['last_modified']
+
+        def upgrade_hash(raw_password):
+            # Saved with the rest of the login instead of on its own
+            user.set_password(raw_password)
+            user._password = None
+            update_fields.append('password')
+
+        if not check_password(password, user.password, upgrade_hash):
+            # Only the attempt that reaches the limit writes the lock
+            if record_failure(user) >= MAX_FAILED_ATTEMPTS:
+                user.failed_login_attempts = MAX_FAILED_ATTEMPTS
+                user.account_locked_until = now + LOCKOUT_DURATION
+                update_fields += ['failed_login_attempts', 'account_locked_until']
+                user.save(update_fields=update_fields)
+                cache.delete(failure_key(user.pk))
+            return None
+        if not self.user_can_authenticate(user):
+            return None
+
+        # Reset failed login attempts on successful login
+        cache.delete(failure_key(user.pk))
+        if user.failed_login_attempts or user.account_locked_until:
+            user.failed_login_attempts = 0
+            user.account_locked_until = None
+            update_fields += ['failed_login_attempts', 'account_locked_until']
+        user.last_login_ip = self.get_client_ip(request)
+        user.last_login = now
+        update_fields += ['last_login_ip', 'last_login']
+        user.save(update_fields=update_fields)
+        user.last_login_saved = True
+        return user
+
     def get_client_ip(self, request):
+        if request is None:
+            return None
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip 
\ No newline at end of file
+        return ip
+
+
+def update_last_login(sender, user, **kwargs):
+    """
+    user_logged_in receiver used instead of Django's: users authenticated by
+    EmailBackend already had last_login saved.
+    """
+    if getattr(user, 'last_login_saved', False):
+        return
+    django_update_last_login(sender, user, **kwargs)
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def get_cached_user(request):
+    """
+    The user of the request's session, like django.contrib.auth.get_user()
+    but served from the cache when possible.
+
+    A cached user is only used if the session's auth hash matches it, so a
+    password change still ends other sessions. Users are not cached
+    unless the cache is shared: invalidation would only reach the worker
+    that saved the user, and the others would serve it stale.
+    """
+    session = request.session
+    user_id = session.get(SESSION_KEY)
+    session_hash = session.get(HASH_SESSION_KEY)
+    if user_id is None or session_hash is None or session.get(BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return get_user(request)
+    if not cache_is_shared():
+        return get_user(request)
+
+    user = cache.get(user_cache_key(user_id))
+    if user is not None and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return user
+    user = get_user(request)
+    if user.is_authenticated:
+        cache.set(user_cache_key(user.pk), user, USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """post_save/post_delete receiver: profile edits, password changes and lockouts all save the user."""
+    cache.delete(user_cache_key(instance.pk))
@@ -1,140 +1,1257 @@
 import os
+import re
+import gzip
+import hashlib
+import mmap
 import shutil
 import datetime
 import json
+import tarfile
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
 from django.conf import settings
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import connection, transaction
+from django.db.models import Count, F, Max
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Floor
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext as _
 from pathlib import Path
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Tar archives written before the blob store; still listed, verified and restorable
+BACKUP_NAME_RE = re.compile(
+    r'^health_backup_(?P<timestamp>\d{8}_\d{6}(?:_\d{6})?)(?P<incremental>\.incr)?\.tar\.(?P<compression>gz|zst)$'
+)
+
+# Timestamp fields that tell when a row last changed, in order of preference.
+# Incremental backups re-serialize every chunk of models without any of them.
+# auto_now does not cover QuerySet.update(), so every update() of a tracked
+# model must set the field itself or its rows are missed.
+CHANGE_TRACKING_FIELDS = ('last_modified', 'updated_at', 'computed_at', 'detected_at')
+
+# Rows are chunked by primary key range (pk // CHUNK_ROWS), so an unchanged
+# range serializes to the same blob in every backup and is stored only once
+CHUNK_ROWS = 5000
+
+FORMAT_VERSION = 4
+
+# Rows per INSERT during restore (capped further by the database's variable limit)
+RESTORE_BATCH_ROWS = 2000
+
+# Per-entry digests of legacy archives, in a sidecar file next to each one
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Summary of every backup, so listing backups reads one small file
+INDEX_NAME = 'index.json'
+
+BLOB_DIR = 'blobs'
+SNAPSHOT_DIR = 'snapshots'
+
+# Unreferenced blobs younger than this are left alone by garbage collection,
+# as a backup running concurrently may be about to reference them
+BLOB_GRACE_SECONDS = 3600
+
+DEFAULT_RETENTION = {'daily': 7, 'weekly': 4, 'monthly': 3}
+
+# Users per blob of the per-user row index
+USER_INDEX_SHARD = 1000
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def change_tracking_field(model):
+    """Return the name of the model's last-changed timestamp field, if any."""
+    field_names = {field.name for field in model._meta.get_fields()}
+    for name in CHANGE_TRACKING_FIELDS:
+        if name in field_names:
+            return name
+    return None
+
+
+def backup_models():
+    """Tracker models ordered so that referenced rows come first."""
+    app_models = list(apps.get_app_config('tracker').get_models())
+    return serializers.sort_dependencies([('tracker', app_models)])
+
+
+# Rows computed from a user's records. A refit or rank rebuild recreates
+# them under new primary keys, so a user restore replaces them instead of
+# upserting on the primary key, which would collide on their unique user
+# fields
+DERIVED_MODELS = ('tracker.usermetricbucket', 'tracker.weighttrend')
+
+
+def owner_lookup(model):
+    """
+    Lookup from a model to the id of the user owning its rows, or None.
+
+    Rows belong to the user they are about (the `user` field), not to
+    whoever created them; one relation deep is followed, e.g. an anomaly
+    belongs to its record's user.
+    """
+    user_model = get_user_model()
+    if model is user_model:
+        return 'pk'
+    fields = {field.name: field for field in model._meta.concrete_fields if field.is_relation}
+    if 'user' in fields and fields['user'].related_model is user_model:
+        return 'user'
+    for field in fields.values():
+        nested = field.related_model._meta.concrete_fields
+        if any(f.name == 'user' and f.is_relation and f.related_model is user_model for f in nested):
+            return f'{field.name}__user'
+    return None
+
+
+def resolve_compression(name=None):
+    """
+    Pick the compressor for new blobs.
+
+    'auto' prefers zstd and falls back to the standard library's gzip.
+    """
+    name = name or getattr(settings, 'BACKUP_COMPRESSION', 'auto')
+    if name == 'auto':
+        return 'zstd' if zstandard is not None else 'gzip'
+    if name == 'zstd' and zstandard is None:
+        raise ImportError("BACKUP_COMPRESSION='zstd' requires the zstandard package")
+    if name not in ('zstd', 'gzip'):
+        raise ValueError(f"Unknown BACKUP_COMPRESSION: {name}")
+    return name
+
+
+def open_archive_stream(path):
+    """Open a backup archive for sequential reading, whatever its compression."""
+    if str(path).endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("Reading .tar.zst backups requires the zstandard package")
+        raw = open(path, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return tarfile.open(fileobj=reader, mode='r|')
+    return tarfile.open(path, mode='r|gz')
+
+
+class HashingReader:
+    """Readable file wrapper that hashes everything read through it."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+def file_sha256(path):
+    """SHA-256 of a file, hashed straight from a read-only memory map."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            # hashlib releases the GIL for large buffers, so threads hash in parallel
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def manifest_path(backup_file):
+    return f'{backup_file}{MANIFEST_SUFFIX}'
+
+
+def read_manifest(backup_file):
+    """The sidecar manifest of an archive, or None for archives without one."""
+    try:
+        with open(manifest_path(backup_file)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def archive_index_entry(filename, manifest):
+    """Summary of one archive kept in the backup directory's index."""
+    info = manifest['info']
+    return {
+        'filename': filename,
+        'format': 'archive',
+        'timestamp': info['timestamp'],
+        'backup_type': info['backup_type'],
+        'size': manifest['archive']['size'],
+        'sha256': manifest['archive']['sha256'],
+        'compression': info['compression'],
+        'watermark': info['watermark'],
+        'chain': info['chain'],
+        'rows': sum(entry.get('rows', 0) for entry in manifest['entries'].values()),
+    }
+
+
+def write_json_atomic(path, data):
+    partial = f'{path}.partial'
+    with open(partial, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(partial, path)
+
+
+def verify_archive(backup_file, deep=True):
+    """
+    Check an archive against its manifest.
+
+    The archive's digest is compared with the sidecar first. With `deep`,
+    the archive is also decompressed and every entry's digest and row count
+    is checked against the manifest stored inside it, which catches damage
+    even when the sidecar itself is missing or was regenerated.
+
+    Args:
+        backup_file: Path to the archive
+        deep: Also decompress and check each entry
+
+    Returns:
+        dict: filename, ok, errors and warnings
+    """
+    result = {'filename': os.path.basename(backup_file), 'ok': True, 'errors': [], 'warnings': []}
+    sidecar = read_manifest(backup_file)
+    try:
+        if sidecar is None:
+            result['warnings'].append('No sidecar manifest')
+        else:
+            size = os.path.getsize(backup_file)
+            if size != sidecar['archive']['size']:
+                result['errors'].append(f"Archive size {size} != {sidecar['archive']['size']}")
+            elif file_sha256(backup_file) != sidecar['archive']['sha256']:
+                result['errors'].append('Archive checksum mismatch')
+        if deep:
+            _verify_entries(backup_file, sidecar, result)
+    except Exception as e:
+        result['errors'].append(str(e))
+    result['ok'] = not result['errors']
+    return result
+
+
+def _verify_entries(backup_file, sidecar, result):
+    """Recompute every entry's digest and row count and compare them with the manifest."""
+    errors = result['errors']
+    actual = {}
+    manifest = None
+    with open_archive_stream(backup_file) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = member_path(member.name)
+            stream = archive.extractfile(member)
+            if name == MANIFEST_NAME:
+                manifest = json.load(stream)
+                continue
+            digest = hashlib.sha256()
+            blocks = [] if name.startswith('database/') else None
+            for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+                if blocks is not None:
+                    blocks.append(block)
+            entry = {'sha256': digest.hexdigest(), 'size': member.size}
+            if blocks is not None:
+                entry['rows'] = len(json.loads(b''.join(blocks)))
+            actual[name] = entry
+
+    if manifest is None:
+        if sidecar is None:
+            result['warnings'].append('No manifest; only checked that the archive decompresses')
+            return
+        manifest = sidecar
+    expected = manifest['entries']
+    if sidecar is not None and sidecar['entries'] != expected:
+        errors.append('Sidecar manifest differs from the archive manifest')
+    for name in sorted(expected.keys() - actual.keys()):
+        errors.append(f'Missing entry {name}')
+    for name in sorted(actual.keys() - expected.keys()):
+        errors.append(f'Unexpected entry {name}')
+    for name in sorted(expected.keys() & actual.keys()):
+        for key, value in expected[name].items():
+            if actual[name].get(key) != value:
+                errors.append(f'{name}: {key} mismatch')
+
+
+class BlobStore:
+    """
+    Content-addressed blob storage.
+
+    Blobs are compressed individually and named by the SHA-256 of their
+    uncompressed content, so identical row chunks and media files are kept
+    once however many backups reference them. The compressor is recorded
+    in the file extension, so blobs written with either one stay readable.
+    """
+
+    EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz'}
+
+    def __init__(self, root, compression='gzip'):
+        self.root = root
+        self.compression = compression
+        self.stored = 0
+
+    def path(self, digest):
+        """Path of a stored blob, or None if it is not in the store."""
+        for extension in self.EXTENSIONS.values():
+            path = os.path.join(self.root, digest[:2], digest + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _new_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + self.EXTENSIONS[self.compression])
+
+    def _partial_path(self):
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f'{os.getpid()}_{time.monotonic_ns()}.partial')
+
+    def _reuse(self, digest):
+        path = self.path(digest)
+        if path is None:
+            return False
+        # Keeps the blob out of reach of a concurrent garbage collection
+        os.utime(path)
+        return True
+
+    def _commit(self, partial, digest):
+        target = self._new_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(partial, target)
+        self.stored += os.path.getsize(target)
+
+    def put_bytes(self, data):
+        """Store data unless an identical blob exists; return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self._reuse(digest):
+            if self.compression == 'zstd':
+                compressed = zstandard.ZstdCompressor(level=3).compress(data)
+            else:
+                compressed = gzip.compress(data, compresslevel=6, mtime=0)
+            partial = self._partial_path()
+            with open(partial, 'wb') as f:
+                f.write(compressed)
+            self._commit(partial, digest)
+        return digest
+
+    def put_file(self, source):
+        """
+        Store a file's content in a single read; return its digest.
+
+        The content is hashed while it is compressed to a temporary file,
+        which is then either kept as the new blob or dropped as a duplicate.
+        """
+        partial = self._partial_path()
+        try:
+            with open(source, 'rb') as src, open(partial, 'wb') as raw:
+                reader = HashingReader(src)
+                if self.compression == 'zstd':
+                    zstandard.ZstdCompressor(level=3).copy_stream(reader, raw)
+                else:
+                    with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) as out:
+                        shutil.copyfileobj(reader, out, HASH_BLOCK_SIZE)
+            digest = reader.digest.hexdigest()
+            if not self._reuse(digest):
+                self._commit(partial, digest)
+            return digest
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def open(self, digest):
+        """Readable stream of a blob's uncompressed content."""
+        path = self.path(digest)
+        if path is None:
+            raise FileNotFoundError(f'Missing blob {digest}')
+        if path.endswith('.zst'):
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return gzip.open(path, 'rb')
+
+    def read(self, digest):
+        with self.open(digest) as stream:
+            return stream.read()
+
+    def __iter__(self):
+        """Yield (digest, path) of every stored blob."""
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                digest, extension = os.path.splitext(name)
+                if extension in self.EXTENSIONS.values():
+                    yield digest, os.path.join(directory, name)
+
+
+def iter_blob_blocks(path):
+    """Decompressed content of a blob file, read through a memory map."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if path.endswith('.zst'):
+            with zstandard.ZstdDecompressor().stream_reader(mapped) as reader:
+                yield from iter(lambda: reader.read(HASH_BLOCK_SIZE), b'')
+            return
+        decompressor = zlib.decompressobj(wbits=31)
+        view = memoryview(mapped)
+        try:
+            for offset in range(0, len(mapped), HASH_BLOCK_SIZE):
+                yield decompressor.decompress(view[offset:offset + HASH_BLOCK_SIZE])
+            yield decompressor.flush()
+            if not decompressor.eof:
+                raise ValueError('Truncated blob')
+        finally:
+            view.release()
+
+
+def verify_blob(store, digest, rows=None, deep=True):
+    """
+    Check one blob; return a list of errors.
+
+    Args:
+        store: BlobStore holding the blob
+        digest: Expected SHA-256 of the uncompressed content
+        rows: Expected number of serialized rows, for row chunks
+        deep: Decompress and rehash the content instead of only checking it exists
+    """
+    path = store.path(digest)
+    if path is None:
+        return [f'Missing blob {digest}']
+    if not deep:
+        return []
+    try:
+        hasher = hashlib.sha256()
+        lines = 0
+        for block in iter_blob_blocks(path):
+            hasher.update(block)
+            lines += block.count(b'\n')
+    except Exception as e:
+        return [f'Unreadable blob {digest}: {e}']
+    errors = []
+    if hasher.hexdigest() != digest:
+        errors.append(f'Checksum mismatch in blob {digest}')
+    elif rows is not None and lines != rows:
+        errors.append(f'Blob {digest} has {lines} rows, expected {rows}')
+    return errors
+
+
+def _period_key(timestamp, period):
+    if period == 'last':
+        return timestamp
+    day = datetime.datetime.strptime(timestamp[:8], '%Y%m%d').date()
+    if period == 'daily':
+        return day
+    if period == 'weekly':
+        return day.isocalendar()[:2]
+    return day.year, day.month
+
+
+def select_retained(backups, policy):
+    """
+    Grandfather-father-son selection of backups to keep.
+
+    For each period in the policy the newest backup of each of the most
+    recent `count` periods that have one is kept, e.g. {'daily': 7,
+    'weekly': 4, 'monthly': 3} keeps a week of dailies, a month of weeklies
+    and three months of monthlies. 'last' keeps the most recent backups
+    whatever their age. The newest backup is always kept.
+
+    Args:
+        backups: Index entries, newest first
+        policy: Mapping of 'last', 'daily', 'weekly' or 'monthly' to a count
+
+    Returns:
+        set: Filenames to keep
+    """
+    keep = {backups[0]['filename']} if backups else set()
+    for period, count in policy.items():
+        seen = set()
+        for backup in backups:
+            key = _period_key(backup['timestamp'], period)
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            keep.add(backup['filename'])
+    return keep
+
+
+class UserIndex:
+    """
+    Byte ranges of each user's rows within a snapshot's row chunks.
+
+    Stored as blobs sharded by user id (USER_INDEX_SHARD users each), so
+    restoring one user reads a single shard and only the chunks holding
+    that user's rows, whatever the size of the backup.
+    """
+
+    def __init__(self):
+        self.ranges = defaultdict(lambda: defaultdict(list))
+        self.written = set()
+
+    def add_chunk(self, name, data, owners):
+        """Index a serialized JSON Lines chunk, given the owner of each row."""
+        offset = 0
+        for line, owner in zip(data.split(b'\n'), owners):
+            if owner is not None:
+                self.ranges[owner][name].append([offset, len(line)])
+            offset += len(line) + 1
+        self.written.add(name)
+
+    def inherit(self, store, manifest, names):
+        """Copy the ranges of chunks reused from a parent snapshot."""
+        names = set(names) - self.written
+        if not names:
+            return
+        for shard in (manifest.get('users') or {}).values():
+            for user_id, chunks in json.loads(store.read(shard['sha256'])).items():
+                for name, ranges in chunks.items():
+                    if name in names:
+                        self.ranges[int(user_id)][name].extend(ranges)
+
+    def save(self, store):
+        """Store the shards and return their manifest entries."""
+        shards = defaultdict(dict)
+        for user_id, chunks in self.ranges.items():
+            shards[user_id // USER_INDEX_SHARD][str(user_id)] = chunks
+        saved = {}
+        for shard, users in sorted(shards.items()):
+            data = json.dumps(users, sort_keys=True).encode()
+            saved[str(shard)] = {'sha256': store.put_bytes(data), 'size': len(data)}
+        return saved
+
+    @staticmethod
+    def lookup(store, manifest, user_id):
+        """A user's byte ranges per chunk name in a snapshot."""
+        if 'users' not in manifest:
+            raise ValueError('Snapshot was taken before per-user indexes were written')
+        shard = manifest['users'].get(str(user_id // USER_INDEX_SHARD))
+        if shard is None:
+            return {}
+        return json.loads(store.read(shard['sha256'])).get(str(user_id), {})
+
+
+def snapshot_blobs(manifest):
+    """Yield (digest, rows) of every blob a snapshot references."""
+    for entry in manifest['entries'].values():
+        yield entry['sha256'], entry.get('rows')
+    for shard in (manifest.get('users') or {}).values():
+        yield shard['sha256'], None
+
+
+def media_target(media_root, relative):
+    """Absolute restore path of a media file, refusing paths outside MEDIA_ROOT."""
+    target = os.path.abspath(os.path.join(media_root, relative))
+    if not target.startswith(media_root + os.sep):
+        raise ValueError(f"Refusing to restore {relative} outside MEDIA_ROOT")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return target
+
+
+class StagedMedia:
+    """
+    Media being restored, written to a directory next to MEDIA_ROOT and
+    swapped in only once the restore's transaction commits, so that a
+    failed restore leaves the current media untouched.
+    """
+
+    def __init__(self, media_root):
+        self.media_root = os.path.abspath(media_root) if media_root else None
+        self.path = None
+
+    def target(self, relative, replace=True):
+        """
+        Staging path of a restored media file, refusing paths outside it.
+
+        The first file opens the staging directory: empty if `replace`,
+        otherwise a copy of the current media for the restore to overlay.
+        """
+        if self.path is None:
+            parent = os.path.dirname(self.media_root)
+            os.makedirs(parent, exist_ok=True)
+            self.path = tempfile.mkdtemp(prefix='.media-restore-', dir=parent)
+            if not replace and os.path.exists(self.media_root):
+                shutil.copytree(self.media_root, self.path, dirs_exist_ok=True)
+            transaction.on_commit(self.swap)
+        return media_target(self.path, relative)
+
+    def swap(self):
+        """Replace MEDIA_ROOT with the staged media."""
+        if self.path is None:
+            return
+        previous = self.path + '-previous'
+        if os.path.exists(self.media_root):
+            os.replace(self.media_root, previous)
+        try:
+            os.replace(self.path, self.media_root)
+        except OSError:
+            if os.path.exists(previous):
+                os.replace(previous, self.media_root)
+            raise
+        self.path = None
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def discard(self):
+        """Remove the staged media of a restore that did not commit."""
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+
+def snapshot_index_entry(filename, manifest):
+    """Summary of one snapshot kept in the backup directory's index."""
+    info = manifest['info']
+    return {
+        'filename': filename,
+        'format': 'snapshot',
+        'timestamp': info['timestamp'],
+        'backup_type': info['backup_type'],
+        'size': sum(entry['size'] for entry in manifest['entries'].values()),
+        'stored': manifest['stored'],
+        'watermark': info['watermark'],
+        'rows': sum(entry.get('rows', 0) for entry in manifest['entries'].values()),
+    }
+
+
+def member_path(name):
+    """Archive member name without the './' prefix of legacy archives."""
+    return os.path.normpath(name)
+
+
+def iter_json_array(stream, read_size=1 << 20):
+    """
+    Yield the items of a top-level JSON array without loading it whole.
+
+    Used for legacy single-file database.json dumps, which can be far
+    larger than memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    exhausted = False
+    while True:
+        # Skip whitespace, separators and the array brackets
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            if buffer[position] == '[':
+                started = True
+            position += 1
+        if position < len(buffer) and started:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            else:
+                yield item
+                position = end
+                continue
+        if exhausted:
+            return
+        chunk = stream.read(read_size)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8')
+        exhausted = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+class BulkLoader:
+    """
+    Insert serialized rows in large batches, bypassing Model.save().
+
+    Rows are written raw (auto_now/auto_now_add values are kept as backed
+    up) and upserted on the primary key, so an incremental can overwrite
+    rows restored from its base. No save() side effects or signals run.
+    """
+
+    def __init__(self, batch_size=RESTORE_BATCH_ROWS):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.pending_m2m = {}
+        self.counts = {}
+
+    def add_records(self, records):
+        """Queue a list of serialized rows ({'model', 'pk', 'fields'})."""
+        for deserialized in PythonDeserializer(records):
+            obj = deserialized.object
+            model = type(obj)
+            self.pending.setdefault(model, []).append(obj)
+            for field_name, values in (deserialized.m2m_data or {}).items():
+                self.pending_m2m.setdefault((model, field_name), []).append((obj.pk, values))
+            if len(self.pending[model]) >= self.batch_size:
+                self._flush_model(model)
+
+    def flush(self):
+        for model in list(self.pending):
+            self._flush_model(model)
+        for (model, field_name), rows in self.pending_m2m.items():
+            self._flush_m2m(model, field_name, rows)
+        self.pending_m2m = {}
+
+    def _flush_model(self, model):
+        objs = self.pending.pop(model, [])
+        if not objs:
+            return
+        opts = model._meta
+        fields = opts.concrete_fields
+        update_fields = [field for field in fields if not field.primary_key]
+        batch_size = max(min(self.batch_size, connection.ops.bulk_batch_size(fields, objs)), 1)
+        for start in range(0, len(objs), batch_size):
+            model._base_manager._insert(
+                objs[start:start + batch_size],
+                fields=fields,
+                raw=True,
+                on_conflict=OnConflict.UPDATE if update_fields else OnConflict.IGNORE,
+                update_fields=update_fields or None,
+                unique_fields=[opts.pk] if update_fields else None,
+            )
+        self.counts[opts.label_lower] = self.counts.get(opts.label_lower, 0) + len(objs)
+
+    def _flush_m2m(self, model, field_name, rows):
+        field = model._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        # Replace each owner's set, as Model.save() via loaddata would
+        through._base_manager.filter(**{f'{source}__in': [pk for pk, _ in rows]}).delete()
+        through._base_manager.bulk_create(
+            [through(**{f'{source}_id': pk, f'{target}_id': value}) for pk, values in rows for value in values],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def reset_sequences(self):
+        """Move auto-increment sequences past the restored primary keys."""
+        models = [apps.get_model(label) for label in self.counts]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
 class BackupManager:
     """Manager class for handling database backups."""
-    
+
     def __init__(self, backup_dir=None):
         """
         Initialize the backup manager.
-        
+
         Args:
             backup_dir: Directory to store backups (defaults to settings.BACKUP_DIR)
         """
         self.backup_dir = backup_dir or str(settings.BACKUP_DIR)
-        os.makedirs(self.backup_dir, exist_ok=True)
-        
-    def create_backup(self):
+        self.snapshot_dir = os.path.join(self.backup_dir, SNAPSHOT_DIR)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    def blob_store(self, compression='gzip'):
+        return BlobStore(os.path.join(self.backup_dir, BLOB_DIR), compression)
+
+    def create_backup(self, incremental=False):
         """
-        Create a full database backup.
-        
+        Create a database backup.
+
+        Row chunks and media files are written to the blob store, where
+        content already stored by an earlier backup is not written again;
+        the backup itself is a small snapshot manifest listing the blobs it
+        needs. Every snapshot is complete and restores on its own.
+
+        Args:
+            incremental: Reuse the previous snapshot's chunks for primary key
+                ranges with no rows changed since its watermark, and its
+                media digests for files whose size and mtime are unchanged,
+                instead of re-reading them.
+
         Returns:
-            Path to the backup file
+            Path to the snapshot manifest
         """
         try:
-            # Clean up any existing backup directories
-            for item in os.listdir(self.backup_dir):
-                item_path = Path(self.backup_dir) / item
-                if item_path.is_dir() and item.startswith('backup_'):
-                    shutil.rmtree(str(item_path))
-            
-            # Create timestamped backup directory
-            timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-            backup_path = Path(self.backup_dir) / f'backup_{timestamp}'
-            backup_path.mkdir(parents=True, exist_ok=True)
-            
-            # Dump database
-            db_backup_path = backup_path / 'database.json'
-            call_command('dumpdata', 'tracker', indent=2, output=str(db_backup_path))
-            
-            # Copy media files
-            media_backup_path = backup_path / 'media'
-            if os.path.exists(settings.MEDIA_ROOT):
-                # Copy media files, excluding any backup directories
-                shutil.copytree(
-                    settings.MEDIA_ROOT,
-                    str(media_backup_path),
-                    ignore=shutil.ignore_patterns('backups')
-                )
-            
-            # Create backup info file
-            info = {
-                'timestamp': timestamp,
-                'backup_type': 'full',
-                'database_size': os.path.getsize(str(db_backup_path)),
-                'media_count': len(os.listdir(str(media_backup_path))) if media_backup_path.exists() else 0
+            parent = self.latest_snapshot() if incremental else None
+            since = parse_datetime(parent['info']['watermark']) if parent else None
+
+            # Rows changed after this point are re-read by the next incremental
+            watermark = timezone.now()
+            timestamp = watermark.strftime('%Y%m%d_%H%M%S_%f')
+            store = self.blob_store(resolve_compression())
+            parent_entries = parent['entries'] if parent else {}
+
+            entries = {}
+            user_index = UserIndex()
+            self._write_database(store, entries, parent_entries, user_index, since)
+            if parent:
+                user_index.inherit(store, parent, [name for name in entries if name.startswith('database/')])
+            if settings.MEDIA_ROOT and os.path.exists(settings.MEDIA_ROOT):
+                self._write_media(store, entries, settings.MEDIA_ROOT, parent_entries)
+
+            filename = f'{SNAPSHOT_DIR}/{timestamp}.json'
+            manifest = {
+                'info': {
+                    'timestamp': timestamp,
+                    'backup_type': 'incremental' if parent else 'full',
+                    'format_version': FORMAT_VERSION,
+                    'compression': store.compression,
+                    'watermark': watermark.isoformat(),
+                    'since': since.isoformat() if since else None,
+                },
+                'entries': entries,
+                'users': user_index.save(store),
             }
-            
-            with open(backup_path / 'backup_info.json', 'w') as f:
-                json.dump(info, f, indent=2)
-            
-            # Create backup archive
-            archive_path = Path(self.backup_dir) / f'health_backup_{timestamp}.tar.gz'
-            
-            # Create archive directly from backup directory
-            shutil.make_archive(
-                str(archive_path).replace('.tar.gz', ''),
-                'gztar',
-                str(backup_path),
-                '.'
-            )
-            
-            # Clean up backup directory
-            shutil.rmtree(str(backup_path))
-            
-            # Clean up old backup archives if we have too many
-            backups = self.list_backups()
-            if len(backups) > settings.MAX_BACKUPS:
-                # Remove the oldest backup
-                oldest_backup = backups[-1]
-                os.remove(os.path.join(self.backup_dir, oldest_backup['filename']))
-            
-            return str(archive_path)
-            
+            manifest['stored'] = store.stored
+            path = os.path.join(self.backup_dir, filename)
+            write_json_atomic(path, manifest)
+
+            backups = [b for b in self.list_backups() if b['filename'] != filename]
+            self._write_index([snapshot_index_entry(filename, manifest)] + backups)
+            self.prune_backups()
+
+            return path
+
         except Exception as e:
             error_msg = f"Backup failed: {str(e)}"
             from django.core.exceptions import ValidationError
             raise ValidationError(error_msg)
-            
+
+    def _write_database(self, store, entries, parent_entries, user_index, since=None):
+        """Serialize tracker rows into one blob per primary key range, indexing them by owner."""
+        for model in backup_models():
+            label = model._meta.label_lower
+            prefix = f'database/{label}/'
+            ranges, chunks = None, {}
+            if since is not None and change_tracking_field(model) and not model._meta.many_to_many:
+                ranges = self._chunk_counts(model)
+                chunks = self._unchanged_chunks(prefix, parent_entries, ranges, since)
+
+            queryset = model._default_manager.order_by(model._meta.pk.name)
+            owner = owner_lookup(model)
+            if owner:
+                queryset = queryset.annotate(backup_owner=F(owner))
+            if ranges is not None:
+                # Only ranges with changes are read again
+                stale = [bucket for bucket in ranges if bucket not in chunks]
+                querysets = [
+                    queryset.filter(pk__gte=bucket * CHUNK_ROWS, pk__lt=(bucket + 1) * CHUNK_ROWS)
+                    for bucket in stale
+                ]
+            else:
+                querysets = [queryset]
+
+            for rows in querysets:
+                bucket, batch = None, []
+                for obj in rows.iterator(chunk_size=CHUNK_ROWS):
+                    obj_bucket = obj.pk // CHUNK_ROWS
+                    if batch and obj_bucket != bucket:
+                        chunks[bucket] = self._write_chunk(store, f'{prefix}{bucket:08d}.jsonl', batch, user_index)
+                        batch = []
+                    bucket = obj_bucket
+                    batch.append(obj)
+                if batch:
+                    chunks[bucket] = self._write_chunk(store, f'{prefix}{bucket:08d}.jsonl', batch, user_index)
+
+            for bucket in sorted(chunks):
+                entries[f'{prefix}{bucket:08d}.jsonl'] = chunks[bucket]
+
+    def _chunk_counts(self, model):
+        """Rows and latest change per primary key range, in one grouped query."""
+        field = change_tracking_field(model)
+        return {
+            int(row['backup_chunk']): row
+            for row in model._default_manager.annotate(backup_chunk=Floor(F('pk') / CHUNK_ROWS))
+            .values('backup_chunk')
+            .annotate(rows=Count('pk'), changed=Max(field))
+            .order_by()
+        }
+
+    def _unchanged_chunks(self, prefix, parent_entries, ranges, since):
+        """
+        Parent chunks that can be reused as they are, keyed by range.
+
+        A range is unchanged when it holds as many rows as before and none
+        was modified after the parent's watermark: inserts and updates bump
+        the change-tracking field, deletes lower the count. Models with
+        many-to-many fields are always read in full, as changing those does
+        not touch the row.
+        """
+        previous = {
+            int(name[len(prefix):-len('.jsonl')]): entry
+            for name, entry in parent_entries.items() if name.startswith(prefix)
+        }
+        reused = {}
+        for bucket, row in ranges.items():
+            entry = previous.get(bucket)
+            if (entry and entry['rows'] == row['rows'] and row['changed'] is not None
+                    and row['changed'] <= since):
+                reused[bucket] = entry
+        return reused
+
+    def _write_chunk(self, store, name, objects, user_index):
+        data = serializers.serialize('jsonl', objects).encode()
+        user_index.add_chunk(name, data, [getattr(obj, 'backup_owner', None) for obj in objects])
+        return {'sha256': store.put_bytes(data), 'size': len(data), 'rows': len(objects)}
+
+    def _write_media(self, store, entries, media_root, parent_entries):
+        """Store media files by content, skipping files unchanged since the parent snapshot."""
+        backup_dir = os.path.abspath(self.backup_dir)
+        for root, dirs, files in os.walk(media_root):
+            dirs[:] = sorted(
+                d for d in dirs
+                if d != 'backups' and os.path.abspath(os.path.join(root, d)) != backup_dir
+            )
+            for name in sorted(files):
+                source = Path(root) / name
+                stat = source.stat()
+                key = f'media/{source.relative_to(media_root).as_posix()}'
+                previous = parent_entries.get(key)
+                if (previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns
+                        and store._reuse(previous['sha256'])):
+                    entries[key] = previous
+                else:
+                    entries[key] = {'sha256': store.put_file(source), 'size': stat.st_size,
+                                    'mtime_ns': stat.st_mtime_ns}
+
     def list_backups(self):
-        """List all available backups."""
+        """
+        List all available backups, newest first.
+
+        Reads the cached index instead of touching every backup; the index
+        is rebuilt from the snapshot and sidecar manifests when it is missing.
+        """
+        try:
+            with open(os.path.join(self.backup_dir, INDEX_NAME)) as f:
+                return json.load(f)['backups']
+        except (FileNotFoundError, ValueError, KeyError):
+            return self.rebuild_index()
+
+    def rebuild_index(self):
+        """Re-read every snapshot and archive manifest and rewrite the index."""
         backups = []
+        for name in os.listdir(self.snapshot_dir):
+            if name.endswith('.json'):
+                with open(os.path.join(self.snapshot_dir, name)) as f:
+                    backups.append(snapshot_index_entry(f'{SNAPSHOT_DIR}/{name}', json.load(f)))
         for filename in os.listdir(self.backup_dir):
-            if filename.endswith('.tar.gz'):
+            match = BACKUP_NAME_RE.match(filename)
+            if not match:
+                continue
+            path = os.path.join(self.backup_dir, filename)
+            manifest = read_manifest(path)
+            if manifest is not None:
+                backups.append(archive_index_entry(filename, manifest))
+            else:
+                # Archives from before manifests were written
                 backups.append({
                     'filename': filename,
-                    'timestamp': filename.split('_')[2].replace('.tar.gz', ''),
-                    'size': os.path.getsize(os.path.join(self.backup_dir, filename))
+                    'format': 'archive',
+                    'timestamp': match.group('timestamp'),
+                    'backup_type': 'incremental' if match.group('incremental') else 'full',
+                    'size': os.path.getsize(path),
+                    'sha256': None,
                 })
-        return sorted(backups, key=lambda x: x['timestamp'], reverse=True)
-        
+        return self._write_index(backups)
+
+    def _write_index(self, backups):
+        backups = sorted(backups, key=lambda x: x['timestamp'], reverse=True)
+        write_json_atomic(os.path.join(self.backup_dir, INDEX_NAME), {'backups': backups})
+        return backups
+
+    def read_snapshot(self, filename):
+        with open(os.path.join(self.backup_dir, filename)) as f:
+            return json.load(f)
+
+    def latest_snapshot(self):
+        """Manifest of the most recent snapshot, or None if there is none."""
+        for backup in self.list_backups():
+            if backup.get('format') == 'snapshot':
+                return self.read_snapshot(backup['filename'])
+        return None
+
+    def verify_backups(self, filenames=None, deep=True, workers=None):
+        """
+        Verify backups against their manifests in parallel.
+
+        Every blob is checked once however many snapshots share it; legacy
+        archives are checked against their sidecar manifests.
+
+        Args:
+            filenames: Backups to check, relative to the backup directory
+                (defaults to every backup, after re-indexing)
+            deep: Decompress and rehash content instead of only checking
+                that it exists
+            workers: Size of the thread pool (defaults to the CPU count)
+
+        Returns:
+            list: One result per backup (filename, ok, errors, warnings)
+        """
+        if filenames is None:
+            filenames = [backup['filename'] for backup in self.rebuild_index()]
+        store = self.blob_store()
+        snapshots = {
+            filename: self.read_snapshot(filename)
+            for filename in filenames if not BACKUP_NAME_RE.match(os.path.basename(filename))
+        }
+        blobs = {}
+        for manifest in snapshots.values():
+            blobs.update(snapshot_blobs(manifest))
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            blob_errors = dict(zip(blobs, executor.map(
+                lambda digest: verify_blob(store, digest, blobs[digest], deep=deep), blobs
+            )))
+            archive_results = dict(zip(
+                [f for f in filenames if f not in snapshots],
+                executor.map(lambda f: verify_archive(os.path.join(self.backup_dir, f), deep=deep),
+                             [f for f in filenames if f not in snapshots]),
+            ))
+
+        results = []
+        for filename in filenames:
+            if filename in archive_results:
+                results.append(archive_results[filename])
+                continue
+            errors = [
+                error
+                for digest, _rows in snapshot_blobs(snapshots[filename])
+                for error in blob_errors[digest]
+            ]
+            results.append({'filename': filename, 'ok': not errors, 'errors': errors, 'warnings': []})
+        return results
+
+    def read_backup_info(self, backup_file):
+        """Read a legacy archive's backup_info from its sidecar manifest, or from the archive itself."""
+        manifest = read_manifest(backup_file)
+        if manifest is not None:
+            return manifest['info']
+        with open_archive_stream(backup_file) as archive:
+            for member in archive:
+                if member_path(member.name) == 'backup_info.json':
+                    return json.load(archive.extractfile(member))
+        return {'backup_type': 'full', 'chain': [os.path.basename(backup_file)]}
+
+    def prune_backups(self):
+        """
+        Apply the settings.BACKUP_RETENTION grandfather-father-son policy.
+
+        Snapshots and legacy archives outside the policy are removed (a kept
+        legacy incremental keeps its whole chain), then blobs no remaining
+        snapshot references are garbage collected.
+
+        Returns:
+            dict: Backups removed, and blobs and bytes freed
+        """
+        backups = self.list_backups()
+        keep = select_retained(backups, getattr(settings, 'BACKUP_RETENTION', DEFAULT_RETENTION))
+        for backup in backups:
+            if backup['filename'] in keep and backup.get('format') == 'archive' and backup['backup_type'] != 'full':
+                info = self.read_backup_info(os.path.join(self.backup_dir, backup['filename']))
+                keep.update(info.get('chain') or [])
+
+        removed = [backup for backup in backups if backup['filename'] not in keep]
+        for backup in removed:
+            path = os.path.join(self.backup_dir, backup['filename'])
+            os.remove(path)
+            if os.path.exists(manifest_path(path)):
+                os.remove(manifest_path(path))
+        if removed:
+            self._write_index([backup for backup in backups if backup['filename'] in keep])
+        result = self.collect_garbage()
+        result['backups'] = len(removed)
+        return result
+
+    def collect_garbage(self, grace_seconds=BLOB_GRACE_SECONDS):
+        """
+        Delete blobs that no snapshot references.
+
+        Args:
+            grace_seconds: Leave blobs written or reused more recently alone
+
+        Returns:
+            dict: Blobs and bytes freed
+        """
+        referenced = set()
+        for backup in self.list_backups():
+            if backup.get('format') == 'snapshot':
+                referenced.update(digest for digest, _rows in snapshot_blobs(self.read_snapshot(backup['filename'])))
+
+        cutoff = time.time() - grace_seconds
+        freed = {'blobs': 0, 'bytes': 0}
+        for digest, path in self.blob_store():
+            if digest in referenced:
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime <= cutoff:
+                os.remove(path)
+                freed['blobs'] += 1
+                freed['bytes'] += stat.st_size
+        return freed
+
     def restore_backup(self, backup_file):
         """
-        Restore from a backup file.
-        
+        Restore from a backup.
+
+        A snapshot restores on its own. Legacy incremental archives are
+        restored by replaying their full base archive followed by every
+        incremental in the chain up to and including this one. Everything
+        is loaded in one transaction with constraint checks deferred until
+        the end.
+
+        Args:
+            backup_file: Path to the snapshot manifest or legacy archive
+
+        Returns:
+            dict: Rows restored per model
+        """
+        media = StagedMedia(settings.MEDIA_ROOT)
+        try:
+            if BACKUP_NAME_RE.match(os.path.basename(backup_file)):
+                info = self.read_backup_info(backup_file)
+                directory = os.path.dirname(os.path.abspath(backup_file))
+                chain = [os.path.join(directory, name) for name in info.get('chain') or []]
+                if not chain or os.path.basename(chain[-1]) != os.path.basename(backup_file):
+                    chain = [backup_file]
+                missing = [path for path in chain if not os.path.exists(path)]
+                if missing:
+                    raise FileNotFoundError(f"Missing backups in chain: {', '.join(missing)}")
+
+                def restore(loader):
+                    for position, archive in enumerate(chain):
+                        self._restore_archive(archive, loader, media, replace_media=position == 0)
+            else:
+                with open(backup_file) as f:
+                    manifest = json.load(f)
+                store = self.blob_store()
+                missing = {digest for digest, _rows in snapshot_blobs(manifest) if store.path(digest) is None}
+                if missing:
+                    raise FileNotFoundError(f"Missing blobs: {', '.join(sorted(missing))}")
+
+                def restore(loader):
+                    self._restore_snapshot(manifest, store, loader, media)
+
+            return self._load(restore)
+
+        except Exception as e:
+            media.discard()
+            error_msg = f"Restore failed: {str(e)}"
+            from django.core.exceptions import ValidationError
+            raise ValidationError(error_msg)
+
+    def restore_user(self, user_id, as_of=None):
+        """
+        Restore one user's rows as they were at a point in time.
+
+        Uses the newest snapshot taken at or before `as_of` and reads only
+        the index shard and row chunks holding that user's rows. Rows are
+        upserted, so deleted rows come back and changed rows are reverted;
+        rows created after the snapshot are left alone. The user's
+        DERIVED_MODELS rows are replaced by the snapshot's.
+
         Args:
-            backup_file: Path to the backup file
+            user_id: Primary key of the user
+            as_of: Aware datetime (defaults to the latest snapshot)
+
+        Returns:
+            dict: snapshot used and rows restored per model
         """
         try:
-            # Extract backup
-            extract_dir = Path(self.backup_dir) / 'restore_temp'
-            extract_dir.mkdir(parents=True, exist_ok=True)
-            
-            shutil.unpack_archive(backup_file, str(extract_dir))
-            
-            # Load database
-            db_backup_path = extract_dir / 'database.json'
-            if db_backup_path.exists():
-                call_command('loaddata', str(db_backup_path))
-            
-            # Restore media files
-            media_backup_path = extract_dir / 'media'
-            if media_backup_path.exists():
-                if os.path.exists(settings.MEDIA_ROOT):
-                    shutil.rmtree(settings.MEDIA_ROOT)
-                shutil.copytree(str(media_backup_path), settings.MEDIA_ROOT)
-            
-            # Clean up
-            shutil.rmtree(str(extract_dir))
-            
+            filename = self.snapshot_as_of(as_of)
+            if filename is None:
+                raise FileNotFoundError(f"No snapshot taken at or before {as_of}")
+            manifest = self.read_snapshot(filename)
+            store = self.blob_store()
+            chunks = UserIndex.lookup(store, manifest, user_id)
+            if not chunks:
+                raise ValueError(f"Snapshot {filename} holds no rows for user {user_id}")
+
+            def restore(loader):
+                for label in DERIVED_MODELS:
+                    apps.get_model(label)._base_manager.filter(user_id=user_id).delete()
+                for name, ranges in chunks.items():
+                    data = store.read(manifest['entries'][name]['sha256'])
+                    loader.add_records([json.loads(data[start:start + length]) for start, length in ranges])
+                loader.flush()
+                # Records created after the snapshot were kept: refit on next use
+                apps.get_model('tracker.weighttrend')._base_manager.filter(user_id=user_id).update(
+                    needs_refit=True, updated_at=timezone.now()
+                )
+
+            return {'snapshot': filename, 'counts': self._load(restore, user_ids=[user_id])}
+
         except Exception as e:
             error_msg = f"Restore failed: {str(e)}"
             from django.core.exceptions import ValidationError
             raise ValidationError(error_msg)
+
+    def snapshot_as_of(self, as_of=None):
+        """Filename of the newest snapshot whose watermark is not after as_of."""
+        for backup in self.list_backups():
+            if backup.get('format') != 'snapshot':
+                continue
+            if as_of is None or parse_datetime(backup['watermark']) <= as_of:
+                return backup['filename']
+        return None
+
+    def _load(self, restore, user_ids=None):
+        """
+        Run `restore(loader)` in one transaction with constraint checks
+        deferred until every row is in, then move sequences past the
+        restored keys and recount the unread notifications of `user_ids`
+        (default everyone), which the bulk inserts bypassed.
+        """
+        loader = BulkLoader()
+        with transaction.atomic():
+            with connection.constraint_checks_disabled():
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+                restore(loader)
+                loader.flush()
+            connection.check_constraints(
+                table_names=[apps.get_model(label)._meta.db_table for label in loader.counts]
+            )
+            loader.reset_sequences()
+            if {'tracker.customuser', 'tracker.notification'} & set(loader.counts):
+                from .models import reconcile_unread_counts
+                reconcile_unread_counts(user_ids)
+        return loader.counts
+
+    def _restore_snapshot(self, manifest, store, loader, media):
+        """Load a snapshot's row chunks into the loader and stage its media in `media` (a StagedMedia)."""
+        for name, entry in manifest['entries'].items():
+            if name.startswith('database/'):
+                loader.add_records([json.loads(line) for line in store.read(entry['sha256']).splitlines() if line])
+            elif name.startswith('media/') and media.media_root:
+                with store.open(entry['sha256']) as src, open(media.target(name[len('media/'):]), 'wb') as f:
+                    shutil.copyfileobj(src, f)
+
+    def _restore_archive(self, backup_file, loader, media, replace_media=True):
+        """Stream one archive's rows into the loader and its media into `media` (a StagedMedia)."""
+        with open_archive_stream(backup_file) as archive:
+            for member in archive:
+                name = member_path(member.name)
+                if not member.isfile():
+                    continue
+                if name == 'database.json':
+                    # Legacy single-file dump: parse incrementally
+                    batch = []
+                    for record in iter_json_array(archive.extractfile(member)):
+                        batch.append(record)
+                        if len(batch) >= loader.batch_size:
+                            loader.add_records(batch)
+                            batch = []
+                    loader.add_records(batch)
+                elif name.startswith('database/') and name.endswith('.json'):
+                    loader.add_records(json.load(archive.extractfile(member)))
+                elif name.startswith('media/') and media.media_root:
+                    # Incrementals overlay changed files only
+                    with open(media.target(name[len('media/'):], replace=replace_media), 'wb') as f:
+                        shutil.copyfileobj(archive.extractfile(member), f)
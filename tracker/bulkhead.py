@@ -0,0 +1,194 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.shortcuts import render
+import math
+import random
+import threading
+import time
+
+from .metrics import Counters
+
+# Admitted, queued and shed requests per bulkhead, across workers
+BULKHEAD_STATS = Counters('bh_stats')
+
+# Cluster slots expire after this long in case their worker dies holding
+# them; gunicorn kills requests running longer anyway
+SLOT_TTL = 120
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Bulkhead:
+    """
+    Cost-weighted concurrency limit for expensive views.
+
+    `per_worker` caps the requests in flight in this process, so that with
+    fewer than gunicorn's threads there is always one left for light views.
+    Across workers, every request takes `cost` of the `cluster` units while
+    it runs, each unit being a slot key claimed with the cache's atomic
+    `add`. A request over capacity waits up to `queue_timeout` seconds for
+    it to free up, with at most `max_queue` requests waiting per process,
+    and is shed otherwise.
+    """
+
+    def __init__(self, name, per_worker, cluster, max_queue=1, queue_timeout=1.0, retry_after=5,
+                 cache_alias='default', clock=time.monotonic, poll_interval=0.05):
+        """
+        Initialize the bulkhead.
+
+        Args:
+            name: Bulkhead name, used in cache keys and stats
+            per_worker: Requests allowed in flight in this process
+            cluster: Units allowed in flight across all processes
+            max_queue: Requests allowed to wait in this process
+            queue_timeout: Seconds a request may wait for capacity
+            retry_after: Seconds shed clients are told to wait
+            cache_alias: Cache shared by every worker
+            clock: Returns the current time in seconds
+            poll_interval: Seconds between attempts on the cluster slots
+        """
+        self.name = name
+        self.per_worker = per_worker
+        self.cluster = cluster
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.cache_alias = cache_alias
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def slot_keys(self):
+        return [f'bh_{self.name}:slot:{i}' for i in range(self.cluster)]
+
+    def acquire(self, cost=1):
+        """
+        Take `cost` units, waiting for them if needed.
+
+        Costs above the cluster capacity are capped to it, so every view can
+        run on an idle cluster.
+
+        Returns:
+            list: Claimed slot keys to pass to release(), or None if shed
+        """
+        cost = max(1, min(cost, self.cluster))
+        deadline = self.clock() + self.queue_timeout
+        queued = False
+        try:
+            while True:
+                slots = self._try_acquire(cost)
+                if slots is not None:
+                    BULKHEAD_STATS.incr(f'{self.name}:admitted')
+                    return slots
+                remaining = deadline - self.clock()
+                if not queued:
+                    with self.condition:
+                        if remaining <= 0 or self.waiting >= self.max_queue:
+                            break
+                        self.waiting += 1
+                    queued = True
+                    self._add_queued(1)
+                    BULKHEAD_STATS.incr(f'{self.name}:queued')
+                elif remaining <= 0:
+                    break
+                # Local releases wake us up; other workers' releases are polled for
+                with self.condition:
+                    self.condition.wait(min(remaining, self.poll_interval))
+        finally:
+            if queued:
+                with self.condition:
+                    self.waiting -= 1
+                self._add_queued(-1)
+        BULKHEAD_STATS.incr(f'{self.name}:shed')
+        return None
+
+    def release(self, slots):
+        """Return the units taken by acquire()."""
+        self.cache.delete_many(slots)
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def _try_acquire(self, cost):
+        with self.condition:
+            if self.in_flight >= self.per_worker:
+                return None
+            self.in_flight += 1
+        slots = self._claim_slots(cost)
+        if slots is None:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+        return slots
+
+    def _claim_slots(self, cost):
+        # Start at a random slot so that workers do not all contend for the first ones
+        keys = self.slot_keys()
+        offset = random.randrange(len(keys))
+        cache = self.cache
+        claimed = []
+        for key in keys[offset:] + keys[:offset]:
+            if cache.add(key, 1, SLOT_TTL):
+                claimed.append(key)
+                if len(claimed) == cost:
+                    return claimed
+        cache.delete_many(claimed)
+        return None
+
+    def _add_queued(self, delta):
+        # Shared gauge of requests currently waiting in any worker
+        key = f'bh_{self.name}:queued'
+        cache = self.cache
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            if not cache.add(key, max(delta, 0), None):
+                cache.incr(key, delta)
+
+    def stats(self):
+        """Units in flight and requests waiting across workers, plus totals."""
+        cache = self.cache
+        names = [f'{self.name}:{outcome}' for outcome in ('admitted', 'queued', 'shed')]
+        totals = BULKHEAD_STATS.totals(names)
+        return {
+            'capacity': self.cluster,
+            'in_flight': len(cache.get_many(self.slot_keys())),
+            'queue_depth': max(0, cache.get(f'bh_{self.name}:queued', 0)),
+            **{outcome: totals[f'{self.name}:{outcome}'] for outcome in ('admitted', 'queued', 'shed')},
+        }
+
+
+def get_bulkhead(name):
+    """The process's Bulkhead for settings.BULKHEADS[name], or None if not configured."""
+    config = getattr(settings, 'BULKHEADS', {}).get(name)
+    if config is None:
+        return None
+    with _registry_lock:
+        entry = _registry.get(name)
+        if entry is None or entry[0] != config:
+            entry = _registry[name] = (dict(config), Bulkhead(name, **config))
+    return entry[1]
+
+
+def bulkhead_stats():
+    """Stats for every configured bulkhead."""
+    return {name: get_bulkhead(name).stats() for name in getattr(settings, 'BULKHEADS', {})}
+
+
+def service_unavailable(request, retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    match = request.resolver_match
+    if match is not None and match.route.startswith('api/'):
+        response = JsonResponse({'error': 'Server busy', 'retry_after': retry_after}, status=503)
+    else:
+        response = render(request, 'tracker/503.html', {'retry_after': retry_after}, status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
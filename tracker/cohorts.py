@@ -0,0 +1,162 @@
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Optional
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg
+from django.utils import timezone
+
+from .models import CohortStatistic, CustomUser, HealthRecord
+
+METRICS = ('sleep_hours', 'water_intake', 'weight')
+
+# Per-user values are averages over this many days
+WINDOW_DAYS = 30
+
+ALL = CohortStatistic.ALL
+UNKNOWN = 'UNKNOWN'
+
+AGE_BANDS = (
+    (0, 17, '<18'),
+    (18, 29, '18-29'),
+    (30, 44, '30-44'),
+    (45, 64, '45-64'),
+    (65, 200, '65+'),
+)
+
+# Fixed histogram bins, matching the model validators' ranges
+METRIC_BINS = {
+    'sleep_hours': np.linspace(0, 24, 49),
+    'water_intake': np.linspace(0, 10, 41),
+    'weight': np.linspace(20, 300, 141),
+}
+
+QUANTILE_LEVELS = np.linspace(0, 100, 101)
+
+# Cohorts smaller than this fall back to a broader segment
+MIN_COHORT_SIZE = 10
+
+
+def age_band(age: Optional[int]) -> str:
+    if age is None:
+        return UNKNOWN
+    for low, high, label in AGE_BANDS:
+        if low <= age <= high:
+            return label
+    return UNKNOWN
+
+
+def cohort_keys(age: Optional[int], gender: Optional[str]):
+    """Segments a user belongs to, most specific first."""
+    band = age_band(age)
+    gender = gender or UNKNOWN
+    return [(band, gender), (band, ALL), (ALL, gender), (ALL, ALL)]
+
+
+def user_metric_averages(since=None):
+    """
+    Per-patient metric averages since a date, in a single grouped query.
+
+    Doctors' and admins' own records are left out of the population.
+
+    Args:
+        since: Earliest record date to include (defaults to WINDOW_DAYS ago)
+
+    Returns:
+        QuerySet of dicts with user_id, user__age, user__gender and one key per metric
+    """
+    if since is None:
+        since = timezone.localdate() - timedelta(days=WINDOW_DAYS)
+    return (
+        HealthRecord.objects.filter(date__gte=since, user__role=CustomUser.Role.PATIENT)
+        .values('user_id', 'user__age', 'user__gender')
+        .annotate(**{metric: Avg(metric) for metric in METRICS})
+        .order_by()
+    )
+
+
+def summarize(values: np.ndarray, metric: str) -> Dict:
+    counts, edges = np.histogram(values, bins=METRIC_BINS[metric])
+    return {
+        'sample_count': int(values.size),
+        'mean': float(values.mean()),
+        'bin_edges': [float(edge) for edge in edges],
+        'bin_counts': [int(count) for count in counts],
+        'quantiles': [round(float(q), 3) for q in np.percentile(values, QUANTILE_LEVELS)],
+    }
+
+
+def build_cohort_statistics(since=None) -> int:
+    """
+    Recompute every cohort's histogram and quantile table.
+
+    Returns:
+        int: Number of cohort rows written
+    """
+    samples = defaultdict(list)
+    for row in user_metric_averages(since).iterator(chunk_size=5000):
+        keys = cohort_keys(row['user__age'], row['user__gender'])
+        for metric in METRICS:
+            if row[metric] is None:
+                continue
+            for band, gender in keys:
+                samples[(metric, band, gender)].append(row[metric])
+
+    rows = [
+        CohortStatistic(metric=metric, age_band=band, gender=gender,
+                        **summarize(np.asarray(values, dtype=float), metric))
+        for (metric, band, gender), values in samples.items()
+    ]
+    with transaction.atomic():
+        CohortStatistic.objects.all().delete()
+        CohortStatistic.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def percentile_of(value: float, quantiles) -> float:
+    """Interpolate where value sits in a precomputed quantile table."""
+    return round(float(np.interp(value, quantiles, QUANTILE_LEVELS)), 1)
+
+
+def cohort_position(user) -> Dict[str, Dict]:
+    """
+    Place a user's recent averages within their cohort.
+
+    Uses one aggregate over the user's own records and one lookup of the
+    precomputed cohort rows; other users' records are never scanned.
+
+    Returns:
+        dict: Per metric, the user's value, percentile and cohort used
+    """
+    since = timezone.localdate() - timedelta(days=WINDOW_DAYS)
+    averages = HealthRecord.objects.filter(user=user, date__gte=since).aggregate(
+        **{metric: Avg(metric) for metric in METRICS}
+    )
+    keys = cohort_keys(user.age, user.gender)
+    stats = {
+        (stat.metric, stat.age_band, stat.gender): stat
+        for stat in CohortStatistic.objects.filter(
+            metric__in=METRICS,
+            age_band__in={band for band, _ in keys},
+            gender__in={gender for _, gender in keys},
+        )
+    }
+
+    position = {}
+    for metric in METRICS:
+        value = averages[metric]
+        candidates = [stats[(metric,) + key] for key in keys if (metric,) + key in stats]
+        if value is None or not candidates:
+            continue
+        stat = next((c for c in candidates if c.sample_count >= MIN_COHORT_SIZE), candidates[-1])
+        position[metric] = {
+            'value': round(value, 2),
+            'percentile': percentile_of(value, stat.quantiles),
+            'cohort': {
+                'age_band': stat.age_band,
+                'gender': stat.gender,
+                'sample_count': stat.sample_count,
+                'median': stat.quantiles[50],
+            },
+        }
+    return position
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def notification_settings(request):
+    """Expose whether the navbar may use the notification event stream."""
+    return {'notification_sse_enabled': getattr(settings, 'NOTIFICATION_SSE_ENABLED', False)}
@@ -1,9 +1,30 @@
+from django.contrib.auth import SESSION_KEY
 from django.contrib.auth.decorators import user_passes_test
 from django.core.exceptions import PermissionDenied
 from functools import wraps
 from django.shortcuts import redirect
+from .bulkhead import get_bulkhead, service_unavailable
 from .models import CustomUser
 
+# Session key of the signed-in user's role, cached by session_role()
+ROLE_SESSION_KEY = '_tracker_role'
+
+
+def session_role(request):
+    """
+    The signed-in user's role, cached in their session.
+
+    The cached role is checked against request.user, which the
+    authentication middleware has loaded already, so a role change applies
+    from the user's next request without ending their sessions.
+    """
+    user_id = request.session.get(SESSION_KEY)
+    role = request.user.role
+    if request.session.get(ROLE_SESSION_KEY) != [user_id, role]:
+        request.session[ROLE_SESSION_KEY] = [user_id, role]
+    return role
+
+
 def role_required(allowed_roles):
     def decorator(view_func):
         @wraps(view_func)
@@ -11,14 +32,38 @@ def role_required(allowed_roles):
             if not request.user.is_authenticated:
                 return redirect('login')
             
-            if request.user.role not in allowed_roles:
+            if session_role(request) not in allowed_roles:
                 raise PermissionDenied("You don't have permission to access this page.")
                 
             return view_func(request, *args, **kwargs)
         return _wrapped_view
     return decorator
 
+def resolve_record(request, record_id):
+    """
+    The HealthRecord `record_id` if the user may access it, loaded once per
+    request and kept as request.record.
+
+    Admins and doctors may access any record, patients only their own; the
+    ownership check is part of the query, so a single one is needed.
+    """
+    record = getattr(request, 'record', None)
+    if record is not None and record.pk == record_id:
+        return record
+
+    from .models import HealthRecord
+    records = HealthRecord.objects.all()
+    if session_role(request) not in (CustomUser.Role.ADMIN, CustomUser.Role.DOCTOR):
+        records = records.filter(user_id=request.user.pk)
+    try:
+        request.record = records.get(id=record_id)
+    except HealthRecord.DoesNotExist:
+        # Other patients' records are reported as missing as well
+        raise PermissionDenied("Record not found.")
+    return request.record
+
 def can_access_record(view_func):
+    """Resolve kwargs['record_id'] with resolve_record(); the view reads request.record."""
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -28,19 +73,29 @@ def can_access_record(view_func):
         if not record_id:
             raise PermissionDenied("Record ID is required.")
         
-        from .models import HealthRecord
-        try:
-            record = HealthRecord.objects.get(id=record_id)
+        resolve_record(request, record_id)
+        return view_func(request, *args, **kwargs)
             
-            # Check if user has permission to access this record
-            if (request.user.role == CustomUser.Role.ADMIN or 
-                request.user.role == CustomUser.Role.DOCTOR or 
-                record.user == request.user):
+    return _wrapped_view
+
+def bulkhead(name, cost=1):
+    """
+    Run the view within a bulkhead from settings.BULKHEADS, taking `cost`
+    of its cluster-wide units; requests it sheds get a 503.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            compartment = get_bulkhead(name)
+            if compartment is None:
                 return view_func(request, *args, **kwargs)
-            else:
-                raise PermissionDenied("You don't have permission to access this record.")
-                
-        except HealthRecord.DoesNotExist:
-            raise PermissionDenied("Record not found.")
-            
-    return _wrapped_view 
\ No newline at end of file
+
+            slots = compartment.acquire(cost)
+            if slots is None:
+                return service_unavailable(request, compartment.retry_after)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                compartment.release(slots)
+        return _wrapped_view
+    return decorator
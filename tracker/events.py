@@ -0,0 +1,269 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+import asyncio
+import json
+import threading
+
+# Event telling a stream that it missed events and must recount
+RESYNC = {'event': 'resync', 'data': {}}
+
+# Seconds between keepalive comments, and before a stream is closed so that
+# the browser reconnects (re-checking the session) after STREAM_RETRY ms
+STREAM_KEEPALIVE = 15
+STREAM_MAX_AGE = 600
+STREAM_RETRY = 5000
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    """A stream's queue of events, bound to the event loop that reads it."""
+
+    def __init__(self, user_id, max_queue=100):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def put(self, event):
+        """Queue an event; safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client: drop what it has not read and have it recount
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout):
+        """The next event, or None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """
+    In-process pub/sub of per-user notification events.
+
+    Events only reach streams served by the publishing process, which is
+    enough for a single ASGI worker; use CacheBroker with several.
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Subscribe to a user's events; must be called from the reading event loop."""
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class CacheBroker(LocalBroker):
+    """
+    Broker for several workers, relaying events through the shared cache.
+
+    Stands in for a dedicated pub/sub server: publish() appends the event
+    to a numbered log in the cache, and each process with open streams runs
+    one task polling the log and delivering new events locally. Streams
+    thus cost one cache read per process and `poll_interval`, however many
+    are open.
+
+    publish() numbers an event before writing it, so a relay can see a
+    number whose event is not there yet. It waits for that event for up to
+    `gap_timeout` seconds; after that the event is taken as lost (its
+    publisher died, or it expired) and every local stream is told to
+    resync.
+    """
+
+    def __init__(self, cache_alias='default', poll_interval=0.5, event_ttl=60, gap_timeout=5):
+        super().__init__()
+        self.cache_alias = cache_alias
+        self.poll_interval = poll_interval
+        self.event_ttl = event_ttl
+        self.gap_timeout = gap_timeout
+        self.relays = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        loop = subscription.loop
+        with self.lock:
+            if loop not in self.relays:
+                self.relays[loop] = loop.create_task(self.relay(loop))
+        return subscription
+
+    def publish(self, user_id, event):
+        cache = self.cache
+        try:
+            sequence = cache.incr('events:seq')
+        except ValueError:
+            cache.add('events:seq', 0, None)
+            sequence = cache.incr('events:seq')
+        cache.set(f'events:{sequence}', (user_id, event), self.event_ttl)
+
+    async def relay(self, loop):
+        cache = self.cache
+        position = await cache.aget('events:seq', 0)
+        gap_since = None
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            with self.lock:
+                if not self.subscribers:
+                    del self.relays[loop]
+                    return
+            latest = await cache.aget('events:seq', 0)
+            if latest <= position:
+                continue
+            events = await cache.aget_many([f'events:{sequence}' for sequence in range(position + 1, latest + 1)])
+            for sequence in range(position + 1, latest + 1):
+                event = events.get(f'events:{sequence}')
+                if event is not None:
+                    self.deliver(*event)
+                elif gap_since is None or loop.time() - gap_since < self.gap_timeout:
+                    # Numbered but not written yet: retry from here next poll
+                    if gap_since is None:
+                        gap_since = loop.time()
+                    break
+                else:
+                    self.resync()
+                position = sequence
+                gap_since = None
+
+    def resync(self):
+        """Have every local stream recount, for an event that was lost."""
+        with self.lock:
+            subscribers = [subscription for subscriptions in self.subscribers.values() for subscription in subscriptions]
+        for subscription in subscribers:
+            subscription.put(RESYNC)
+
+
+def get_broker():
+    """The process's broker, of the class named by settings.NOTIFICATION_BROKER."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'NOTIFICATION_BROKER', 'tracker.events.LocalBroker'))()
+    return _broker
+
+
+def notification_event(notification):
+    return {
+        'event': 'notification',
+        'data': {
+            'id': notification.pk,
+            'type': notification.type,
+            'title': notification.title,
+            'message': notification.message,
+            'is_read': notification.is_read,
+            'occurrences': notification.occurrences,
+            'created_at': notification.created_at.isoformat() if notification.created_at else None,
+        },
+    }
+
+
+def unread_counts(user_ids):
+    """{user_id: unread count} of the given users, in one query."""
+    from .models import CustomUser
+    return dict(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', 'unread_notifications'))
+
+
+def publish_notifications(notifications):
+    """
+    Publish newly created notifications once the transaction commits, each
+    with its user's unread count as of then.
+    """
+    notifications = list(notifications)
+
+    def publish():
+        broker = get_broker()
+        counts = unread_counts({notification.user_id for notification in notifications})
+        for notification in notifications:
+            event = notification_event(notification)
+            broker.publish(notification.user_id, {**event, 'unread': counts.get(notification.user_id, 0)})
+    transaction.on_commit(publish)
+
+
+def publish_read(user_id, count):
+    """Publish that `count` of a user's notifications were marked read, with the unread count left."""
+    def publish():
+        unread = unread_counts([user_id]).get(user_id, 0)
+        get_broker().publish(user_id, {'event': 'read', 'data': {'count': count}, 'unread': unread})
+    if count:
+        transaction.on_commit(publish)
+
+
+def notification_saved(sender, instance, created, **kwargs):
+    """post_save receiver for Notification; bulk_create() publishes its own."""
+    if created:
+        publish_notifications([instance])
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+async def unread_count(user_id):
+    from .models import CustomUser
+    count = await CustomUser.objects.filter(pk=user_id).values_list('unread_notifications', flat=True).afirst()
+    return count or 0
+
+
+async def notification_stream(user_id, keepalive=STREAM_KEEPALIVE, max_age=STREAM_MAX_AGE):
+    """
+    Server-sent events for one user: `unread` with the unread count on
+    connect and whenever it changes, and `notification` for each new one.
+
+    The count is read once on connect and then taken from published
+    events, which carry the user's absolute unread count, so an event that
+    raced the initial read is not counted twice.
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    try:
+        # Subscribed first, so that nothing created meanwhile is missed
+        count = await unread_count(user_id)
+        yield f'retry: {STREAM_RETRY}\n' + format_event('unread', {'count': count})
+        deadline = loop.time() + max_age
+        while (remaining := deadline - loop.time()) > 0:
+            event = await subscription.get(min(keepalive, remaining))
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            if event['event'] == 'notification':
+                yield format_event('notification', event['data'])
+            count = event['unread'] if 'unread' in event else await unread_count(user_id)
+            yield format_event('unread', {'count': count})
+    finally:
+        broker.unsubscribe(subscription)
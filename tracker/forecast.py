@@ -0,0 +1,150 @@
+import math
+from datetime import timedelta
+from typing import Dict, Optional
+import numpy as np
+
+# Readings lose half their weight in the fit after this many days, so the
+# trend follows the user's current pace instead of their whole history
+HALF_LIFE_DAYS = 30
+
+# Two-sided 95% band on the slope
+CONFIDENCE_Z = 1.96
+
+# Forecasts further out than this are reported as "not in sight"
+MAX_FORECAST_DAYS = 3 * 365
+
+STAT_FIELDS = ('sum_w', 'sum_t', 'sum_y', 'sum_tt', 'sum_ty', 'sum_yy')
+
+
+def _decay(days: float, half_life: float) -> float:
+    return 0.5 ** (days / half_life)
+
+
+def fit_weight_trend(dates, weights, half_life: float = HALF_LIFE_DAYS) -> Dict[str, float]:
+    """
+    Fit an exponentially weighted linear trend over a full weight series.
+
+    Time is measured in days relative to the latest reading, so the
+    sufficient statistics can later be shifted and extended one reading
+    at a time by update_weight_trend.
+
+    Args:
+        dates: Reading dates ordered ascending
+        weights: Weights in kg aligned with dates
+        half_life: Half-life in days of a reading's influence
+
+    Returns:
+        dict: Weighted sufficient statistics keyed by STAT_FIELDS
+    """
+    if not len(dates):
+        return {field: 0.0 for field in STAT_FIELDS}
+    last_date = dates[-1]
+    t = np.array([(date - last_date).days for date in dates], dtype=float)
+    y = np.asarray(weights, dtype=float)
+    w = 0.5 ** (-t / half_life)
+    return {
+        'sum_w': float(w.sum()),
+        'sum_t': float(np.dot(w, t)),
+        'sum_y': float(np.dot(w, y)),
+        'sum_tt': float(np.dot(w, t * t)),
+        'sum_ty': float(np.dot(w, t * y)),
+        'sum_yy': float(np.dot(w, y * y)),
+    }
+
+
+def update_weight_trend(stats: Dict[str, float], days_since_last: float, weight: float,
+                        half_life: float = HALF_LIFE_DAYS) -> Dict[str, float]:
+    """
+    Extend fitted statistics with one new reading in O(1).
+
+    The origin moves to the new reading and older mass is decayed, which
+    gives exactly the same result as refitting the whole series.
+
+    Args:
+        stats: Statistics returned by fit_weight_trend or a previous update
+        days_since_last: Days between the previous latest reading and this one
+        weight: New weight in kg
+        half_life: Half-life in days of a reading's influence
+
+    Returns:
+        dict: Updated statistics
+    """
+    d = float(days_since_last)
+    sw, st, sy = stats['sum_w'], stats['sum_t'], stats['sum_y']
+    stt, sty, syy = stats['sum_tt'], stats['sum_ty'], stats['sum_yy']
+    # Shift the time origin by d days (t' = t - d), then decay
+    stt = stt - 2 * d * st + d * d * sw
+    sty = sty - d * sy
+    st = st - d * sw
+    decay = _decay(d, half_life)
+    return {
+        'sum_w': sw * decay + 1.0,
+        'sum_t': st * decay,
+        'sum_y': sy * decay + weight,
+        'sum_tt': stt * decay,
+        'sum_ty': sty * decay,
+        'sum_yy': syy * decay + weight * weight,
+    }
+
+
+def project_goal(stats: Dict[str, float], goal: float, last_date,
+                 z: float = CONFIDENCE_Z) -> Optional[Dict]:
+    """
+    Estimate when the weight goal will be reached.
+
+    Args:
+        stats: Fitted statistics with time measured from last_date
+        goal: Target weight in kg
+        last_date: Date of the latest reading
+        z: Width of the confidence band in standard errors of the slope
+
+    Returns:
+        dict: Trend and ETA details, or None if there is not enough data
+    """
+    sw = stats['sum_w']
+    if sw <= 2:
+        return None
+    mean_t = stats['sum_t'] / sw
+    mean_y = stats['sum_y'] / sw
+    sxx = stats['sum_tt'] - sw * mean_t ** 2
+    if sxx <= 1e-9:
+        return None
+    sxy = stats['sum_ty'] - sw * mean_t * mean_y
+    syy = stats['sum_yy'] - sw * mean_y ** 2
+
+    slope = sxy / sxx
+    current = mean_y - slope * mean_t
+    residual_var = max(syy - slope * sxy, 0.0) / (sw - 2)
+    slope_error = math.sqrt(residual_var / sxx)
+
+    remaining = goal - current
+    result = {
+        'current_estimate': round(current, 1),
+        'weekly_change': round(slope * 7, 2),
+        'weekly_change_error': round(slope_error * 7, 2),
+        'reached': abs(remaining) < 0.1,
+        'eta': None,
+        'eta_earliest': None,
+        'eta_latest': None,
+    }
+    if result['reached']:
+        return result
+
+    def days_to_goal(rate):
+        # Only slopes heading towards the goal ever reach it
+        if rate == 0 or (remaining > 0) != (rate > 0):
+            return None
+        days = remaining / rate
+        return days if days <= MAX_FORECAST_DAYS else None
+
+    eta_days = days_to_goal(slope)
+    if eta_days is None:
+        return result
+    bounds = [days_to_goal(slope - z * slope_error), days_to_goal(slope + z * slope_error)]
+    result['eta'] = last_date + timedelta(days=math.ceil(eta_days))
+    reachable = [days for days in bounds if days is not None]
+    if reachable:
+        result['eta_earliest'] = last_date + timedelta(days=math.ceil(min(reachable)))
+    if len(reachable) == 2:
+        result['eta_latest'] = last_date + timedelta(days=math.ceil(max(reachable)))
+    return result
@@ -0,0 +1,65 @@
+from datetime import datetime
+from django.core import signing
+from django.db.models import Q
+
+from .models import Notification
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+CURSOR_SALT = 'tracker.inbox'
+
+
+def encode_cursor(notification):
+    return signing.dumps([notification.created_at.isoformat(), notification.pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """Return (created_at, pk) from a cursor, or None if it is invalid."""
+    try:
+        created_at, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        return datetime.fromisoformat(created_at), pk
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+def notification_page(user, params):
+    """
+    One keyset-paginated page of a user's notifications, newest first.
+
+    Pages are cut on (created_at, id), which the (user, -created_at, -id)
+    index serves directly however deep the page. Only the notifications on
+    the page are marked read; they are returned as loaded, so the page can
+    still highlight the new ones.
+
+    Args:
+        user: Owner of the notifications
+        params: Mapping of query parameters (cursor, size)
+
+    Returns:
+        dict: notifications, next_cursor and marked (how many were unread)
+    """
+    try:
+        size = max(1, min(int(params.get('size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        size = DEFAULT_PAGE_SIZE
+
+    notifications = Notification.objects.filter(user=user)
+    position = decode_cursor(params['cursor']) if params.get('cursor') else None
+    if position:
+        created_at, pk = position
+        notifications = notifications.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(notifications.order_by('-created_at', '-id')[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1])
+
+    unread_ids = [notification.pk for notification in rows if not notification.is_read]
+    marked = Notification.objects.filter(pk__in=unread_ids).mark_read(user.pk) if unread_ids else 0
+    return {
+        'notifications': rows,
+        'next_cursor': next_cursor,
+        'marked': marked,
+    }
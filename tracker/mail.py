@@ -0,0 +1,236 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+import random
+import threading
+import time
+
+from .models import OutboundEmail
+
+# Attempts before a message is given up as FAILED, and the backoff between
+# them: RETRY_BASE seconds doubling per attempt up to RETRY_MAX, jittered
+MAX_ATTEMPTS = 5
+RETRY_BASE = 30
+RETRY_MAX = 3600
+
+# Seconds a claimed message is hidden from other workers; if its worker
+# dies it is picked up again after this. The claim on messages still being
+# sent is extended every CLAIM_TIMEOUT / 2 seconds, however long the batch takes
+CLAIM_TIMEOUT = 300
+
+
+def serialize_message(message):
+    """JSON-serializable form of an EmailMessage (attachments are not supported)."""
+    if message.attachments:
+        raise ValueError('Queued email does not support attachments')
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': list(message.to),
+        'cc': list(message.cc),
+        'bcc': list(message.bcc),
+        'reply_to': list(message.reply_to),
+        'headers': dict(message.extra_headers),
+        'content_subtype': message.content_subtype,
+        'alternatives': [list(alternative) for alternative in getattr(message, 'alternatives', [])],
+    }
+
+
+def deserialize_message(data):
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in data['alternatives']],
+    )
+    message.content_subtype = data['content_subtype']
+    return message
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend that stores messages in OutboundEmail instead of sending
+    them, so that requests and commands never wait for the mail server.
+
+    Messages are inserted in one query per send_messages() call and, inside
+    a transaction, only become visible to the worker once it commits.
+    """
+
+    def send_messages(self, email_messages):
+        try:
+            rows = [
+                OutboundEmail(subject=message.subject, message=serialize_message(message))
+                for message in email_messages if message.recipients()
+            ]
+            OutboundEmail.objects.bulk_create(rows)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(rows)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a message that failed `attempts` times."""
+    delay = min(RETRY_MAX, RETRY_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+class EmailQueueWorker:
+    """
+    Delivers queued email through settings.EMAIL_DELIVERY_BACKEND.
+
+    Each batch claims up to `batch_size` due messages by moving their next
+    attempt CLAIM_TIMEOUT ahead, so concurrent workers never pick the same
+    message. The batch is split over a pool of `threads` threads, each
+    keeping its own connection to the mail server open across batches; the
+    claim is extended while any of them is still sending.
+    Failed messages are retried with exponential backoff and marked FAILED
+    after `max_attempts`.
+    """
+
+    def __init__(self, batch_size=100, threads=4, max_attempts=MAX_ATTEMPTS, backend=None, clock=timezone.now):
+        """
+        Initialize the worker.
+
+        Args:
+            batch_size: Messages claimed per batch
+            threads: Messages sent in parallel, each over its own connection
+            max_attempts: Attempts before a message is marked FAILED
+            backend: Delivery backend path (defaults to settings.EMAIL_DELIVERY_BACKEND)
+            clock: Returns the current aware datetime
+        """
+        self.batch_size = batch_size
+        self.threads = threads
+        self.max_attempts = max_attempts
+        self.backend = backend or getattr(settings, 'EMAIL_DELIVERY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='email')
+        self.local = threading.local()
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def connection(self):
+        """This thread's open connection, opened on first use."""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = get_connection(self.backend)
+            connection.open()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.add(connection)
+        return connection
+
+    def drop_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            self.local.connection = None
+            with self.lock:
+                self.connections.discard(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def send(self, messages):
+        """Send (pk, message) pairs on this thread's connection; returns {pk: error or None}."""
+        results = {}
+        for pk, message in messages:
+            try:
+                self.connection().send_messages([message])
+                results[pk] = None
+            except Exception as e:
+                # The connection may be broken: reconnect for the next message
+                self.drop_connection()
+                results[pk] = f'{type(e).__name__}: {e}'
+        return results
+
+    def claim(self):
+        """Claim the next batch of due messages."""
+        now = self.clock()
+        with transaction.atomic():
+            claimed = list(
+                OutboundEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=OutboundEmail.Status.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:self.batch_size]
+            )
+            if claimed:
+                OutboundEmail.objects.filter(pk__in=[email.pk for email in claimed]).update(
+                    next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT), last_modified=now
+                )
+        return claimed
+
+    def extend_claim(self, pks):
+        """Keep claimed messages that are still being sent hidden for another CLAIM_TIMEOUT."""
+        now = self.clock()
+        OutboundEmail.objects.filter(pk__in=pks, status=OutboundEmail.Status.PENDING).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT), last_modified=now
+        )
+
+    def run_batch(self):
+        """
+        Claim and deliver one batch.
+
+        Returns:
+            dict: sent, retrying, failed, seconds and rate, or None if nothing was due
+        """
+        claimed = self.claim()
+        if not claimed:
+            return None
+        started = time.perf_counter()
+        messages = [(email.pk, deserialize_message(email.message)) for email in claimed]
+        futures = {}
+        for i in range(self.threads):
+            chunk = messages[i::self.threads]
+            futures[self.executor.submit(self.send, chunk)] = [pk for pk, _ in chunk]
+        errors = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=CLAIM_TIMEOUT / 2)
+            for future in done:
+                errors.update(future.result())
+            if pending:
+                self.extend_claim([pk for future in pending for pk in futures[future]])
+        seconds = time.perf_counter() - started
+
+        now = self.clock()
+        counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+        for email in claimed:
+            email.attempts += 1
+            email.last_modified = now
+            error = errors[email.pk]
+            if error is None:
+                email.status = OutboundEmail.Status.SENT
+                email.sent_at = now
+                email.last_error = ''
+                counts['sent'] += 1
+            elif email.attempts >= self.max_attempts:
+                email.status = OutboundEmail.Status.FAILED
+                email.last_error = error
+                counts['failed'] += 1
+            else:
+                email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+                email.last_error = error
+                counts['retrying'] += 1
+        OutboundEmail.objects.bulk_update(claimed, ['status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error', 'last_modified'])
+        return {**counts, 'seconds': seconds, 'rate': counts['sent'] / seconds if seconds else 0.0}
+
+    def close(self):
+        self.executor.shutdown()
+        with self.lock:
+            connections, self.connections = self.connections, set()
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
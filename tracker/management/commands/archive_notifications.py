@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from tracker.retention import archive_notifications
+
+
+class Command(BaseCommand):
+    help = 'Archive read notifications past the retention period to gzipped JSON lines and delete them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive read notifications older than N days (defaults to NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        archived, path = archive_notifications(older_than_days=options['days'],
+                                               batch_size=max(1, options['batch_size']))
+        if path is None:
+            self.stdout.write(self.style.SUCCESS('No notifications to archive'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} notifications to {path}"))
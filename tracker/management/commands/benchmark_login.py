@@ -0,0 +1,61 @@
+import math
+import time
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from tracker.backends import MAX_FAILED_ATTEMPTS, failure_key
+
+PASSWORD = 'Benchmark-Pass-123'
+
+
+class Command(BaseCommand):
+    help = ('Measure login throughput of one worker through the configured authentication backends. '
+            'Uses throwaway users in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Logins attempted per scenario')
+
+    def handle(self, *args, **options):
+        iterations = max(1, options['iterations'])
+        UserModel = get_user_model()
+        request = RequestFactory().post('/login/', REMOTE_ADDR='127.0.0.1')
+
+        with transaction.atomic():
+            user = UserModel.objects.create_user(
+                username='benchmark-login', email='benchmark-login@example.com', password=PASSWORD
+            )
+            # Wrong passwords are spread over enough accounts that none gets locked
+            victims = UserModel.objects.bulk_create([
+                UserModel(username=f'benchmark-login-{i}', email=f'benchmark-login-{i}@example.com',
+                          password=user.password)
+                for i in range(math.ceil(iterations / (MAX_FAILED_ATTEMPTS - 1)))
+            ])
+            scenarios = [
+                ('username', lambda i: (user.username, PASSWORD)),
+                ('email', lambda i: (user.email, PASSWORD)),
+                ('wrong password', lambda i: (victims[i % len(victims)].username, 'wrong')),
+                ('unknown user', lambda i: (f'nobody-{i}', PASSWORD)),
+            ]
+            for name, credentials in scenarios:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for i in range(iterations):
+                        username, password = credentials(i)
+                        authenticated = authenticate(request, username=username, password=password)
+                        if authenticated is not None:
+                            user_logged_in.send(sender=UserModel, request=request, user=authenticated)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{name:<16}{iterations / elapsed:>9.1f} logins/s'
+                    f'{elapsed / iterations * 1000:>9.2f} ms'
+                    f'{len(queries) / iterations:>7.2f} queries'
+                )
+            transaction.set_rollback(True)
+            # The rolled back ids will be reused by real users
+            cache.delete_many([failure_key(victim.pk) for victim in victims])
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {iterations} logins per scenario'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from tracker.cohorts import build_cohort_statistics
+
+
+class Command(BaseCommand):
+    help = 'Precompute per-cohort histograms and quantile tables for doctor analytics.'
+
+    def handle(self, *args, **options):
+        count = build_cohort_statistics()
+        self.stdout.write(self.style.SUCCESS(f"Built {count} cohort statistics"))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tracker.retention import compact_notifications
+
+
+class Command(BaseCommand):
+    help = 'Merge repeated reminder and goal notifications into one row per user, type and day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help='Compact notifications created in the last N days')
+        parser.add_argument('--all', action='store_true',
+                            help='Compact the whole table (first run)')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else timezone.now() - timedelta(days=options['days'])
+        removed = compact_notifications(since=since)
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} duplicate notifications"))
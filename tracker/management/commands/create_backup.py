@@ -4,11 +4,15 @@ import logging
 
 class Command(BaseCommand):
     help = 'Create a backup of the database and media files'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Reuse the previous backup for data that has not changed since')
+
     def handle(self, *args, **options):
         backup_manager = BackupManager()
         try:
-            backup_path = backup_manager.create_backup()
+            backup_path = backup_manager.create_backup(incremental=options['incremental'])
             self.stdout.write(self.style.SUCCESS(f'Successfully created backup: {backup_path}'))
             logging.info(f'Backup created successfully: {backup_path}')
         except Exception as e:
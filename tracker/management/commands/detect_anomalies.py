@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import islice
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from tracker.anomaly import (
+    DEFAULT_WINDOW, MAD_THRESHOLD, ZSCORE_THRESHOLD, analyse_user, iter_user_series,
+)
+from tracker.models import CustomUser, HealthAnomaly, Notification
+
+# Patients listed by name in a doctor's digest; the rest are only counted
+DIGEST_PATIENTS = 20
+
+
+class Command(BaseCommand):
+    help = 'Flag abnormal health readings using rolling z-scores and robust MAD scores.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                            help='Number of previous readings forming the baseline')
+        parser.add_argument('--z-threshold', type=float, default=ZSCORE_THRESHOLD)
+        parser.add_argument('--mad-threshold', type=float, default=MAD_THRESHOLD)
+        parser.add_argument('--since-days', type=int, default=1,
+                            help='Only flag readings from the last N days (0 flags the whole history)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes used for scoring')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users handed to the workers per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report anomalies without writing flags or notifications')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since_days'] > 0:
+            since = timezone.localdate() - timedelta(days=options['since_days'])
+        scoring_options = {
+            'window': options['window'],
+            'z_threshold': options['z_threshold'],
+            'mad_threshold': options['mad_threshold'],
+            'since': since,
+        }
+
+        existing = HealthAnomaly.objects.all()
+        if since:
+            existing = existing.filter(record__date__gte=since)
+        seen = set(existing.values_list('record_id', 'metric'))
+
+        payloads = ((user_id, series, scoring_options) for user_id, series in iter_user_series())
+        flags_by_user = {}
+        executor = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        try:
+            while True:
+                batch = list(islice(payloads, options['batch_size']))
+                if not batch:
+                    break
+                results = executor.map(analyse_user, batch) if executor else map(analyse_user, batch)
+                for user_id, flags in results:
+                    flags = [flag for flag in flags if (flag['record_id'], flag['metric']) not in seen]
+                    if flags:
+                        flags_by_user[user_id] = flags
+        finally:
+            if executor:
+                executor.shutdown()
+
+        total = sum(len(flags) for flags in flags_by_user.values())
+        if options['dry_run'] or not total:
+            self.stdout.write(self.style.SUCCESS(
+                f"Found {total} new anomalies across {len(flags_by_user)} patients"
+            ))
+            return
+
+        with transaction.atomic():
+            HealthAnomaly.objects.bulk_create([
+                HealthAnomaly(
+                    record_id=flag['record_id'],
+                    metric=flag['metric'],
+                    method=flag['method'],
+                    value=flag['value'],
+                    zscore=flag['zscore'],
+                    mad_score=flag['mad_score'],
+                )
+                for flags in flags_by_user.values()
+                for flag in flags
+            ], batch_size=1000, ignore_conflicts=True)
+            notification_count = self.notify_doctors(flags_by_user)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Flagged {total} anomalies across {len(flags_by_user)} patients "
+            f"and sent {notification_count} doctor notifications"
+        ))
+
+    def notify_doctors(self, flags_by_user):
+        """
+        Send each active doctor one digest of the run's flagged patients.
+
+        Doctors are not assigned patients, so every doctor sees every flag;
+        a digest keeps this to one notification per doctor and run.
+        """
+        doctor_ids = list(
+            CustomUser.objects.filter(role=CustomUser.Role.DOCTOR, is_active=True).values_list('id', flat=True)
+        )
+        if not doctor_ids:
+            return 0
+        listed = dict(islice(flags_by_user.items(), DIGEST_PATIENTS))
+        usernames = dict(CustomUser.objects.filter(id__in=listed).values_list('id', 'username'))
+
+        lines = []
+        for user_id, flags in listed.items():
+            details = ', '.join(
+                f"{flag['metric'].replace('_', ' ')} {flag['value']:g} on {flag['date']}" for flag in flags
+            )
+            lines.append(f"{usernames.get(user_id, user_id)}: {details}")
+        if len(flags_by_user) > DIGEST_PATIENTS:
+            lines.append(f"and {len(flags_by_user) - DIGEST_PATIENTS} more patient(s), see the patient roster")
+        total = sum(len(flags) for flags in flags_by_user.values())
+        title = f"Abnormal readings for {len(flags_by_user)} patient(s)"
+        message = f"{total} abnormal reading(s) detected. " + '; '.join(lines)
+
+        Notification.objects.bulk_create([
+            Notification(user_id=doctor_id, type=Notification.NotificationType.ANOMALY_ALERT, title=title, message=message)
+            for doctor_id in doctor_ids
+        ], batch_size=1000)
+        return len(doctor_ids)
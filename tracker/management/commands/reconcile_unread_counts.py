@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from tracker.models import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = "Recount users' unread notifications and correct counters that have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users checked per query')
+
+    def handle(self, *args, **options):
+        checked, corrected = reconcile_unread_counts(batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users, corrected {corrected} unread counts"))
@@ -0,0 +1,49 @@
+import datetime
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from tracker.backup import BackupManager
+from tracker.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Restore one user's rows from the newest backup taken at or before a point in time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True,
+                            help='Username or numeric id (use the id for users that were deleted)')
+        parser.add_argument('--as-of',
+                            help='Date or ISO datetime; a date means the end of that day (defaults to the latest backup)')
+
+    def handle(self, *args, **options):
+        user = options['user']
+        if user.isdigit():
+            user_id = int(user)
+        else:
+            try:
+                user_id = CustomUser.objects.get(username=user).pk
+            except CustomUser.DoesNotExist:
+                raise CommandError(f'No user named {user}; pass the numeric id instead')
+
+        as_of = None
+        if options['as_of']:
+            as_of = parse_datetime(options['as_of'])
+            if as_of is None:
+                day = parse_date(options['as_of'])
+                if day is None:
+                    raise CommandError(f"Invalid --as-of: {options['as_of']}")
+                as_of = datetime.datetime.combine(day, datetime.time.max)
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+
+        try:
+            result = BackupManager().restore_user(user_id, as_of=as_of)
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        total = sum(result['counts'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {total} rows for user {user_id} from {result['snapshot']}"
+        ))
+        for label, count in sorted(result['counts'].items()):
+            self.stdout.write(f'    {label}: {count}')
@@ -1,8 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from tracker.models import DailyReminderSetting, Notification
-from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 
 class Command(BaseCommand):
     help = 'Send daily reminders (in-app and email) to users at their chosen time.'
@@ -12,24 +11,28 @@ class Command(BaseCommand):
         current_time = now.time().replace(second=0, microsecond=0)
         reminders = DailyReminderSetting.objects.filter(reminder_time=current_time)
         sent_count = 0
-        for reminder in reminders:
+        notifications = []
+        emails = []
+        for reminder in reminders.select_related('user'):
             user = reminder.user
             # In-app notification
             if reminder.send_in_app:
-                Notification.objects.create(
+                notifications.append(Notification(
                     user=user,
                     type=Notification.NotificationType.DAILY_REMINDER,
                     title="Daily Health Reminder",
                     message="It's time to log your health data!"
-                )
+                ))
             # Email notification
             if reminder.send_email and user.email:
-                send_mail(
+                emails.append(EmailMessage(
                     subject="Your Daily Health Reminder",
-                    message="Hi {},\n\nThis is your daily reminder to log your health data in the Health Tracker app!".format(user.get_full_name() or user.username),
-                    from_email=None,  # Use DEFAULT_FROM_EMAIL
-                    recipient_list=[user.email],
-                    fail_silently=True,
-                )
+                    body="Hi {},\n\nThis is your daily reminder to log your health data in the Health Tracker app!".format(user.get_full_name() or user.username),
+                    to=[user.email],
+                ))
             sent_count += 1
+        # One INSERT, and one counter UPDATE for all recipients
+        Notification.objects.bulk_create(notifications, batch_size=1000)
+        # Queued for send_queued_email in one insert
+        get_connection().send_messages(emails)
         self.stdout.write(self.style.SUCCESS(f"Sent {sent_count} daily reminders at {current_time}")) 
\ No newline at end of file
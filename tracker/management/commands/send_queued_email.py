@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tracker.mail import MAX_ATTEMPTS, EmailQueueWorker
+from tracker.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued email through EMAIL_DELIVERY_BACKEND, reporting throughput per batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Messages claimed per batch')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Messages sent in parallel, each over its own connection')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='Attempts before a message is marked failed')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no message is due instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds between polls of an empty queue')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Delete sent messages older than N days')
+
+    def handle(self, *args, **options):
+        purged, _ = OutboundEmail.objects.filter(
+            status=OutboundEmail.Status.SENT,
+            sent_at__lt=timezone.now() - timedelta(days=options['keep_days']),
+        ).delete()
+        if purged:
+            self.stdout.write(f'Deleted {purged} sent messages')
+
+        worker = EmailQueueWorker(batch_size=max(1, options['batch_size']), threads=max(1, options['threads']),
+                                  max_attempts=max(1, options['max_attempts']))
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+        try:
+            while True:
+                result = worker.run_batch()
+                if result is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for outcome in totals:
+                    totals[outcome] += result[outcome]
+                self.stdout.write(
+                    f"Batch: {result['sent']} sent, {result['retrying']} retrying, {result['failed']} failed"
+                    f" in {result['seconds']:.2f}s ({result['rate']:.1f} messages/s)"
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} messages, {totals['retrying']} to retry, {totals['failed']} failed"
+        ))
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from tracker.summaries import send_weekly_summaries
+
+
+class Command(BaseCommand):
+    help = 'Create weekly summary notifications for every user who logged records, and email opted-in users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--week-ending',
+                            help='Last day of the week as YYYY-MM-DD (defaults to yesterday)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users per bulk insert')
+        parser.add_argument('--no-email', action='store_true',
+                            help='Only create in-app notifications')
+
+    def handle(self, *args, **options):
+        week_end = None
+        if options['week_ending']:
+            week_end = parse_date(options['week_ending'])
+            if week_end is None:
+                raise CommandError(f"Invalid --week-ending: {options['week_ending']}")
+
+        started = time.perf_counter()
+        result = send_weekly_summaries(week_end=week_end, batch_size=max(1, options['batch_size']),
+                                       email=not options['no_email'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['notifications']} weekly summaries and sent {result['emails']} emails in {elapsed:.1f}s"
+        ))
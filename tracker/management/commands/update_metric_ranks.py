@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from tracker.ranking import update_sketches
+
+
+class Command(BaseCommand):
+    help = 'Update the percentile rank sketches from records changed since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild from every user instead of only changed ones')
+
+    def handle(self, *args, **options):
+        result = update_sketches(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated rank sketches for {result['users']} users ({result['moves']} bucket updates)"
+        ))
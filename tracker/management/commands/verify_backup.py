@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from tracker.backup import BackupManager
+
+
+class Command(BaseCommand):
+    help = 'Verify backups against their SHA-256 manifests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filenames', nargs='*',
+                            help='Backups to check, relative to the backup directory (defaults to all)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Blobs and archives checked in parallel (defaults to the CPU count)')
+        parser.add_argument('--quick', action='store_true',
+                            help='Only check that referenced data exists, without decompressing it')
+
+    def handle(self, *args, **options):
+        results = BackupManager().verify_backups(
+            filenames=options['filenames'] or None,
+            deep=not options['quick'],
+            workers=options['workers'],
+        )
+        failed = 0
+        for result in results:
+            if result['ok']:
+                self.stdout.write(self.style.SUCCESS(f"OK      {result['filename']}"))
+            else:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"FAILED  {result['filename']}"))
+            for error in result['errors']:
+                self.stdout.write(f'    {error}')
+            for warning in result['warnings']:
+                self.stdout.write(self.style.WARNING(f'    {warning}'))
+        if failed:
+            raise CommandError(f'{failed} of {len(results)} backups failed verification')
+        self.stdout.write(f'Verified {len(results)} backups')
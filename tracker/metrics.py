@@ -0,0 +1,48 @@
+from collections import Counter
+from django.core.cache import caches
+import threading
+import time
+
+
+class Counters:
+    """
+    Per-process counters added to shared totals in the cache every few seconds.
+
+    Counting in-process keeps request paths free of extra cache round-trips;
+    the shared totals lag each worker by at most `flush_interval` seconds.
+    """
+
+    def __init__(self, prefix, flush_interval=10, cache_alias='default', clock=time.monotonic):
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.cache_alias = cache_alias
+        self.clock = clock
+        self.local = Counter()
+        self.lock = threading.Lock()
+        self.flushed_at = clock()
+
+    def incr(self, name, delta=1):
+        with self.lock:
+            self.local[name] += delta
+            due = self.clock() - self.flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.local = self.local, Counter()
+            self.flushed_at = self.clock()
+        cache = caches[self.cache_alias]
+        for name, delta in pending.items():
+            key = f'{self.prefix}:{name}'
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, None):
+                    cache.incr(key, delta)
+
+    def totals(self, names):
+        """Shared totals for the given counter names, including this process's pending counts."""
+        self.flush()
+        values = caches[self.cache_alias].get_many([f'{self.prefix}:{name}' for name in names])
+        return {name: values.get(f'{self.prefix}:{name}', 0) for name in names}
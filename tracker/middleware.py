@@ -0,0 +1,109 @@
+import math
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.utils.functional import SimpleLazyObject
+
+from .backends import get_cached_user
+from .metrics import Counters
+from .rate_limit import RateLimiter
+
+# Checked and limited requests per limit class, across workers
+RATE_LIMIT_STATS = Counters('rl_stats')
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware that serves request.user from the user cache."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+
+
+def limit_class(resolver_match):
+    """
+    Name of the RATE_LIMIT_DEFAULTS class governing a resolved URL, or None.
+
+    settings.RATE_LIMITED_VIEWS maps URL names to classes; any other route
+    under api/ falls in the 'api' class.
+    """
+    if resolver_match is None:
+        return None
+    views = getattr(settings, 'RATE_LIMITED_VIEWS', {})
+    if resolver_match.url_name in views:
+        return views[resolver_match.url_name]
+    if resolver_match.route.startswith('api/'):
+        return 'api'
+    return None
+
+
+def rate_limit_stats():
+    """Checked and limited request totals per limit class."""
+    names = [f'{name}:{outcome}' for name in settings.RATE_LIMIT_DEFAULTS for outcome in ('checked', 'limited')]
+    totals = RATE_LIMIT_STATS.totals(names)
+    return {
+        name: {outcome: totals[f'{name}:{outcome}'] for outcome in ('checked', 'limited')}
+        for name in settings.RATE_LIMIT_DEFAULTS
+    }
+
+
+class RateLimitMiddleware:
+    """
+    Enforce settings.RATE_LIMIT_DEFAULTS on the views mapped to a limit class.
+
+    Each class is a budget shared by all of its views, e.g. CSV and PDF
+    exports both draw on 'export'. Besides `limit` and `period`, a class may
+    set `algorithm` (see rate_limit.ALGORITHMS), `scope` ('user' or 'ip')
+    and `methods` (only those methods are counted). Over-budget requests
+    get a 429 with Retry-After. Must come after AuthenticationMiddleware.
+
+    settings.RATE_LIMIT_LEASE lets each worker take budget from the shared
+    counters in leases, so most checks on busy keys skip the cache.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiters = {}
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def limiter(self, algorithm):
+        # One per algorithm and process, so memoised counts and leases are shared
+        if algorithm not in self.limiters:
+            lease = getattr(settings, 'RATE_LIMIT_LEASE', {})
+            self.limiters[algorithm] = RateLimiter(
+                algorithm=algorithm,
+                lease_size=lease.get('size', 1),
+                max_overadmission=lease.get('max_overadmission', 0.0),
+                workers=lease.get('workers', 1),
+            )
+        return self.limiters[algorithm]
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        name = limit_class(request.resolver_match)
+        config = settings.RATE_LIMIT_DEFAULTS.get(name) if name else None
+        if not config or ('methods' in config and request.method not in config['methods']):
+            return None
+
+        allowed, retry_after = self.limiter(config.get('algorithm', 'sliding_window')).is_allowed(
+            request, name, config['limit'], config['period'], scope=config.get('scope', 'user')
+        )
+        RATE_LIMIT_STATS.incr(f'{name}:checked')
+        if allowed:
+            return None
+        RATE_LIMIT_STATS.incr(f'{name}:limited')
+        return too_many_requests(request, retry_after)
+
+
+def too_many_requests(request, retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    if request.resolver_match.route.startswith('api/'):
+        response = JsonResponse({'error': 'Too many requests', 'retry_after': retry_after}, status=429)
+    else:
+        response = render(request, 'tracker/429.html', {'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
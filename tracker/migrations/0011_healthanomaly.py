@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_alter_foodrecommendation_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('WEIGHT_GOAL', 'Weight Goal'), ('WEIGHT_MILESTONE', 'Weight Milestone'), ('DAILY_REMINDER', 'Daily Reminder'), ('WEEKLY_SUMMARY', 'Weekly Summary'), ('ANOMALY_ALERT', 'Anomaly Alert')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='HealthAnomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20)),
+                ('method', models.CharField(choices=[('ZSCORE', 'Rolling z-score'), ('MAD', 'Robust MAD score'), ('SWING', 'Absolute swing')], max_length=10)),
+                ('value', models.FloatField()),
+                ('zscore', models.FloatField(blank=True, null=True)),
+                ('mad_score', models.FloatField(blank=True, null=True)),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='tracker.healthrecord')),
+            ],
+            options={
+                'ordering': ['-detected_at'],
+                'constraints': [models.UniqueConstraint(fields=('record', 'metric'), name='unique_anomaly_per_record_metric')],
+            },
+        ),
+    ]
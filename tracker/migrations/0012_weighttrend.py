@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_healthanomaly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeightTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sum_w', models.FloatField(default=0)),
+                ('sum_t', models.FloatField(default=0)),
+                ('sum_y', models.FloatField(default=0)),
+                ('sum_tt', models.FloatField(default=0)),
+                ('sum_ty', models.FloatField(default=0)),
+                ('sum_yy', models.FloatField(default=0)),
+                ('reading_count', models.PositiveIntegerField(default=0)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('needs_refit', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='weight_trend', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
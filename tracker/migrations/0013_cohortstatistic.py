@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_weighttrend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20)),
+                ('age_band', models.CharField(max_length=10)),
+                ('gender', models.CharField(max_length=10)),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('bin_edges', models.JSONField(default=list)),
+                ('bin_counts', models.JSONField(default=list)),
+                ('quantiles', models.JSONField(default=list, help_text='Values at percentiles 0-100')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['metric', 'age_band', 'gender'],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'age_band', 'gender'), name='unique_cohort_statistic')],
+            },
+        ),
+    ]
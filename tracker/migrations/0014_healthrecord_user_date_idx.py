@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0013_cohortstatistic'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['user', '-date'], name='healthrecord_user_date_idx'),
+        ),
+    ]
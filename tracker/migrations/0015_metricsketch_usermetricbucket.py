@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0014_healthrecord_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20, unique=True)),
+                ('bin_edges', models.JSONField(default=list)),
+                ('bin_counts', models.JSONField(default=list)),
+                ('cumulative', models.JSONField(default=list)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('watermark', models.DateTimeField(blank=True, null=True)),
+                ('window_start', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserMetricBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20)),
+                ('bucket', models.PositiveIntegerField()),
+                ('value', models.FloatField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'metric'), name='unique_user_metric_bucket')],
+            },
+        ),
+    ]
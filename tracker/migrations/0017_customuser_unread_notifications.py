@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread(apps, schema_editor):
+    CustomUser = apps.get_model('tracker', 'CustomUser')
+    Notification = apps.get_model('tracker', 'Notification')
+    unread = (Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+              .order_by().values('user').annotate(count=Count('pk')).values('count'))
+    CustomUser.objects.update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0016_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
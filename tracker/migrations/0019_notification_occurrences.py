@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0018_notification_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,8 +1,18 @@
-from django.db import models
+from collections import Counter, defaultdict
+from datetime import datetime, time
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .forecast import STAT_FIELDS, fit_weight_trend, project_goal, update_weight_trend
+
+# Absolute weight change (kg) between consecutive readings that counts as a
+# milestone; also used as the hard floor by the nightly anomaly detector.
+WEIGHT_MILESTONE_KG = 5
 
 class CustomUser(AbstractUser):
     class Role(models.TextChoices):
@@ -61,6 +71,9 @@ class CustomUser(AbstractUser):
     last_login_ip = models.GenericIPAddressField(null=True, blank=True)
     failed_login_attempts = models.PositiveIntegerField(default=0)
     account_locked_until = models.DateTimeField(null=True, blank=True)
+    # Denormalized count of unread notifications, see adjust_unread_counts()
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+    last_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         permissions = [
@@ -72,6 +85,17 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
+    def save(self, *args, **kwargs):
+        # The unread counter only changes through relative UPDATEs; writing
+        # back a loaded (possibly cached) copy would undo concurrent changes
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred and field.name != 'unread_notifications'
+            ]
+        super().save(*args, **kwargs)
+
 
 class HealthRecord(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -152,6 +176,9 @@ class HealthRecord(models.Model):
     last_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date'], name='healthrecord_user_date_idx'),
+        ]
         permissions = [
             ("can_view_own_records", "Can view own records"),
             ("can_edit_own_records", "Can edit own records"),
@@ -193,24 +220,36 @@ class HealthRecord(models.Model):
 
         super().save(*args, **kwargs)
 
+        if is_new and self.weight is not None:
+            WeightTrend.add_reading(self)
+        elif old_record and old_record.weight != self.weight:
+            WeightTrend.objects.filter(user_id=self.user_id).update(needs_refit=True, updated_at=timezone.now())
+
         if self.weight is not None:
-            if self.weight_goal:
+            # Records added through the form carry no goal of their own
+            goal = self.weight_goal or self.user.weight_goal
+            if goal:
                 Notification.create_weight_goal_notification(
                     self.user,
                     self.weight,
-                    self.weight_goal
+                    goal
                 )
 
             if not is_new and old_record and old_record.weight:
                 weight_diff = abs(self.weight - old_record.weight)
-                if weight_diff >= 5:
+                if weight_diff >= WEIGHT_MILESTONE_KG:
                     milestone = "lost" if self.weight < old_record.weight else "gained"
                     Notification.create_weight_milestone_notification(
                         self.user,
                         self.weight,
-                        f"You've {milestone} 5 kg!"
+                        f"You've {milestone} {WEIGHT_MILESTONE_KG} kg!"
                     )
 
+    def delete(self, *args, **kwargs):
+        if self.weight is not None:
+            WeightTrend.objects.filter(user_id=self.user_id).update(needs_refit=True, updated_at=timezone.now())
+        return super().delete(*args, **kwargs)
+
     def clean(self):
         super().clean()
         errors = {}
@@ -227,13 +266,6 @@ class HealthRecord(models.Model):
         elif self.water_intake > 10:
             errors['water_intake'] = 'Please enter a realistic water intake amount'
 
-        if self.weight is not None and self.user.weight_goal:
-            Notification.create_weight_goal_notification(
-                self.user,
-                self.weight,
-                self.user.weight_goal
-            )
-
         if self.height is not None:
             if self.height < 100:
                 errors['height'] = 'Height must be at least 100 cm'
@@ -250,27 +282,185 @@ class HealthRecord(models.Model):
             raise ValidationError(errors)
 
 
+def adjust_unread_counts(deltas):
+    """
+    Apply {user_id: change} to the users' unread notification counters.
+
+    Users with the same change share one UPDATE. Counters never go below
+    zero; any drift is corrected by reconcile_unread_counts().
+    """
+    users_by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            users_by_delta[delta].append(user_id)
+    for delta, user_ids in users_by_delta.items():
+        CustomUser.objects.filter(pk__in=user_ids).update(
+            unread_notifications=Greatest(F('unread_notifications') + delta, 0),
+            last_modified=timezone.now(),
+        )
+
+
+def reconcile_unread_counts(user_ids=None, batch_size=1000):
+    """
+    Recount unread notifications and fix the counters that drifted.
+
+    Users are checked `batch_size` at a time with one grouped count each,
+    and only drifted counters are written, recounting inside the UPDATE so
+    notifications created since the check are included.
+
+    Args:
+        user_ids: Users to check (defaults to everyone)
+        batch_size: Users checked per query
+
+    Returns:
+        tuple: (users checked, users corrected)
+    """
+    unread = (Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+              .order_by().values('user').annotate(count=Count('pk')).values('count'))
+    actual = Coalesce(Subquery(unread), 0)
+    users = CustomUser.objects.all() if user_ids is None else CustomUser.objects.filter(pk__in=user_ids)
+    checked = corrected = 0
+    last_id = 0
+    while True:
+        batch = list(users.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+        checked += len(batch)
+        drifted = list(
+            CustomUser.objects.filter(pk__in=batch).annotate(actual=actual)
+            .exclude(unread_notifications=F('actual')).values_list('pk', flat=True)
+        )
+        if drifted:
+            corrected += CustomUser.objects.filter(pk__in=drifted).update(
+                unread_notifications=actual, last_modified=timezone.now()
+            )
+    return checked, corrected
+
+
+class NotificationQuerySet(models.QuerySet):
+    """Bulk writes that keep the users' unread counters in step."""
+
+    def notify(self, user, type, title, message):
+        """
+        Create a notification, except that a notification of one of
+        COMPACTED_TYPES updates the user's one of that type from today, if
+        any, counting the repeat in `occurrences` and making it unread again.
+
+        Concurrent first notifications of a day can still both be created;
+        the compact_notifications command merges them later.
+        """
+        from .events import publish_notifications
+        if type in Notification.COMPACTED_TYPES:
+            day_start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+            with transaction.atomic(savepoint=False):
+                notification = (self.select_for_update().filter(user=user, type=type, created_at__gte=day_start)
+                                .order_by('-created_at', '-id').first())
+                if notification is not None:
+                    was_read = notification.is_read
+                    notification.title = title
+                    notification.message = message
+                    notification.is_read = False
+                    notification.occurrences += 1
+                    notification.save(update_fields=['title', 'message', 'is_read', 'occurrences', 'last_modified'])
+                    if was_read:
+                        publish_notifications([notification])
+                    return notification
+        return self.create(user=user, type=type, title=title, message=message)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # ignore_conflicts is not supported: skipped rows would be counted
+        from .events import publish_notifications
+        with transaction.atomic(savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            adjust_unread_counts(Counter(obj.user_id for obj in objs if not obj.is_read))
+        publish_notifications(objs)
+        return objs
+
+    def mark_read(self, user_id):
+        """
+        Mark the user's unread notifications in this queryset read.
+
+        The counter is decreased by the rows the UPDATE actually changed, so
+        concurrent requests marking the same notifications count them once.
+
+        Returns:
+            int: Number of notifications marked read
+        """
+        from .events import publish_read
+        with transaction.atomic(savepoint=False):
+            marked = self.filter(user_id=user_id, is_read=False).update(is_read=True, last_modified=timezone.now())
+            adjust_unread_counts({user_id: -marked})
+        publish_read(user_id, marked)
+        return marked
+
+    def delete(self):
+        with transaction.atomic(savepoint=False):
+            unread = dict(self.filter(is_read=False).order_by().values('user_id')
+                          .annotate(count=Count('pk')).values_list('user_id', 'count'))
+            deleted = super().delete()
+            adjust_unread_counts({user_id: -count for user_id, count in unread.items()})
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Notification(models.Model):
     class NotificationType(models.TextChoices):
         WEIGHT_GOAL = 'WEIGHT_GOAL', 'Weight Goal'
         WEIGHT_MILESTONE = 'WEIGHT_MILESTONE', 'Weight Milestone'
         DAILY_REMINDER = 'DAILY_REMINDER', 'Daily Reminder'
         WEEKLY_SUMMARY = 'WEEKLY_SUMMARY', 'Weekly Summary'
+        ANOMALY_ALERT = 'ANOMALY_ALERT', 'Anomaly Alert'
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     type = models.CharField(max_length=20, choices=NotificationType.choices)
     title = models.CharField(max_length=100)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
+    # Repeats merged into this row, see NotificationQuerySet.notify()
+    occurrences = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     scheduled_for = models.DateTimeField(null=True, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    # Types kept to one row per user and day
+    COMPACTED_TYPES = (NotificationType.WEIGHT_GOAL, NotificationType.DAILY_REMINDER)
+
+    objects = NotificationQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.type} - {self.created_at}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets save() tell whether it changes the unread count
+        instance._loaded_is_read = instance.__dict__.get('is_read')
+        return instance
+
+    def save(self, *args, **kwargs):
+        was_read = True if self._state.adding else getattr(self, '_loaded_is_read', None)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if was_read is not None and was_read != self.is_read:
+                adjust_unread_counts({self.user_id: -1 if self.is_read else 1})
+        self._loaded_is_read = self.is_read
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            deleted = super().delete(*args, **kwargs)
+            if getattr(self, '_loaded_is_read', None) is False:
+                adjust_unread_counts({self.user_id: -1})
+        return deleted
+
     @classmethod
     def create_weight_goal_notification(cls, user, current_weight, goal_weight):
         progress = ((goal_weight - current_weight) / current_weight) * 100
@@ -279,7 +469,7 @@ class Notification(models.Model):
         else:
             message = f"Congratulations! You've exceeded your goal weight of {goal_weight} kg by {abs(progress):.1f}%!"
 
-        return cls.objects.create(
+        return cls.objects.notify(
             user=user,
             type=cls.NotificationType.WEIGHT_GOAL,
             title="Weight Goal Update",
@@ -296,10 +486,176 @@ class Notification(models.Model):
         )
 
 
+class WeightTrend(models.Model):
+    """Cached weight trend fit, extended incrementally as records arrive."""
+
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='weight_trend')
+    sum_w = models.FloatField(default=0)
+    sum_t = models.FloatField(default=0)
+    sum_y = models.FloatField(default=0)
+    sum_tt = models.FloatField(default=0)
+    sum_ty = models.FloatField(default=0)
+    sum_yy = models.FloatField(default=0)
+    reading_count = models.PositiveIntegerField(default=0)
+    last_date = models.DateField(null=True, blank=True)
+    needs_refit = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.reading_count} readings"
+
+    @property
+    def stats(self):
+        return {field: getattr(self, field) for field in STAT_FIELDS}
+
+    def refit(self):
+        """Refit from the user's full weight history."""
+        rows = list(
+            HealthRecord.objects.filter(user_id=self.user_id, weight__isnull=False)
+            .order_by('date', 'id')
+            .values_list('date', 'weight')
+        )
+        for field, value in fit_weight_trend([r[0] for r in rows], [r[1] for r in rows]).items():
+            setattr(self, field, value)
+        self.reading_count = len(rows)
+        self.last_date = rows[-1][0] if rows else None
+        self.needs_refit = False
+        self.save()
+
+    @classmethod
+    def add_reading(cls, record):
+        """
+        Extend the user's trend with a new record. The row is locked while
+        its statistics are updated, so concurrent readings are not lost.
+        """
+        trend, created = cls.objects.get_or_create(user_id=record.user_id)
+        with transaction.atomic(savepoint=False):
+            if not created:
+                trend = cls.objects.select_for_update().get(pk=trend.pk)
+            if created or trend.needs_refit or trend.last_date is None or record.date < trend.last_date:
+                trend.refit()
+                return trend
+            days = (record.date - trend.last_date).days
+            for field, value in update_weight_trend(trend.stats, days, record.weight).items():
+                setattr(trend, field, value)
+            trend.reading_count += 1
+            trend.last_date = record.date
+            trend.save()
+        return trend
+
+    @classmethod
+    def for_user(cls, user):
+        trend, created = cls.objects.get_or_create(user=user)
+        if created or trend.needs_refit:
+            trend.refit()
+        return trend
+
+    def project(self, goal):
+        if not goal or self.last_date is None:
+            return None
+        return project_goal(self.stats, goal, self.last_date)
+
+
+class HealthAnomaly(models.Model):
+    class Method(models.TextChoices):
+        ZSCORE = 'ZSCORE', 'Rolling z-score'
+        MAD = 'MAD', 'Robust MAD score'
+        SWING = 'SWING', 'Absolute swing'
+
+    record = models.ForeignKey(HealthRecord, on_delete=models.CASCADE, related_name='anomalies')
+    metric = models.CharField(max_length=20)
+    method = models.CharField(max_length=10, choices=Method.choices)
+    value = models.FloatField()
+    zscore = models.FloatField(null=True, blank=True)
+    mad_score = models.FloatField(null=True, blank=True)
+    detected_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-detected_at']
+        constraints = [
+            models.UniqueConstraint(fields=['record', 'metric'], name='unique_anomaly_per_record_metric'),
+        ]
+
+    def __str__(self):
+        return f"{self.record} - {self.metric} ({self.get_method_display()})"
+
+
+class CohortStatistic(models.Model):
+    """Nightly histogram and quantile table of one metric within a patient cohort."""
+
+    ALL = 'ALL'
+
+    metric = models.CharField(max_length=20)
+    age_band = models.CharField(max_length=10)
+    gender = models.CharField(max_length=10)
+    sample_count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(null=True, blank=True)
+    bin_edges = models.JSONField(default=list)
+    bin_counts = models.JSONField(default=list)
+    quantiles = models.JSONField(default=list, help_text='Values at percentiles 0-100')
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['metric', 'age_band', 'gender']
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'age_band', 'gender'], name='unique_cohort_statistic'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} - {self.age_band}/{self.gender} (n={self.sample_count})"
+
+    @property
+    def p25(self):
+        return self.quantiles[25] if self.quantiles else None
+
+    @property
+    def median(self):
+        return self.quantiles[50] if self.quantiles else None
+
+    @property
+    def p75(self):
+        return self.quantiles[75] if self.quantiles else None
+
+
+class MetricSketch(models.Model):
+    """Fixed-bucket histogram of every user's 30-day average for one metric."""
+
+    metric = models.CharField(max_length=20, unique=True)
+    bin_edges = models.JSONField(default=list)
+    bin_counts = models.JSONField(default=list)
+    cumulative = models.JSONField(default=list)
+    total = models.PositiveIntegerField(default=0)
+    watermark = models.DateTimeField(null=True, blank=True)
+    window_start = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.metric} (n={self.total})"
+
+
+class UserMetricBucket(models.Model):
+    """A user's current contribution to a MetricSketch."""
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='metric_buckets')
+    metric = models.CharField(max_length=20)
+    bucket = models.PositiveIntegerField()
+    value = models.FloatField()
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'metric'], name='unique_user_metric_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.metric}: {self.value}"
+
+
 class FoodRecommendation(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     calories = models.IntegerField(null=True, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
     # Add more fields as needed
 
     def __str__(self):
@@ -311,6 +667,34 @@ class DailyReminderSetting(models.Model):
     reminder_time = models.TimeField()
     send_email = models.BooleanField(default=False)
     send_in_app = models.BooleanField(default=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.reminder_time} (Email: {self.send_email}, In-app: {self.send_in_app})"
+
+class OutboundEmail(models.Model):
+    """An email queued by tracker.mail.QueuedEmailBackend, delivered by send_queued_email."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    subject = models.TextField()
+    # The serialized message, see tracker.mail.serialize_message()
+    message = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outboundemail_due_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.reminder_time} (Email: {self.send_email}, In-app: {self.send_in_app})"
\ No newline at end of file
+        return f"{self.subject} ({self.get_status_display()})"
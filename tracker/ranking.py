@@ -0,0 +1,177 @@
+from bisect import bisect_right
+from datetime import timedelta
+from typing import Dict, Optional
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .cohorts import METRICS, WINDOW_DAYS, user_metric_averages
+from .models import HealthRecord, MetricSketch, UserMetricBucket
+
+# Fixed buckets per metric; finer than the cohort histograms because ranks
+# are interpolated within a single bucket
+BUCKET_EDGES = {
+    'sleep_hours': np.linspace(0, 24, 241),
+    'water_intake': np.linspace(0, 10, 201),
+    'weight': np.linspace(20, 300, 561),
+}
+
+CACHE_KEY = 'tracker:metric_sketches'
+
+# update_sketches() drops the cached sketches, but only in a cache shared
+# with the web workers; this bounds how long a per-process cache serves
+# sketches from before the last update
+CACHE_TIMEOUT = 300
+
+
+def bucket_index(metric: str, value: float) -> int:
+    edges = BUCKET_EDGES[metric]
+    index = int(np.searchsorted(edges, value, side='right')) - 1
+    return min(max(index, 0), len(edges) - 2)
+
+
+def _reset_sketch(sketch):
+    sketch.bin_edges = [float(edge) for edge in BUCKET_EDGES[sketch.metric]]
+    sketch.bin_counts = [0] * (len(BUCKET_EDGES[sketch.metric]) - 1)
+    return sketch
+
+
+def _affected_users(sketches, window_start, full):
+    """Users whose 30-day averages may have changed since the last run."""
+    if full:
+        return None
+    watermark = min((s.watermark for s in sketches.values() if s.watermark), default=None)
+    previous_start = min((s.window_start for s in sketches.values() if s.window_start), default=None)
+    if watermark is None or previous_start is None:
+        return None
+    changed = set(
+        HealthRecord.objects.filter(last_modified__gt=watermark)
+        .values_list('user_id', flat=True).distinct()
+    )
+    # Records that slid out of the window since the last run
+    changed.update(
+        HealthRecord.objects.filter(date__gte=previous_start, date__lt=window_start)
+        .values_list('user_id', flat=True).distinct()
+    )
+    return changed
+
+
+def update_sketches(full: bool = False) -> Dict[str, int]:
+    """
+    Bring the per-metric rank sketches up to date.
+
+    Incremental runs only recompute users with records modified since the
+    previous run or with records that aged out of the window, moving their
+    contribution between buckets. Deleted records are only picked up by a
+    full rebuild.
+
+    Args:
+        full: Recompute every user instead of just the changed ones
+
+    Returns:
+        dict: Users processed and bucket moves made
+    """
+    started = timezone.now()
+    window_start = timezone.localdate() - timedelta(days=WINDOW_DAYS)
+    sketches = {sketch.metric: sketch for sketch in MetricSketch.objects.filter(metric__in=METRICS)}
+    for metric in METRICS:
+        if metric not in sketches:
+            sketches[metric] = _reset_sketch(MetricSketch(metric=metric))
+
+    user_ids = _affected_users(sketches, window_start, full)
+    if user_ids is None:
+        full = True
+        for sketch in sketches.values():
+            _reset_sketch(sketch)
+
+    averages = user_metric_averages(window_start)
+    if not full:
+        averages = averages.filter(user_id__in=user_ids)
+    new_values = {row['user_id']: row for row in averages.iterator(chunk_size=5000)}
+
+    existing = UserMetricBucket.objects.all() if full else UserMetricBucket.objects.filter(user_id__in=user_ids)
+    current = {(b.user_id, b.metric): b for b in existing}
+
+    counts = {metric: list(sketches[metric].bin_counts) for metric in METRICS}
+    upserts, stale, moves = [], [], 0
+    for user_id in (new_values.keys() | {key[0] for key in current}):
+        row = new_values.get(user_id, {})
+        for metric in METRICS:
+            old = current.get((user_id, metric))
+            value = row.get(metric)
+            if old is not None and not full:
+                counts[metric][old.bucket] -= 1
+            if value is None:
+                if old is not None:
+                    stale.append(old.pk)
+                continue
+            bucket = bucket_index(metric, value)
+            counts[metric][bucket] += 1
+            moves += 1
+            upserts.append(UserMetricBucket(user_id=user_id, metric=metric, bucket=bucket, value=value))
+
+    with transaction.atomic():
+        if full:
+            UserMetricBucket.objects.all().delete()
+        elif stale:
+            UserMetricBucket.objects.filter(pk__in=stale).delete()
+        UserMetricBucket.objects.bulk_create(
+            upserts, batch_size=1000, update_conflicts=True,
+            unique_fields=['user', 'metric'], update_fields=['bucket', 'value', 'last_modified'],
+        )
+        for metric, sketch in sketches.items():
+            sketch.bin_counts = counts[metric]
+            sketch.cumulative = np.cumsum(counts[metric]).tolist()
+            sketch.total = sketch.cumulative[-1] if sketch.cumulative else 0
+            sketch.watermark = started
+            sketch.window_start = window_start
+            sketch.save()
+    cache.delete(CACHE_KEY)
+    return {'users': len(new_values.keys() | {key[0] for key in current}), 'moves': moves}
+
+
+def load_sketches() -> Dict[str, MetricSketch]:
+    sketches = cache.get(CACHE_KEY)
+    if sketches is None:
+        sketches = {sketch.metric: sketch for sketch in MetricSketch.objects.all()}
+        cache.set(CACHE_KEY, sketches, CACHE_TIMEOUT)
+    return sketches
+
+
+def percentile_rank(sketch: MetricSketch, value: float) -> Optional[float]:
+    """
+    Percentage of users whose average is below value, in O(log buckets).
+
+    Args:
+        sketch: MetricSketch with cumulative counts
+        value: The value to rank
+
+    Returns:
+        float: Percentile between 0 and 100, or None for an empty sketch
+    """
+    if not sketch.total:
+        return None
+    edges = sketch.bin_edges
+    index = min(max(bisect_right(edges, value) - 1, 0), len(edges) - 2)
+    below = sketch.cumulative[index - 1] if index else 0
+    width = edges[index + 1] - edges[index]
+    fraction = min(max((value - edges[index]) / width, 0.0), 1.0)
+    return round((below + fraction * sketch.bin_counts[index]) / sketch.total * 100, 1)
+
+
+def user_ranks(user) -> Dict[str, Dict]:
+    """
+    Rank a user's 30-day averages against everyone else's.
+
+    Reads the user's own stored averages and the cached sketches; no other
+    user's data is touched.
+    """
+    sketches = load_sketches()
+    ranks = {}
+    for bucket in UserMetricBucket.objects.filter(user=user):
+        sketch = sketches.get(bucket.metric)
+        rank = percentile_rank(sketch, bucket.value) if sketch else None
+        if rank is not None:
+            ranks[bucket.metric] = {'value': round(bucket.value, 2), 'percentile': rank, 'population': sketch.total}
+    return ranks
@@ -1,74 +1,242 @@
-from django.core.cache import cache
-from django.utils import timezone
-from datetime import timedelta
+from django.core.cache import caches
 import logging
+import math
+import threading
+import time
+
+ALGORITHMS = ('fixed_window', 'sliding_window', 'token_bucket')
+
+# A token bucket is only topped up once its client has fallen this far behind
+# (as a fraction of the limit), so clients below the rate mostly cost one
+# round-trip per check. Bursts may exceed the limit by this fraction.
+TOKEN_BUCKET_SLACK = 0.1
+
+# Previous-window counts and leases held per process
+MAX_MEMO_ENTRIES = 10000
+
 
 class RateLimiter:
-    """Rate limiting utility for API endpoints."""
-    
-    def __init__(self, key_prefix='rl_', cache_timeout=300):
+    """
+    Rate limiting utility for API endpoints.
+
+    Every algorithm is built on the cache's atomic `incr`/`add`, so checks
+    from concurrent workers sharing the cache never race, and an admitted
+    request costs a single cache round-trip:
+
+    - fixed_window: one counter per period-aligned window.
+    - sliding_window: the current window's counter plus the previous
+      window's count weighted by how much of it still overlaps the last
+      `period` seconds. The previous count no longer changes, so it is
+      fetched once per window and process. This approximates a sliding
+      log of timestamps by assuming the previous window's requests were
+      evenly spread, trading exactness (a burst at the end of the previous
+      window is under-counted) for O(1) memory and one round-trip.
+    - token_bucket: GCRA, storing the bucket's theoretical arrival time
+      in microseconds and advancing it with `incr`. While a client draws
+      on its burst, admitted requests also `touch` the key so it does not
+      expire before its arrival time.
+
+    With `lease_size` above 1 the limiter also keeps a local tier: a miss
+    takes up to that many tokens from the shared counter in one round-trip
+    and the following checks on the key are answered in-process until the
+    lease is spent or a period old. Leased tokens are counted when taken, so
+    within a window the workers together never admit more than the limit;
+    only tokens carried into the next window can exceed it, at most one
+    lease per worker. The lease is therefore capped so that this excess
+    stays within `max_overadmission` of the limit across `workers`.
+    """
+
+    def __init__(self, key_prefix='rl_', algorithm='sliding_window', cache_alias='default', clock=time.time,
+                 lease_size=1, max_overadmission=0.0, workers=1):
         """
         Initialize the rate limiter.
-        
+
         Args:
             key_prefix: Prefix for cache keys
-            cache_timeout: Cache timeout in seconds
+            algorithm: One of ALGORITHMS
+            cache_alias: Cache shared by every worker
+            clock: Returns the current time in seconds
+            lease_size: Most tokens a worker takes from the shared counter at once
+            max_overadmission: Fraction of the limit the workers may admit
+                beyond it together
+            workers: Number of processes sharing the cache
         """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
         self.key_prefix = key_prefix
-        self.cache_timeout = cache_timeout
+        self.algorithm = algorithm
+        self.cache_alias = cache_alias
+        self.clock = clock
+        self.lease_size = lease_size
+        self.max_overadmission = max_overadmission
+        self.workers = max(1, workers)
         self.logger = logging.getLogger('tracker.rate_limit')
-        
-    def generate_key(self, request, endpoint):
+        self._previous_counts = {}
+        self._leases = {}
+        self._lease_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def client_key(self, request, scope='user'):
+        """
+        Identify the client: 'u<id>' for signed-in users when scope is
+        'user', otherwise 'ip<address>'.
+        """
+        user = getattr(request, 'user', None)
+        if scope == 'user' and user is not None and user.is_authenticated:
+            return f'u{user.pk}'
+        return f"ip{request.META.get('REMOTE_ADDR', '')}"
+
+    def generate_key(self, request, endpoint, scope='user'):
         """Generate a unique cache key for the request."""
-        return f"{self.key_prefix}{endpoint}_{request.META.get('REMOTE_ADDR')}"
-        
-    def is_allowed(self, request, endpoint, limit, period):
+        return f"{self.key_prefix}{endpoint}:{self.client_key(request, scope)}"
+
+    def is_allowed(self, request, endpoint, limit, period, scope='user'):
         """
         Check if the request is allowed based on rate limits.
-        
+
         Args:
             request: Django request object
             endpoint: API endpoint name
             limit: Maximum number of requests allowed
             period: Time period in seconds
-            
+            scope: 'user' to count signed-in users by account and everyone
+                else by IP, or 'ip' to always count by IP
+
+        Returns:
+            tuple: (is_allowed, seconds until a request would be allowed)
+        """
+        allowed, retry_after = self.check(self.generate_key(request, endpoint, scope), limit, period)
+        if not allowed:
+            self.logger.warning(f"Rate limit exceeded for {endpoint} from {self.client_key(request, scope)}"
+                                f" - {retry_after:.0f} seconds remaining")
+        return allowed, retry_after
+
+    def check(self, key, limit, period, now=None):
+        """
+        Count one request against `key` and decide whether it is allowed.
+
         Returns:
-            tuple: (is_allowed, remaining_time)
+            tuple: (is_allowed, seconds until a request would be allowed)
+        """
+        now = self.clock() if now is None else now
+        size = self.lease_tokens(limit)
+        if size > 1:
+            with self._lease_lock:
+                lease = self._leases.get(key)
+                if lease is not None and lease[0] > 0 and now < lease[1]:
+                    lease[0] -= 1
+                    return True, 0
+
+        granted, retry_after = getattr(self, f'_{self.algorithm}')(key, limit, period, now, size)
+        if granted > 1:
+            with self._lease_lock:
+                if len(self._leases) >= MAX_MEMO_ENTRIES:
+                    self._leases.clear()
+                # A lease taken concurrently by another thread is dropped,
+                # which only ever admits less
+                self._leases[key] = [granted - 1, now + period]
+        return granted > 0, retry_after
+
+    def lease_tokens(self, limit):
+        """Tokens to take from the shared counter per round-trip for a limit."""
+        if self.lease_size <= 1:
+            return 1
+        bound = math.floor(limit * self.max_overadmission / self.workers)
+        return max(1, min(self.lease_size, bound))
+
+    def _incr(self, key, timeout, delta=1, initial=None):
+        """Atomically add delta, creating the counter with `initial` if it does not exist."""
+        cache = self.cache
+        initial = delta if initial is None else initial
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            if cache.add(key, initial, timeout):
+                return initial
+            # Another worker created it first
+            return cache.incr(key, delta)
+
+    def _lease_share(self, available, size):
         """
-        key = self.generate_key(request, endpoint)
-        
-        # Get current count and timestamp
-        data = cache.get(key, {'count': 0, 'timestamp': timezone.now().timestamp()})
-        current_count = data['count']
-        last_reset = data['timestamp']
-        
-        # Check if we need to reset the counter
-        if timezone.now().timestamp() - last_reset > period:
-            current_count = 0
-            last_reset = timezone.now().timestamp()
-            
-        # Check if we've reached the limit
-        if current_count >= limit:
-            remaining_time = period - (timezone.now().timestamp() - last_reset)
-            self.logger.warning(f"Rate limit exceeded for {endpoint} from {request.META.get('REMOTE_ADDR')}"
-                              f" - {remaining_time:.0f} seconds remaining")
-            return False, remaining_time
-            
-        # Update count
-        current_count += 1
-        cache.set(key, 
-                  {'count': current_count, 'timestamp': last_reset}, 
-                  self.cache_timeout)
-        
-        return True, 0
-        
-    def get_remaining_time(self, request, endpoint):
-        """Get remaining time until rate limit resets."""
-        key = self.generate_key(request, endpoint)
-        data = cache.get(key)
-        if not data:
+        Tokens to keep out of `available`: near the limit each worker only
+        leases its share, so others are not refused while tokens sit idle.
+        """
+        if available <= 0:
             return 0
-            
-        current_time = timezone.now().timestamp()
-        remaining_time = data['timestamp'] + self.cache_timeout - current_time
-        return max(0, remaining_time)
+        return min(size, math.ceil(available / self.workers))
+
+    # Each algorithm takes up to `size` tokens and returns
+    # (tokens granted, seconds until a request would be allowed)
+
+    def _fixed_window(self, key, limit, period, now, size=1):
+        window = int(now // period)
+        count = self._incr(f'{key}:{window}', period + 1, delta=size)
+        granted = self._lease_share(limit - (count - size), size)
+        if granted > 0:
+            if granted < size:
+                self.cache.decr(f'{key}:{window}', size - granted)
+            return granted, 0
+        return 0, (window + 1) * period - now
+
+    def _sliding_window(self, key, limit, period, now, size=1):
+        window = int(now // period)
+        elapsed = now - window * period
+        current_key = f'{key}:{window}'
+        count = self._incr(current_key, 2 * period + 1, delta=size)
+        previous = self._previous_count(key, window - 1)
+        weight = 1 - elapsed / period
+        granted = self._lease_share(math.floor(limit - previous * weight - (count - size)), size)
+        if granted > 0:
+            if granted < size:
+                self.cache.decr(current_key, size - granted)
+            return granted, 0
+
+        # Rejected requests are not counted, so they do not push the
+        # client's next window over the limit as well
+        self.cache.decr(current_key, size)
+        count -= size
+        if count >= limit or not previous:
+            return 0, period - elapsed
+        return 0, max(0.0, (1 - (limit - count) / previous) * period - elapsed)
+
+    def _previous_count(self, key, window):
+        memo = self._previous_counts.get(key)
+        if memo is not None and memo[0] == window:
+            return memo[1]
+        count = self.cache.get(f'{key}:{window}', 0)
+        if len(self._previous_counts) >= MAX_MEMO_ENTRIES:
+            self._previous_counts.clear()
+        self._previous_counts[key] = (window, count)
+        return count
+
+    def _token_bucket(self, key, limit, period, now, size=1):
+        interval = round(period * 1_000_000 / limit)
+        now_us = int(now * 1_000_000)
+        period_us = period * 1_000_000
+        cache = self.cache
+
+        # The arrival time is worthless once it has passed: an expired key
+        # is recreated as the full bucket it stood for. Admission keeps it
+        # within `period` of now, so 2 * period outlives it.
+        timeout = 2 * period
+        arrival = self._incr(key, timeout, delta=size * interval, initial=now_us + size * interval)
+        start = arrival - size * interval
+        if start < now_us - max(1, math.floor(limit * TOKEN_BUCKET_SLACK)) * interval:
+            # The client has been below the rate: refill the bucket to full.
+            # Concurrent refills can overshoot, which only ever admits less.
+            cache.incr(key, now_us - start)
+            start = now_us
+        granted = self._lease_share(int((now_us + period_us - start) // interval), size)
+        if granted > 0:
+            if granted < size:
+                cache.decr(key, (size - granted) * interval)
+            if start > now_us:
+                # Drawing on the burst: keep the key until its arrival time has passed
+                cache.touch(key, timeout)
+            return granted, 0
+
+        cache.decr(key, size * interval)
+        return 0, (start + interval - now_us - period_us) / 1_000_000
@@ -0,0 +1,113 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+import gzip
+import json
+import os
+
+from .models import Notification
+
+# Columns written to notification archives, one JSON object per line
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'type', 'title', 'message', 'is_read', 'occurrences',
+    'created_at', 'scheduled_for', 'last_modified',
+)
+
+
+def compact_notifications(since=None, batch_size=500):
+    """
+    Merge notifications of Notification.COMPACTED_TYPES into one row per
+    user, type and day, as Notification.objects.notify() does when it
+    writes them.
+
+    Each group keeps its newest unread row, or its newest row if all were
+    read, with the group's occurrences summed. The other rows are deleted
+    through the queryset, so unread counters follow.
+
+    Args:
+        since: Only compact notifications created at or after this datetime
+        batch_size: Groups merged per transaction
+
+    Returns:
+        int: Rows deleted
+    """
+    notifications = Notification.objects.filter(type__in=Notification.COMPACTED_TYPES)
+    if since is not None:
+        notifications = notifications.filter(created_at__gte=since)
+    groups = (
+        notifications.annotate(day=TruncDate('created_at')).order_by()
+        .values('user_id', 'type', 'day')
+        .annotate(rows=Count('pk'), total=Sum('occurrences'),
+                  keep=Coalesce(Max('pk', filter=Q(is_read=False)), Max('pk')))
+        .filter(rows__gt=1)
+    )
+    removed = 0
+    while True:
+        batch = list(groups[:batch_size])
+        if not batch:
+            return removed
+        duplicates = Q()
+        kept_by_total = defaultdict(list)
+        for group in batch:
+            duplicates |= Q(user_id=group['user_id'], type=group['type'], created_at__date=group['day'])
+            kept_by_total[group['total']].append(group['keep'])
+        kept = [pk for pks in kept_by_total.values() for pk in pks]
+        with transaction.atomic():
+            deleted = notifications.filter(duplicates).exclude(pk__in=kept).delete()[0]
+            for total, pks in kept_by_total.items():
+                Notification.objects.filter(pk__in=pks).update(occurrences=total, last_modified=timezone.now())
+        if not deleted:
+            return removed
+        removed += deleted
+
+
+def archive_notifications(older_than_days=None, archive_dir=None, batch_size=1000):
+    """
+    Move read notifications older than `older_than_days` out of the table,
+    into a gzipped JSON lines file under `archive_dir`.
+
+    Rows are walked in primary key order and deleted `batch_size` at a
+    time, each chunk in its own short transaction after it was written to
+    the archive. An interrupted run therefore loses nothing; at worst the
+    next run archives a chunk again.
+
+    Args:
+        older_than_days: Age in days (defaults to settings.NOTIFICATION_RETENTION_DAYS)
+        archive_dir: Directory of the archives (defaults to settings.NOTIFICATION_ARCHIVE_DIR)
+        batch_size: Rows deleted per statement
+
+    Returns:
+        tuple: (rows archived, path of the archive or None if there were none)
+    """
+    if older_than_days is None:
+        older_than_days = settings.NOTIFICATION_RETENTION_DAYS
+    archive_dir = str(archive_dir or settings.NOTIFICATION_ARCHIVE_DIR)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=timezone.now() - timedelta(days=older_than_days))
+
+    archived = 0
+    path = None
+    archive = None
+    last_id = 0
+    try:
+        while True:
+            rows = list(expired.filter(pk__gt=last_id).order_by('pk').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            if archive is None:
+                os.makedirs(archive_dir, exist_ok=True)
+                path = os.path.join(archive_dir, f'notifications-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz')
+                archive = gzip.open(path, 'at', encoding='utf-8')
+            archive.writelines(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+            archive.flush()
+            last_id = rows[-1]['id']
+            expired.filter(pk__in=[row['id'] for row in rows]).delete()
+            archived += len(rows)
+    finally:
+        if archive is not None:
+            archive.close()
+    return archived, path
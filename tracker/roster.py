@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+from django.core import signing
+from django.db.models import Avg, DateField, F, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CustomUser, HealthRecord
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Range of the inactive_days filter; larger values would overflow the date
+MAX_INACTIVE_DAYS = 3650
+
+# Sortable annotated columns and the sentinel used for patients without data,
+# so that keyset comparisons never have to deal with NULLs
+SORT_FIELDS = {
+    'last_logged': (DateField(), date(1900, 1, 1)),
+    'avg_sleep_7d': (FloatField(), -1.0),
+    'avg_water_7d': (FloatField(), -1.0),
+    'latest_weight': (FloatField(), -1.0),
+}
+
+# Query parameter -> lookup on an annotated column
+FILTERS = {
+    'min_sleep': 'avg_sleep_7d__gte',
+    'max_sleep': 'avg_sleep_7d__lte',
+    'min_water': 'avg_water_7d__gte',
+    'max_water': 'avg_water_7d__lte',
+    'min_weight': 'latest_weight__gte',
+    'max_weight': 'latest_weight__lte',
+}
+
+CURSOR_SALT = 'tracker.roster'
+
+
+def _weekly_average(field, since):
+    return Subquery(
+        HealthRecord.objects.filter(user=OuterRef('pk'), date__gte=since)
+        .values('user')
+        .annotate(avg=Avg(field))
+        .values('avg')[:1],
+        output_field=FloatField(),
+    )
+
+
+def annotated_patients():
+    """
+    Patients annotated with their latest record and 7-day averages.
+
+    Every annotation is a correlated subquery served by the (user, -date)
+    index, so the whole roster page is fetched in a single query.
+    """
+    latest = HealthRecord.objects.filter(user=OuterRef('pk')).order_by('-date', '-id')
+    week_ago = timezone.localdate() - timedelta(days=7)
+    return CustomUser.objects.filter(role=CustomUser.Role.PATIENT, is_active=True).annotate(
+        last_logged=Subquery(latest.values('date')[:1]),
+        latest_sleep=Subquery(latest.values('sleep_hours')[:1]),
+        latest_water=Subquery(latest.values('water_intake')[:1]),
+        latest_weight=Subquery(latest.values('weight')[:1]),
+        latest_mood=Subquery(latest.values('mood')[:1]),
+        avg_sleep_7d=_weekly_average('sleep_hours', week_ago),
+        avg_water_7d=_weekly_average('water_intake', week_ago),
+    )
+
+
+def encode_cursor(sort, descending, value, pk):
+    if isinstance(value, date):
+        value = value.isoformat()
+    return signing.dumps([sort, descending, value, pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, sort, descending):
+    """Return (value, pk) from a cursor, or None if it is invalid or for another sort or order."""
+    try:
+        cursor_sort, cursor_descending, value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_sort != sort or cursor_descending != descending:
+        return None
+    if isinstance(SORT_FIELDS[sort][0], DateField):
+        value = date.fromisoformat(value)
+    return value, pk
+
+
+def roster_page(params):
+    """
+    One keyset-paginated page of the patient roster.
+
+    Args:
+        params: Mapping of query parameters (sort, order, cursor, size, q and FILTERS keys)
+
+    Returns:
+        dict: patients, next_cursor, sort and order
+    """
+    sort = params.get('sort') if params.get('sort') in SORT_FIELDS else 'last_logged'
+    descending = params.get('order', 'desc') != 'asc'
+    try:
+        size = max(1, min(int(params.get('size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        size = DEFAULT_PAGE_SIZE
+
+    output_field, sentinel = SORT_FIELDS[sort]
+    patients = annotated_patients().annotate(
+        sort_key=Coalesce(F(sort), Value(sentinel), output_field=output_field)
+    )
+
+    if params.get('q'):
+        patients = patients.filter(Q(username__icontains=params['q']) | Q(email__icontains=params['q']))
+    if params.get('inactive_days'):
+        try:
+            days = max(1, min(int(params['inactive_days']), MAX_INACTIVE_DAYS))
+            cutoff = timezone.localdate() - timedelta(days=days)
+        except (ValueError, OverflowError):
+            cutoff = None
+        if cutoff:
+            patients = patients.filter(Q(last_logged__lt=cutoff) | Q(last_logged__isnull=True))
+    for param, lookup in FILTERS.items():
+        try:
+            bound = float(params[param]) if params.get(param) not in (None, '') else None
+        except ValueError:
+            bound = None
+        if bound is not None:
+            patients = patients.filter(**{lookup: bound})
+
+    position = decode_cursor(params['cursor'], sort, descending) if params.get('cursor') else None
+    if position:
+        value, pk = position
+        if descending:
+            patients = patients.filter(Q(sort_key__lt=value) | Q(sort_key=value, id__lt=pk))
+        else:
+            patients = patients.filter(Q(sort_key__gt=value) | Q(sort_key=value, id__gt=pk))
+
+    ordering = ['-sort_key', '-id'] if descending else ['sort_key', 'id']
+    rows = list(patients.order_by(*ordering)[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(sort, descending, rows[-1].sort_key, rows[-1].pk)
+
+    return {
+        'patients': rows,
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'order': 'desc' if descending else 'asc',
+    }
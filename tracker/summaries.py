@@ -0,0 +1,161 @@
+from datetime import datetime, time, timedelta
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Avg, Count, F, Q
+from django.utils import timezone
+
+from .models import HealthRecord, Notification
+
+MOODS = [mood.value for mood in HealthRecord.Mood]
+
+
+def week_title(week_end):
+    """Title of a week's summary; unique per week, so it also marks the week as done."""
+    week_start = week_end - timedelta(days=6)
+    return f'Your week: {week_start:%b} {week_start.day} - {week_end:%b} {week_end.day}, {week_end.year}'
+
+
+def summary_rows(week_end):
+    """
+    Weekly figures for every user with records in the 7 days ending on
+    `week_end`, in one grouped query.
+
+    Both weeks are read in a single pass over the records, using
+    conditional aggregates for the current and the previous week.
+
+    Returns:
+        QuerySet: dicts of user fields plus averages, goal hits and mood counts
+    """
+    week_start = week_end - timedelta(days=6)
+    this_week = Q(date__gte=week_start)
+    last_week = Q(date__lt=week_start)
+    aggregates = {
+        'records': Count('pk', filter=this_week),
+        'avg_sleep': Avg('sleep_hours', filter=this_week),
+        'avg_water': Avg('water_intake', filter=this_week),
+        'avg_weight': Avg('weight', filter=this_week),
+        'prev_sleep': Avg('sleep_hours', filter=last_week),
+        'prev_water': Avg('water_intake', filter=last_week),
+        'prev_weight': Avg('weight', filter=last_week),
+        'sleep_hits': Count('pk', filter=this_week & Q(sleep_hours__gte=F('user__sleep_goal'))),
+        'water_hits': Count('pk', filter=this_week & Q(water_intake__gte=F('user__water_goal'))),
+        **{f'mood_{mood}': Count('pk', filter=this_week & Q(mood=mood)) for mood in MOODS},
+    }
+    return (
+        HealthRecord.objects.filter(date__range=(week_start - timedelta(days=7), week_end))
+        .order_by()
+        .values('user_id', 'user__username', 'user__first_name', 'user__last_name', 'user__email',
+                'user__sleep_goal', 'user__water_goal', 'user__reminder_setting__send_email')
+        .annotate(**aggregates)
+        .filter(records__gt=0)
+    )
+
+
+def _average(current, previous, unit):
+    text = f'{current:.1f} {unit} average'
+    if previous is not None:
+        text += f' ({current - previous:+.1f} vs last week)'
+    return text
+
+
+def render_summary(row):
+    """The message of one summary_rows() row."""
+    days = row['records']
+    lines = [f"{days} {'entry' if days == 1 else 'entries'} logged this week."]
+
+    sleep = 'Sleep: ' + _average(row['avg_sleep'], row['prev_sleep'], 'h')
+    if row['user__sleep_goal']:
+        sleep += f", goal met {row['sleep_hits']} of {days} days"
+    lines.append(sleep + '.')
+
+    water = 'Water: ' + _average(row['avg_water'], row['prev_water'], 'L')
+    if row['user__water_goal']:
+        water += f", goal met {row['water_hits']} of {days} days"
+    lines.append(water + '.')
+
+    if row['avg_weight'] is not None:
+        lines.append('Weight: ' + _average(row['avg_weight'], row['prev_weight'], 'kg') + '.')
+
+    moods = [f"{row[f'mood_{mood}']} {label.lower()}" for mood, label in HealthRecord.Mood.choices
+             if row[f'mood_{mood}']]
+    lines.append('Mood: ' + ', '.join(moods) + '.')
+    return '\n'.join(lines)
+
+
+def send_weekly_summaries(week_end=None, batch_size=1000, email=True):
+    """
+    Create a WEEKLY_SUMMARY notification for every user who logged records
+    in the week ending on `week_end`, and email it to users who opted in to
+    reminder emails.
+
+    Rows are streamed from summary_rows(). Each batch costs one indexed
+    lookup of users already summarised for the week (by its title, so
+    backfilling an older week works), so reruns add nothing, and one
+    bulk_create(). Emails go through one connection of the email
+    backend: one insert per batch with the email queue.
+
+    Args:
+        week_end: Last day of the week (defaults to yesterday)
+        batch_size: Users per bulk insert
+        email: Whether to send emails
+
+    Returns:
+        dict: notifications created and emails sent
+    """
+    if week_end is None:
+        week_end = timezone.localdate() - timedelta(days=1)
+    title = week_title(week_end)
+    # Summaries for this week can only have been created after it ended
+    created_since = timezone.make_aware(datetime.combine(week_end + timedelta(days=1), time.min))
+    result = {'notifications': 0, 'emails': 0}
+
+    connection = None
+    if email:
+        # Opened here, so that send_messages() reuses it instead of
+        # connecting for every batch
+        connection = get_connection(fail_silently=True)
+        connection.open()
+
+    def flush(batch):
+        done = set(Notification.objects.filter(
+            user_id__in=[row['user_id'] for row in batch],
+            type=Notification.NotificationType.WEEKLY_SUMMARY,
+            title=title,
+            created_at__gte=created_since,
+        ).order_by().values_list('user_id', flat=True))
+        notifications = []
+        messages = []
+        for row in batch:
+            if row['user_id'] in done:
+                continue
+            message = render_summary(row)
+            notifications.append(Notification(
+                user_id=row['user_id'],
+                type=Notification.NotificationType.WEEKLY_SUMMARY,
+                title=title,
+                message=message,
+            ))
+            if connection is not None and row['user__reminder_setting__send_email'] and row['user__email']:
+                name = ' '.join(filter(None, [row['user__first_name'], row['user__last_name']])) or row['user__username']
+                messages.append(EmailMessage(
+                    subject=title,
+                    body=f'Hi {name},\n\nHere is your health summary for the week.\n\n{message}\n',
+                    to=[row['user__email']],
+                ))
+        Notification.objects.bulk_create(notifications, batch_size=batch_size)
+        result['notifications'] += len(notifications)
+        if messages:
+            result['emails'] += connection.send_messages(messages) or 0
+
+    try:
+        batch = []
+        for row in summary_rows(week_end).iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if connection is not None:
+            connection.close()
+    return result
@@ -5,6 +5,10 @@ from django.core.exceptions import ValidationError
 from .models import HealthRecord, CustomUser
 from datetime import datetime, timedelta
 import base64
+import os
+import shutil
+import tempfile
+from io import StringIO
 
 @override_settings(
     STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
@@ -191,3 +195,1465 @@ class HealthTrackerTests(TestCase):
         response = self.client.get(reverse('dashboard'))
         self.assertEqual(response.status_code, 200)
         self.assertTrue('records' in response.context)
+
+
+class AnomalyDetectionTests(TestCase):
+    def setUp(self):
+        self.patient = get_user_model().objects.create_user(
+            username='patient', email='patient@example.com', password='TestPass123!'
+        )
+        self.doctor = get_user_model().objects.create_user(
+            username='doc', email='doc@example.com', password='TestPass123!',
+            role=CustomUser.Role.DOCTOR
+        )
+
+    def test_rolling_scores_flag_sleep_collapse(self):
+        from .anomaly import detect_metric_anomalies
+        values = [7.5, 8, 7.8, 8.2, 7.9, 8, 7.6, 8.1, 2]
+        anomalies = detect_metric_anomalies('sleep_hours', values, window=7)
+        self.assertEqual([a['index'] for a in anomalies], [8])
+        self.assertEqual(anomalies[0]['method'], 'MAD')
+
+    def test_weight_swing_flagged_without_baseline(self):
+        from .anomaly import detect_metric_anomalies
+        anomalies = detect_metric_anomalies('weight', [80, 86], window=7)
+        self.assertEqual(anomalies[0]['method'], 'SWING')
+
+    def test_command_writes_flags_and_notifies_doctors(self):
+        from django.core.management import call_command
+        from .models import HealthAnomaly, Notification
+        for sleep in [8, 7.5, 8, 8.2, 7.8, 8, 7.9, 1.5]:
+            HealthRecord.objects.create(user=self.patient, sleep_hours=sleep, water_intake=2, mood='GOOD')
+
+        call_command('detect_anomalies', '--window', '5', '--workers', '2', stdout=StringIO())
+        self.assertEqual(HealthAnomaly.objects.filter(metric='sleep_hours').count(), 1)
+        alerts = Notification.objects.filter(user=self.doctor, type=Notification.NotificationType.ANOMALY_ALERT)
+        self.assertEqual(alerts.count(), 1)
+
+        # A second run must not duplicate flags or alerts
+        call_command('detect_anomalies', '--window', '5', stdout=StringIO())
+        self.assertEqual(HealthAnomaly.objects.count(), 1)
+        self.assertEqual(alerts.count(), 1)
+
+    def test_doctors_get_one_digest_per_run(self):
+        from django.core.management import call_command
+        from .models import Notification
+        get_user_model().objects.create_user(
+            username='doc2', email='doc2@example.com', password='TestPass123!', role=CustomUser.Role.DOCTOR
+        )
+        patients = [self.patient] + [
+            get_user_model().objects.create_user(
+                username=f'patient{i}', email=f'patient{i}@example.com', password='TestPass123!'
+            )
+            for i in range(2)
+        ]
+        for patient in patients:
+            for sleep in [8, 7.5, 8, 8.2, 7.8, 8, 7.9, 1.5]:
+                HealthRecord.objects.create(user=patient, sleep_hours=sleep, water_intake=2, mood='GOOD')
+
+        out = StringIO()
+        call_command('detect_anomalies', '--window', '5', stdout=out)
+        self.assertIn('sent 2 doctor notifications', out.getvalue())
+        alerts = Notification.objects.filter(type=Notification.NotificationType.ANOMALY_ALERT)
+        self.assertEqual(alerts.count(), 2)
+        alert = alerts.get(user=self.doctor)
+        self.assertEqual(alert.title, 'Abnormal readings for 3 patient(s)')
+        for patient in patients:
+            self.assertIn(f'{patient.username}: sleep hours 1.5', alert.message)
+
+
+class WeightForecastTests(TestCase):
+    def test_incremental_update_matches_full_refit(self):
+        from datetime import date
+        from .forecast import fit_weight_trend, update_weight_trend
+        dates = [date(2025, 1, 1) + timedelta(days=d) for d in (0, 2, 3, 7, 10)]
+        weights = [90, 89.6, 89.5, 88.9, 88.2]
+
+        stats = fit_weight_trend(dates[:1], weights[:1])
+        for previous, current, weight in zip(dates, dates[1:], weights[1:]):
+            stats = update_weight_trend(stats, (current - previous).days, weight)
+
+        expected = fit_weight_trend(dates, weights)
+        for field, value in expected.items():
+            self.assertAlmostEqual(stats[field], value, places=6)
+
+    def test_projection_estimates_goal_date(self):
+        from datetime import date
+        from .forecast import fit_weight_trend, project_goal
+        dates = [date(2025, 1, 1) + timedelta(days=d) for d in range(0, 28, 2)]
+        weights = [90 - 0.1 * d + (0.2 if d % 4 else -0.2) for d in range(0, 28, 2)]
+
+        forecast = project_goal(fit_weight_trend(dates, weights), 85, dates[-1])
+        self.assertLess(forecast['weekly_change'], 0)
+        self.assertLessEqual(forecast['eta_earliest'], forecast['eta'])
+        self.assertLessEqual(forecast['eta'], forecast['eta_latest'])
+
+        # Moving away from the goal never produces a date
+        self.assertIsNone(project_goal(fit_weight_trend(dates, weights), 95, dates[-1])['eta'])
+
+    def test_trend_cached_and_refreshed_on_save(self):
+        from .models import WeightTrend
+        user = get_user_model().objects.create_user(
+            username='dieter', email='dieter@example.com', password='TestPass123!'
+        )
+        record = HealthRecord.objects.create(user=user, sleep_hours=8, water_intake=2, mood='GOOD', weight=90)
+        HealthRecord.objects.create(user=user, sleep_hours=8, water_intake=2, mood='GOOD', weight=89)
+        trend = WeightTrend.objects.get(user=user)
+        self.assertEqual(trend.reading_count, 2)
+        self.assertAlmostEqual(trend.sum_y, 179)
+
+        record.weight = 91
+        record.save()
+        self.assertTrue(WeightTrend.objects.get(user=user).needs_refit)
+        self.assertAlmostEqual(WeightTrend.for_user(user).sum_y, 180)
+
+    def test_concurrent_readings_are_not_lost(self):
+        from unittest.mock import patch
+        from .models import WeightTrend
+        user = get_user_model().objects.create_user(
+            username='dora', email='dora@example.com', password='TestPass123!'
+        )
+        HealthRecord.objects.create(user=user, sleep_hours=8, water_intake=2, mood='GOOD', weight=90)
+        # A second save that read the trend before this one's reading landed
+        stale = WeightTrend.objects.get(user=user)
+        HealthRecord.objects.create(user=user, sleep_hours=8, water_intake=2, mood='GOOD', weight=89)
+        with patch.object(WeightTrend.objects, 'get_or_create', return_value=(stale, False)):
+            HealthRecord.objects.create(user=user, sleep_hours=8, water_intake=2, mood='GOOD', weight=88)
+        trend = WeightTrend.objects.get(user=user)
+        self.assertEqual(trend.reading_count, 3)
+        self.assertAlmostEqual(trend.sum_y, 267)
+
+
+class CohortAnalyticsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.doctor = User.objects.create_user(
+            username='doc', email='doc@example.com', password='TestPass123!',
+            role=CustomUser.Role.DOCTOR
+        )
+        self.patients = []
+        for i, sleep in enumerate([5, 6, 7, 8, 9]):
+            patient = User.objects.create_user(
+                username=f'p{i}', email=f'p{i}@example.com', password='TestPass123!',
+                age=35, gender='F'
+            )
+            HealthRecord.objects.create(user=patient, sleep_hours=sleep, water_intake=2, mood='GOOD')
+            self.patients.append(patient)
+
+    def test_build_and_lookup_percentile(self):
+        from .cohorts import build_cohort_statistics, cohort_position
+        from .models import CohortStatistic
+        build_cohort_statistics()
+        stat = CohortStatistic.objects.get(metric='sleep_hours', age_band='30-44', gender='F')
+        self.assertEqual(stat.sample_count, 5)
+        self.assertEqual(sum(stat.bin_counts), 5)
+
+        position = cohort_position(self.patients[2])
+        self.assertEqual(position['sleep_hours']['percentile'], 50.0)
+        self.assertEqual(position['sleep_hours']['cohort']['age_band'], CohortStatistic.ALL)
+
+    def test_api_restricted_to_doctors(self):
+        from .cohorts import build_cohort_statistics
+        build_cohort_statistics()
+        url = reverse('cohort_position', args=[self.patients[4].id])
+
+        self.client.login(username='p0', password='TestPass123!')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.login(username='doc', password='TestPass123!')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['metrics']['sleep_hours']['percentile'], 100.0)
+
+        response = self.client.get(reverse('cohort_analytics'), {'patient': self.patients[4].id})
+        self.assertContains(response, 'p4 versus cohort')
+        response = self.client.get(reverse('cohort_analytics'), {'patient': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_only_patients_in_population(self):
+        from .cohorts import build_cohort_statistics
+        from .models import CohortStatistic
+        self.doctor.age, self.doctor.gender = 35, 'F'
+        self.doctor.save()
+        HealthRecord.objects.create(user=self.doctor, sleep_hours=4, water_intake=2, mood='GOOD')
+        build_cohort_statistics()
+        stat = CohortStatistic.objects.get(metric='sleep_hours', age_band=CohortStatistic.ALL, gender=CohortStatistic.ALL)
+        self.assertEqual(stat.sample_count, 5)
+
+
+class PatientRosterTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.doctor = User.objects.create_user(
+            username='doc', email='doc@example.com', password='TestPass123!',
+            role=CustomUser.Role.DOCTOR
+        )
+        for i in range(5):
+            patient = User.objects.create_user(
+                username=f'patient{i}', email=f'patient{i}@example.com', password='TestPass123!'
+            )
+            if i < 4:
+                HealthRecord.objects.create(user=patient, sleep_hours=4 + i, water_intake=2, mood='GOOD', weight=70 + i)
+
+    def test_single_query_and_keyset_pages(self):
+        from .roster import roster_page
+        with self.assertNumQueries(1):
+            page = roster_page({'sort': 'avg_sleep_7d', 'size': '2'})
+        self.assertEqual([p.username for p in page['patients']], ['patient3', 'patient2'])
+        self.assertEqual(page['patients'][0].latest_weight, 73)
+
+        page = roster_page({'sort': 'avg_sleep_7d', 'size': '2', 'cursor': page['next_cursor']})
+        self.assertEqual([p.username for p in page['patients']], ['patient1', 'patient0'])
+        page = roster_page({'sort': 'avg_sleep_7d', 'size': '2', 'cursor': page['next_cursor']})
+        self.assertEqual([p.username for p in page['patients']], ['patient4'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_cursor_tied_to_order(self):
+        from .roster import roster_page
+        cursor = roster_page({'sort': 'avg_sleep_7d', 'size': '2', 'order': 'asc'})['next_cursor']
+        # A cursor from the ascending roster starts a descending one over
+        page = roster_page({'sort': 'avg_sleep_7d', 'size': '2', 'order': 'desc', 'cursor': cursor})
+        self.assertEqual([p.username for p in page['patients']], ['patient3', 'patient2'])
+        page = roster_page({'sort': 'avg_sleep_7d', 'size': '2', 'order': 'asc', 'cursor': cursor})
+        self.assertEqual([p.username for p in page['patients']], ['patient1', 'patient2'])
+
+    def test_filters_on_annotations(self):
+        from .roster import roster_page
+        page = roster_page({'max_sleep': '5'})
+        self.assertEqual({p.username for p in page['patients']}, {'patient0', 'patient1'})
+        page = roster_page({'inactive_days': '3'})
+        self.assertEqual([p.username for p in page['patients']], ['patient4'])
+        # Out-of-range values are clamped instead of overflowing the date
+        page = roster_page({'inactive_days': '99999999999'})
+        self.assertEqual([p.username for p in page['patients']], ['patient4'])
+        page = roster_page({'inactive_days': '-5'})
+        self.assertEqual([p.username for p in page['patients']], ['patient4'])
+
+    def test_view_requires_doctor(self):
+        self.client.login(username='patient0', password='TestPass123!')
+        self.assertEqual(self.client.get(reverse('patient_roster')).status_code, 403)
+        self.client.login(username='doc', password='TestPass123!')
+        response = self.client.get(reverse('patient_roster'), {'size': 2})
+        self.assertContains(response, 'Next page')
+
+
+class PercentileRankingTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.users = []
+        for i, water in enumerate([1.0, 2.0, 3.0, 4.0]):
+            user = User.objects.create_user(
+                username=f'drinker{i}', email=f'drinker{i}@example.com', password='TestPass123!'
+            )
+            HealthRecord.objects.create(user=user, sleep_hours=8, water_intake=water, mood='GOOD')
+            self.users.append(user)
+
+    def test_rank_from_sketch(self):
+        from .ranking import update_sketches, user_ranks
+        update_sketches()
+        ranks = user_ranks(self.users[2])
+        self.assertEqual(ranks['water_intake']['population'], 4)
+        self.assertEqual(ranks['water_intake']['percentile'], 50.0)
+
+    def test_incremental_update_moves_only_changed_users(self):
+        from .models import MetricSketch
+        from .ranking import update_sketches, user_ranks
+        update_sketches()
+        record = HealthRecord.objects.get(user=self.users[0])
+        record.water_intake = 5.0
+        record.save()
+
+        result = update_sketches()
+        self.assertEqual(result['users'], 1)
+        self.assertEqual(MetricSketch.objects.get(metric='water_intake').total, 4)
+        self.assertEqual(user_ranks(self.users[0])['water_intake']['percentile'], 75.0)
+
+    def test_cached_sketches_expire(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from .ranking import CACHE_KEY, CACHE_TIMEOUT, load_sketches, update_sketches
+        update_sketches()
+        # Workers that update_sketches() cannot reach reload after CACHE_TIMEOUT
+        with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            load_sketches()
+        cache_set.assert_called_once()
+        self.assertEqual(cache_set.call_args.args[0], CACHE_KEY)
+        self.assertEqual(cache_set.call_args.args[2], CACHE_TIMEOUT)
+
+    def test_export_summary_shows_rank(self):
+        from .ranking import update_sketches
+        update_sketches()
+        self.client.login(username='drinker3', password='TestPass123!')
+        response = self.client.get(reverse('export_summary'))
+        self.assertContains(response, 'Water intake: higher than 75.0% of users')
+
+
+class BackupTests(TestCase):
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir, True)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, BACKUP_RETENTION={'last': 10}, BACKUP_COMPRESSION='gzip')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(
+            username='backup', email='backup@example.com', password='TestPass123!'
+        )
+        self.record = HealthRecord.objects.create(user=self.user, sleep_hours=7, water_intake=2, mood='GOOD')
+
+    def test_incremental_backup_reuses_unchanged_chunks(self):
+        import json
+        from .backup import BackupManager
+        from .models import Notification
+        Notification.objects.create(user=self.user, type='REMINDER', title='Hi', message='Hello')
+        manager = BackupManager(self.backup_dir)
+        first = manager.create_backup()
+        # Nothing changed: every blob is already stored
+        manager.create_backup()
+        self.assertEqual(manager.list_backups()[0]['stored'], 0)
+
+        self.record.sleep_hours = 9
+        self.record.save()
+        manager.create_backup(incremental=True)
+        latest = manager.latest_snapshot()
+        with open(first) as f:
+            full = json.load(f)
+
+        self.assertEqual(latest['info']['backup_type'], 'incremental')
+        records = 'database/tracker.healthrecord/00000000.jsonl'
+        notifications = 'database/tracker.notification/00000000.jsonl'
+        self.assertNotEqual(latest['entries'][records]['sha256'], full['entries'][records]['sha256'])
+        self.assertEqual(latest['entries'][notifications], full['entries'][notifications])
+
+    def test_incremental_backup_sees_queryset_updates(self):
+        import json
+        from .backup import BackupManager
+        record = HealthRecord.objects.create(user=self.user, sleep_hours=7, water_intake=2, mood='GOOD', weight=80)
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+        # The trend is only flagged through QuerySet.update()
+        record.weight = 78
+        record.save()
+        manager.create_backup(incremental=True)
+        entry = manager.latest_snapshot()['entries']['database/tracker.weighttrend/00000000.jsonl']
+        row = json.loads(manager.blob_store().read(entry['sha256']))
+        self.assertTrue(row['fields']['needs_refit'])
+
+    def test_restore_incremental_snapshot(self):
+        from .backup import BackupManager
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+        self.record.sleep_hours = 9
+        self.record.save()
+        incremental = manager.create_backup(incremental=True)
+
+        HealthRecord.objects.all().delete()
+        manager.restore_backup(incremental)
+        self.assertEqual(HealthRecord.objects.get(pk=self.record.pk).sleep_hours, 9)
+
+    def test_media_deduplicated_and_restored(self):
+        import hashlib
+        from .backup import BackupManager
+        os.makedirs(os.path.join(self.media_root, 'avatars'))
+        for name in ('a.png', 'b.png'):
+            with open(os.path.join(self.media_root, 'avatars', name), 'wb') as f:
+                f.write(b'png')
+        manager = BackupManager(self.backup_dir)
+        backup = manager.create_backup()
+        manager.create_backup()
+        self.assertEqual(len([d for d, _ in manager.blob_store() if d == hashlib.sha256(b'png').hexdigest()]), 1)
+
+        shutil.rmtree(self.media_root)
+        with self.captureOnCommitCallbacks(execute=True):
+            manager.restore_backup(backup)
+        with open(os.path.join(self.media_root, 'avatars', 'b.png'), 'rb') as f:
+            self.assertEqual(f.read(), b'png')
+
+    def test_failed_snapshot_restore_keeps_media(self):
+        from unittest.mock import patch
+        from django.core.exceptions import ValidationError
+        from django.db import IntegrityError, connection
+        from .backup import BackupManager
+        os.makedirs(os.path.join(self.media_root, 'avatars'))
+        with open(os.path.join(self.media_root, 'avatars', 'a.png'), 'wb') as f:
+            f.write(b'png')
+        manager = BackupManager(self.backup_dir)
+        backup = manager.create_backup()
+        os.rename(os.path.join(self.media_root, 'avatars', 'a.png'), os.path.join(self.media_root, 'avatars', 'c.png'))
+
+        # Fail the constraint check, which runs after the media has been extracted
+        with patch.object(connection, 'check_constraints', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ValidationError):
+                manager.restore_backup(backup)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'avatars')), ['c.png'])
+
+    def test_bulk_restore_bypasses_save_and_keeps_timestamps(self):
+        from .backup import BackupManager
+        from .models import Notification
+        HealthRecord.objects.filter(pk=self.record.pk).update(date=datetime(2024, 1, 1).date(), weight=80, weight_goal=75)
+        manager = BackupManager(self.backup_dir)
+        backup = manager.create_backup()
+
+        HealthRecord.objects.all().delete()
+        Notification.objects.all().delete()
+        counts = manager.restore_backup(backup)
+
+        restored = HealthRecord.objects.get(pk=self.record.pk)
+        self.assertEqual(restored.date, datetime(2024, 1, 1).date())
+        self.assertEqual(counts['tracker.healthrecord'], 1)
+        self.assertFalse(Notification.objects.exists())
+        # Sequences continue after the restored keys
+        new_record = HealthRecord.objects.create(user=self.user, sleep_hours=6, water_intake=1, mood='GOOD')
+        self.assertGreater(new_record.pk, restored.pk)
+
+    def test_restore_legacy_single_file_dump(self):
+        import io
+        import json
+        import tarfile
+        from .backup import BackupManager, iter_json_array
+        rows = [{'model': 'tracker.healthrecord', 'pk': self.record.pk, 'fields': {
+            'user': self.user.pk, 'date': '2024-02-02', 'sleep_hours': 5.5, 'water_intake': 1.0,
+            'mood': 'GOOD', 'last_modified': '2024-02-02T00:00:00Z',
+        }}]
+        data = json.dumps(rows, indent=2).encode()
+        self.assertEqual(list(iter_json_array(io.BytesIO(data), read_size=7)), rows)
+
+        legacy = os.path.join(self.backup_dir, 'health_backup_20240202_000000.tar.gz')
+        with tarfile.open(legacy, 'w:gz') as archive:
+            member = tarfile.TarInfo('./database.json')
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+
+        BackupManager(self.backup_dir).restore_backup(legacy)
+        self.assertEqual(HealthRecord.objects.get(pk=self.record.pk).sleep_hours, 5.5)
+
+    def test_failed_archive_restore_keeps_media(self):
+        import io
+        import json
+        import tarfile
+        from django.core.exceptions import ValidationError
+        from .backup import BackupManager
+        parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parent, True)
+        media_root = os.path.join(parent, 'media')
+        os.makedirs(os.path.join(media_root, 'avatars'))
+        with open(os.path.join(media_root, 'avatars', 'old.png'), 'wb') as f:
+            f.write(b'old')
+
+        def archive(name, user_id):
+            rows = json.dumps([{'model': 'tracker.healthrecord', 'pk': self.record.pk, 'fields': {
+                'user': user_id, 'date': '2024-02-02', 'sleep_hours': 5.5, 'water_intake': 1.0,
+                'mood': 'GOOD', 'last_modified': '2024-02-02T00:00:00Z',
+            }}]).encode()
+            path = os.path.join(self.backup_dir, name)
+            with tarfile.open(path, 'w:gz') as tar:
+                for member_name, data in (('./database.json', rows), ('./media/avatars/new.png', b'new')):
+                    member = tarfile.TarInfo(member_name)
+                    member.size = len(data)
+                    tar.addfile(member, io.BytesIO(data))
+            return path
+
+        manager = BackupManager(self.backup_dir)
+        with override_settings(MEDIA_ROOT=media_root):
+            # The record points at a missing user: the constraint check fails after the media is extracted
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ValidationError):
+                manager.restore_backup(archive('health_backup_20240202_000000.tar.gz', self.user.pk + 100))
+            self.assertEqual(os.listdir(os.path.join(media_root, 'avatars')), ['old.png'])
+            self.assertEqual(os.listdir(parent), ['media'])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                manager.restore_backup(archive('health_backup_20240203_000000.tar.gz', self.user.pk))
+            self.assertEqual(os.listdir(os.path.join(media_root, 'avatars')), ['new.png'])
+            self.assertEqual(os.listdir(parent), ['media'])
+
+    def test_retention_is_grandfather_father_son(self):
+        from .backup import BackupManager, select_retained
+        stamps = ['20261019_1200', '20261019_0100', '20261018_0100', '20261012_0100',
+                  '20261005_0100', '20260901_0100', '20260801_0100', '20260701_0100']
+        backups = [{'filename': s, 'timestamp': s} for s in stamps]
+        kept = select_retained(backups, {'daily': 2, 'weekly': 2, 'monthly': 3})
+        self.assertEqual(kept, {'20261019_1200', '20261018_0100', '20260901_0100', '20260801_0100'})
+        kept = select_retained(backups, {'last': 2, 'weekly': 3})
+        self.assertEqual(kept, {'20261019_1200', '20261019_0100', '20261018_0100', '20261005_0100'})
+
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+        self.record.sleep_hours = 9
+        self.record.save()
+        with override_settings(BACKUP_RETENTION={'daily': 1}):
+            manager.create_backup()
+        self.assertEqual(len(manager.list_backups()), 1)
+        # The replaced records chunk is only collected once the grace period is over
+        self.assertEqual(manager.collect_garbage(grace_seconds=0)['blobs'], 1)
+        self.assertEqual(manager.collect_garbage(grace_seconds=0)['blobs'], 0)
+
+    def test_manifest_records_digests_and_rows(self):
+        import hashlib
+        import json
+        from .backup import BackupManager
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+
+        listed = manager.list_backups()[0]
+        entry = manager.read_snapshot(listed['filename'])['entries']['database/tracker.healthrecord/00000000.jsonl']
+        chunk = manager.blob_store().read(entry['sha256'])
+        self.assertEqual(entry['sha256'], hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(entry['rows'], 1)
+        self.assertEqual(json.loads(chunk)['pk'], self.record.pk)
+
+        # The index is rebuilt from the manifests when it goes missing
+        os.remove(os.path.join(self.backup_dir, 'index.json'))
+        self.assertEqual(manager.list_backups(), [listed])
+
+    def test_verify_detects_corruption(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .backup import BackupManager
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+        self.record.sleep_hours = 9
+        self.record.save()
+        manager.create_backup()
+        self.assertTrue(all(r['ok'] for r in manager.verify_backups(workers=2)))
+
+        latest, oldest = [b['filename'] for b in manager.list_backups()]
+        digest = manager.read_snapshot(latest)['entries']['database/tracker.healthrecord/00000000.jsonl']['sha256']
+        path = manager.blob_store().path(digest)
+        with open(path, 'r+b') as f:
+            f.seek(os.path.getsize(path) // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        results = {r['filename']: r for r in manager.verify_backups(workers=2)}
+        self.assertTrue(results[oldest]['ok'])
+        self.assertFalse(results[latest]['ok'])
+
+        os.remove(path)
+        with override_settings(BACKUP_DIR=self.backup_dir):
+            with self.assertRaises(CommandError):
+                call_command('verify_backup', '--quick', stdout=StringIO())
+
+    def test_restore_user_point_in_time(self):
+        from django.core.management import call_command
+        from django.utils.dateparse import parse_datetime
+        from .backup import BackupManager
+        from .models import Notification
+        other = get_user_model().objects.create_user(
+            username='other', email='other@example.com', password='TestPass123!'
+        )
+        other_record = HealthRecord.objects.create(user=other, sleep_hours=8, water_intake=2, mood='GOOD')
+        Notification.objects.create(user=self.user, type='REMINDER', title='Hi', message='Hello')
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+        first = manager.list_backups()[0]
+
+        self.record.sleep_hours = 9
+        self.record.save()
+        HealthRecord.objects.filter(pk=other_record.pk).update(sleep_hours=3)
+        # The notifications chunk is reused, so its index ranges are inherited
+        manager.create_backup(incremental=True)
+        chunk = 'database/tracker.notification/00000000.jsonl'
+        self.assertEqual(manager.latest_snapshot()['entries'][chunk], manager.read_snapshot(first['filename'])['entries'][chunk])
+
+        HealthRecord.objects.filter(user=self.user).delete()
+        Notification.objects.filter(user=self.user).delete()
+        result = manager.restore_user(self.user.pk, as_of=parse_datetime(first['watermark']))
+        self.assertEqual(result['snapshot'], first['filename'])
+        self.assertEqual(HealthRecord.objects.get(pk=self.record.pk).sleep_hours, 7)
+        self.assertEqual(HealthRecord.objects.get(pk=other_record.pk).sleep_hours, 3)
+        self.assertEqual(result['counts']['tracker.healthrecord'], 1)
+
+        Notification.objects.filter(user=self.user).delete()
+        with override_settings(BACKUP_DIR=self.backup_dir):
+            call_command('restore_user', '--user', 'backup', stdout=StringIO())
+        self.assertEqual(HealthRecord.objects.get(pk=self.record.pk).sleep_hours, 9)
+        self.assertTrue(Notification.objects.filter(user=self.user).exists())
+
+    def test_restore_user_replaces_derived_rows(self):
+        from .backup import BackupManager
+        from .models import UserMetricBucket, WeightTrend
+        HealthRecord.objects.create(user=self.user, sleep_hours=7, water_intake=2, mood='GOOD', weight=80)
+        UserMetricBucket.objects.create(user=self.user, metric='weight', bucket=120, value=80)
+        manager = BackupManager(self.backup_dir)
+        manager.create_backup()
+
+        # A rank rebuild and a refit recreate the rows under new primary keys
+        UserMetricBucket.objects.filter(user=self.user).delete()
+        UserMetricBucket.objects.create(user=self.user, metric='weight', bucket=121, value=81)
+        WeightTrend.objects.filter(user=self.user).delete()
+        WeightTrend.for_user(self.user)
+
+        counts = manager.restore_user(self.user.pk)['counts']
+        self.assertEqual(counts['tracker.usermetricbucket'], 1)
+        self.assertEqual(UserMetricBucket.objects.get(user=self.user).value, 80)
+        self.assertTrue(WeightTrend.objects.get(user=self.user).needs_refit)
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def limiter(self, algorithm, now=1_000_000.0):
+        from .rate_limit import RateLimiter
+        clock = [now]
+        limiter = RateLimiter(algorithm=algorithm, clock=lambda: clock[0])
+        return limiter, clock
+
+    def test_concurrent_checks_never_over_admit(self):
+        import threading
+        from .rate_limit import ALGORITHMS
+        for algorithm in ALGORITHMS:
+            limiter, _ = self.limiter(algorithm)
+            admitted = []
+
+            def hammer():
+                for _ in range(25):
+                    admitted.append(limiter.check(f'hammer:{algorithm}', 100, 3600)[0])
+
+            threads = [threading.Thread(target=hammer) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(admitted.count(True), 100, algorithm)
+
+    def test_sliding_window_weights_previous_window(self):
+        limiter, clock = self.limiter('sliding_window', now=3600 * 1000)
+        for _ in range(10):
+            self.assertTrue(limiter.check('k', 10, 60)[0])
+        allowed, retry_after = limiter.check('k', 10, 60)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 60)
+        # Halfway through the next window half of the previous one still counts
+        clock[0] += 90
+        self.assertEqual([limiter.check('k', 10, 60)[0] for _ in range(6)], [True] * 5 + [False])
+
+    def test_token_bucket_refills_at_rate(self):
+        limiter, clock = self.limiter('token_bucket')
+        self.assertEqual([limiter.check('k', 10, 60)[0] for _ in range(11)], [True] * 10 + [False])
+        clock[0] += 12
+        self.assertEqual([limiter.check('k', 10, 60)[0] for _ in range(3)], [True, True, False])
+        # A long idle period refills the bucket, but never beyond its size
+        clock[0] += 3600
+        self.assertEqual(sum(limiter.check('k', 10, 60)[0] for _ in range(20)), 10)
+
+    def test_token_bucket_keys_expire(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        limiter, clock = self.limiter('token_bucket')
+        with patch.object(cache, 'add', wraps=cache.add) as add, patch.object(cache, 'touch', wraps=cache.touch) as touch:
+            self.assertTrue(limiter.check('k', 10, 60)[0])
+            add.assert_called_once_with('k', int(clock[0] * 1_000_000) + 6_000_000, 120)
+            touch.assert_not_called()
+            # Bursting moves the arrival time ahead of now: the expiry follows it
+            self.assertTrue(limiter.check('k', 10, 60)[0])
+            touch.assert_called_once_with('k', 120)
+
+    def test_leases_answer_checks_locally(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from .rate_limit import ALGORITHMS, RateLimiter
+        for algorithm in ALGORITHMS:
+            workers = [RateLimiter(algorithm=algorithm, clock=lambda: 1_000_000.0,
+                                   lease_size=10, max_overadmission=1.0, workers=2) for _ in range(2)]
+            with patch.object(cache, 'incr', wraps=cache.incr) as incr:
+                admitted = [workers[i % 2].check(f'lease:{algorithm}', 100, 3600)[0] for i in range(100)]
+            self.assertEqual(admitted, [True] * 100, algorithm)
+            # Full leases of 10, then smaller shares as the budget runs out
+            self.assertLess(incr.call_count, 20, algorithm)
+            self.assertFalse(workers[0].check(f'lease:{algorithm}', 100, 3600)[0], algorithm)
+            self.assertFalse(workers[1].check(f'lease:{algorithm}', 100, 3600)[0], algorithm)
+
+    def test_lease_overadmission_is_bounded(self):
+        from .rate_limit import RateLimiter
+        clock = [3600 * 1000 - 1.0]
+        workers = [RateLimiter(algorithm='fixed_window', clock=lambda: clock[0],
+                               lease_size=10, max_overadmission=0.1, workers=2) for _ in range(2)]
+        self.assertEqual(workers[0].lease_tokens(100), 5)
+        self.assertEqual(workers[0].lease_tokens(5), 1)
+        # Both workers lease at the end of a window and spend in the next one
+        for worker in workers:
+            self.assertTrue(worker.check('k', 100, 3600)[0])
+        clock[0] += 2
+        admitted = sum(workers[i % 2].check('k', 100, 3600)[0] for i in range(200))
+        self.assertEqual(admitted, 100 + 2 * 4)
+
+    def test_keys_per_user_and_ip(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        limiter, _ = self.limiter('fixed_window')
+        user = get_user_model().objects.create_user(username='limited', password='TestPass123!')
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        request.user = user
+        self.assertEqual(limiter.generate_key(request, 'api'), f'rl_api:u{user.pk}')
+        self.assertEqual(limiter.generate_key(request, 'api', scope='ip'), 'rl_api:ip10.0.0.1')
+        request.user = AnonymousUser()
+        self.assertEqual(limiter.generate_key(request, 'api'), 'rl_api:ip10.0.0.1')
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True,
+    RATE_LIMIT_DEFAULTS={
+        'api': {'limit': 3, 'period': 3600},
+        'login': {'limit': 2, 'period': 300, 'scope': 'ip', 'methods': ['POST']},
+        'export': {'limit': 2, 'period': 3600, 'algorithm': 'fixed_window'},
+    },
+)
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='limited', email='limited@example.com', password='TestPass123!', role=CustomUser.Role.ADMIN
+        )
+
+    def test_login_attempts_limited_per_ip(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('login'), {'username': 'x', 'password': 'y'}).status_code, 200)
+        response = self.client.post(reverse('login'), {'username': 'x', 'password': 'y'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # Viewing the form is not an attempt
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+    def test_exports_share_a_budget(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('export_csv')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('export_csv')).status_code, 200)
+        response = self.client.get(reverse('export_pdf'))
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.has_header('Retry-After'))
+
+    def test_api_routes_get_json_429_and_counters(self):
+        self.client.force_login(self.user)
+        statuses = [self.client.get(reverse('unread_notifications')).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        self.assertEqual(self.client.get(reverse('unread_notifications')).json()['error'], 'Too many requests')
+
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            stats = self.client.get(reverse('rate_limit_stats')).json()['limits']
+        self.assertEqual(stats['api'], {'checked': 5, 'limited': 2})
+
+
+class BulkheadTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_caps_per_worker_and_cluster(self):
+        from .bulkhead import Bulkhead
+        worker, other = (Bulkhead('test', per_worker=2, cluster=4, queue_timeout=0) for _ in range(2))
+        pdf = worker.acquire(3)
+        self.assertIsNotNone(pdf)
+        # One unit left across the cluster
+        self.assertIsNone(other.acquire(2))
+        csv = other.acquire(1)
+        self.assertIsNotNone(csv)
+        worker.release(pdf)
+        first, second = other.acquire(1), other.acquire(1)
+        self.assertIsNotNone(first)
+        # Two requests are already in flight in that worker
+        self.assertIsNone(second)
+        self.assertEqual(worker.stats()['in_flight'], 2)
+        self.assertEqual(worker.stats()['shed'], 2)
+
+    def test_queued_request_admitted_when_capacity_frees(self):
+        import threading
+        from .bulkhead import Bulkhead
+        bulkhead = Bulkhead('test', per_worker=1, cluster=1, max_queue=1, queue_timeout=5)
+        held = bulkhead.acquire()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(bulkhead.acquire()))
+        waiter.start()
+        while bulkhead.waiting == 0:
+            waiter.join(0.01)
+        self.assertEqual(bulkhead.stats()['queue_depth'], 1)
+        # The queue is full, so a third request is shed without waiting
+        self.assertIsNone(bulkhead.acquire())
+        bulkhead.release(held)
+        waiter.join()
+        self.assertIsNotNone(result[0])
+        stats = bulkhead.stats()
+        self.assertEqual((stats['queue_depth'], stats['queued'], stats['in_flight']), (0, 1, 1))
+
+    @override_settings(BULKHEADS={'reports': {'per_worker': 1, 'cluster': 1, 'queue_timeout': 0}})
+    def test_saturated_view_returns_503(self):
+        from .bulkhead import get_bulkhead
+        user = get_user_model().objects.create_user(username='busy', password='TestPass123!')
+        self.client.force_login(user)
+        slots = get_bulkhead('reports').acquire()
+        response = self.client.get(reverse('export_csv'))
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.has_header('Retry-After'))
+        # Light views are unaffected
+        self.assertEqual(self.client.get(reverse('unread_notifications')).status_code, 200)
+        get_bulkhead('reports').release(slots)
+        self.assertEqual(self.client.get(reverse('export_csv')).status_code, 200)
+
+
+class LoginBackendTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='shift', email='shift@example.com', password='TestPass123!'
+        )
+
+    def test_login_writes_user_row_once(self):
+        from django.test.utils import CaptureQueriesContext
+        from django.db import connection
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'shift@example.com', 'password': 'TestPass123!'},
+                                        REMOTE_ADDR='10.1.2.3')
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        user_queries = [q['sql'] for q in queries.captured_queries if 'tracker_customuser' in q['sql']]
+        self.assertEqual(len(user_queries), 2)
+        self.assertTrue(user_queries[0].startswith('SELECT'))
+        self.assertTrue(user_queries[1].startswith('UPDATE'))
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(self.user.last_login_ip, '10.1.2.3')
+
+    def shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        return override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }})
+
+    def test_failed_logins_lock_account(self):
+        from unittest.mock import patch
+        from django.contrib.auth import authenticate
+        from .backends import MAX_FAILED_ATTEMPTS
+        # Failures are counted in the shared cache until one locks the account
+        with self.shared_cache():
+            for _ in range(MAX_FAILED_ATTEMPTS - 1):
+                with self.assertNumQueries(1):
+                    self.assertIsNone(authenticate(None, username='shift', password='wrong'))
+            self.user.refresh_from_db()
+            self.assertIsNone(self.user.account_locked_until)
+            with self.assertNumQueries(2):
+                self.assertIsNone(authenticate(None, username='shift', password='wrong'))
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.account_locked_until)
+        # Locked accounts are rejected before the password is hashed
+        with patch('tracker.backends.check_password') as check:
+            self.assertIsNone(authenticate(None, username='shift', password='TestPass123!'))
+        check.assert_not_called()
+
+    def test_failures_kept_in_user_row_without_shared_cache(self):
+        from django.contrib.auth import authenticate
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .backends import MAX_FAILED_ATTEMPTS, cache_is_shared
+        # The test cache is local memory: each worker would count on its own
+        self.assertFalse(cache_is_shared())
+        for _ in range(MAX_FAILED_ATTEMPTS - 1):
+            authenticate(None, username='shift', password='wrong')
+            cache.clear()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, MAX_FAILED_ATTEMPTS - 1)
+        self.assertIsNone(authenticate(None, username='shift', password='wrong'))
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.account_locked_until)
+
+        # Once the lock has expired the count starts over
+        get_user_model().objects.filter(pk=self.user.pk).update(account_locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(authenticate(None, username='shift', password='wrong'))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.failed_login_attempts, self.user.account_locked_until), (1, None))
+
+    def test_success_resets_failure_count(self):
+        from django.contrib.auth import authenticate
+        from .backends import MAX_FAILED_ATTEMPTS
+        for _ in range(MAX_FAILED_ATTEMPTS - 1):
+            authenticate(None, username='shift', password='wrong')
+        self.assertIsNotNone(authenticate(None, username='shift', password='TestPass123!'))
+        for _ in range(MAX_FAILED_ATTEMPTS - 1):
+            authenticate(None, username='shift', password='wrong')
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.account_locked_until)
+
+    def test_unknown_and_inactive_users_rejected(self):
+        from django.contrib.auth import authenticate
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(None, username='nobody@example.com', password='TestPass123!'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authenticate(None, username='shift', password='TestPass123!'))
+
+
+class RecordAccessTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.patient = User.objects.create_user(username='owner', email='owner@example.com', password='TestPass123!')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='TestPass123!')
+        self.doctor = User.objects.create_user(username='doc', email='doc@example.com', password='TestPass123!',
+                                               role=CustomUser.Role.DOCTOR)
+        self.record = HealthRecord.objects.create(user=self.other, date=datetime.now().date(),
+                                                  sleep_hours=7, water_intake=2, mood='happy')
+
+    def request_for(self, user):
+        from django.contrib.auth import SESSION_KEY
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.test import RequestFactory
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        request.session[SESSION_KEY] = str(user.pk)
+        return request
+
+    def test_record_resolved_once_with_ownership_in_query(self):
+        from django.core.exceptions import PermissionDenied
+        from .decorators import can_access_record
+        view = can_access_record(lambda request, record_id: request.record)
+        with self.assertNumQueries(1):
+            self.assertEqual(view(self.request_for(self.other), record_id=self.record.pk), self.record)
+        with self.assertNumQueries(1), self.assertRaises(PermissionDenied):
+            view(self.request_for(self.patient), record_id=self.record.pk)
+        self.assertEqual(view(self.request_for(self.doctor), record_id=self.record.pk), self.record)
+
+    def test_role_cached_in_session_follows_role_changes(self):
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('patient_roster')).status_code, 200)
+        self.assertEqual(self.client.session['_tracker_role'], [str(self.doctor.pk), 'DOCTOR'])
+        # A role change applies on the next request, without ending the session
+        self.doctor.role = CustomUser.Role.PATIENT
+        self.doctor.save()
+        self.assertEqual(self.client.get(reverse('patient_roster')).status_code, 403)
+        self.assertEqual(self.client.session['_tracker_role'], [str(self.doctor.pk), 'PATIENT'])
+        self.assertEqual(self.client.get(reverse('notifications')).status_code, 200)
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        # Users are only cached in a cache shared by all workers
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='poller', email='poller@example.com', password='TestPass123!'
+        )
+        self.client.force_login(self.user)
+
+    def test_polling_needs_one_query(self):
+        self.client.get(reverse('unread_notifications'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('unread_notifications')).status_code, 200)
+
+    def test_profile_save_invalidates_cached_user(self):
+        from django.core.cache import cache
+        from .backends import user_cache_key
+        self.client.get(reverse('unread_notifications'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        response = self.client.get(reverse('user_profile'))
+        self.assertEqual(response.context['user'].first_name, 'Renamed')
+
+    def test_password_change_ends_cached_sessions(self):
+        self.client.get(reverse('unread_notifications'))
+        self.user.set_password('NewPass456!')
+        self.user.save()
+        response = self.client.get(reverse('unread_notifications'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_local_memory_cache_not_used_for_users(self):
+        from django.core.cache import cache
+        from .backends import user_cache_key
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.client.get(reverse('unread_notifications'))
+            self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+            # Every request sees changes saved by another worker
+            CustomUser.objects.filter(pk=self.user.pk).update(first_name='Elsewhere')
+            self.assertEqual(self.client.get(reverse('user_profile')).context['user'].first_name, 'Elsewhere')
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='listener', email='listener@example.com', password='TestPass123!'
+        )
+        from .models import Notification
+        Notification.objects.create(user=self.user, type='DAILY_REMINDER', title='Log today', message='Reminder')
+
+    async def test_local_broker_delivers_from_other_threads(self):
+        import threading
+        from .events import LocalBroker
+        broker = LocalBroker()
+        subscription = broker.subscribe(1)
+        event = {'event': 'read', 'data': {'count': 1}}
+        threading.Thread(target=broker.publish, args=(1, event)).start()
+        self.assertEqual(await subscription.get(2), event)
+        broker.publish(2, event)
+        self.assertIsNone(await subscription.get(0.05))
+        broker.unsubscribe(subscription)
+        self.assertEqual(dict(broker.subscribers), {})
+
+    async def test_cache_broker_relays_between_workers(self):
+        import asyncio
+        from .events import CacheBroker
+        reader, writer = CacheBroker(poll_interval=0.01), CacheBroker(poll_interval=0.01)
+        subscription = reader.subscribe(7)
+        await asyncio.sleep(0.02)
+        writer.publish(7, {'event': 'read', 'data': {'count': 3}})
+        self.assertEqual(await subscription.get(2), {'event': 'read', 'data': {'count': 3}})
+        reader.unsubscribe(subscription)
+
+    async def test_cache_broker_waits_for_unwritten_events(self):
+        import asyncio
+        from django.core.cache import cache
+        from .events import RESYNC, CacheBroker
+        reader, writer = CacheBroker(poll_interval=0.01, gap_timeout=0.2), CacheBroker()
+        subscription = reader.subscribe(7)
+        await asyncio.sleep(0.02)
+        first, second = {'event': 'read', 'data': {'count': 1}}, {'event': 'read', 'data': {'count': 2}}
+        # publish() numbers an event before writing it
+        cache.add('events:seq', 0, None)
+        sequence = cache.incr('events:seq')
+        writer.publish(7, second)
+        self.assertIsNone(await subscription.get(0.05))
+        cache.set(f'events:{sequence}', (7, first))
+        self.assertEqual(await subscription.get(2), first)
+        self.assertEqual(await subscription.get(2), second)
+        # An event that never arrives is given up on, and streams recount
+        cache.incr('events:seq')
+        writer.publish(7, first)
+        self.assertEqual(await subscription.get(2), RESYNC)
+        self.assertEqual(await subscription.get(2), first)
+        reader.unsubscribe(subscription)
+
+    async def test_stream_keeps_unread_count_from_events(self):
+        from unittest.mock import patch
+        from .events import LocalBroker, notification_stream
+        broker = LocalBroker()
+        with patch('tracker.events.get_broker', return_value=broker):
+            stream = notification_stream(self.user.pk, keepalive=0.05)
+            self.assertIn('event: unread\ndata: {"count": 1}', await anext(stream))
+            # Counted by the initial read already: the absolute count is not added to
+            broker.publish(self.user.pk, {'event': 'notification', 'data': {'id': 98, 'is_read': False}, 'unread': 1})
+            self.assertTrue((await anext(stream)).startswith('event: notification'))
+            self.assertEqual(await anext(stream), 'event: unread\ndata: {"count": 1}\n\n')
+            broker.publish(self.user.pk, {'event': 'notification', 'data': {'id': 99, 'is_read': False}, 'unread': 2})
+            self.assertTrue((await anext(stream)).startswith('event: notification'))
+            self.assertEqual(await anext(stream), 'event: unread\ndata: {"count": 2}\n\n')
+            broker.publish(self.user.pk, {'event': 'read', 'data': {'count': 2}, 'unread': 0})
+            self.assertEqual(await anext(stream), 'event: unread\ndata: {"count": 0}\n\n')
+            self.assertEqual(await anext(stream), ': keepalive\n\n')
+            await stream.aclose()
+        self.assertEqual(dict(broker.subscribers), {})
+
+    def test_creation_and_reads_are_published(self):
+        from unittest.mock import Mock, patch
+        from .events import notification_event
+        from .models import Notification
+        broker = Mock()
+        with patch('tracker.events.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = Notification.objects.create(user=self.user, type='WEIGHT_GOAL', title='Goal', message='Close')
+            broker.publish.assert_called_once_with(self.user.pk, {**notification_event(notification), 'unread': 2})
+            broker.reset_mock()
+            self.client.force_login(self.user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('mark_all_notifications_read'))
+            broker.publish.assert_called_once_with(self.user.pk, {'event': 'read', 'data': {'count': 2}, 'unread': 0})
+
+    @override_settings(NOTIFICATION_SSE_ENABLED=True)
+    async def test_stream_endpoint(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('notification_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertIn(b'data: {"count": 1}', await anext(content))
+        await content.aclose()
+
+    def test_stream_disabled_by_default(self):
+        # Under WSGI each open stream would pin a worker thread
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('notification_events')).status_code, 404)
+        page = self.client.get(reverse('daily_reminder_settings')).content.decode()
+        self.assertNotIn('EventSource', page)
+        self.assertIn('setInterval(checkUnreadNotifications, 60000)', page)
+        with override_settings(NOTIFICATION_SSE_ENABLED=True):
+            self.assertIn(reverse('notification_events'), self.client.get(reverse('daily_reminder_settings')).content.decode())
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='TestPass123!')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='TestPass123!')
+
+    def unread(self, user):
+        return get_user_model().objects.get(pk=user.pk).unread_notifications
+
+    def notify(self, user, **kwargs):
+        from .models import Notification
+        return Notification.objects.create(user=user, type='DAILY_REMINDER', title='Log today', message='Reminder', **kwargs)
+
+    def test_creates_and_bulk_creates_are_counted(self):
+        from .models import Notification
+        self.notify(self.user)
+        self.notify(self.user, is_read=True)
+        Notification.objects.bulk_create([
+            Notification(user=user, type='DAILY_REMINDER', title='Log today', message='Reminder')
+            for user in (self.user, self.user, self.other)
+        ])
+        self.assertEqual(self.unread(self.user), 3)
+        self.assertEqual(self.unread(self.other), 1)
+
+    def test_reads_and_deletes_are_counted(self):
+        from .models import Notification
+        first, second, third = self.notify(self.user), self.notify(self.user), self.notify(self.user)
+        first.is_read = True
+        first.save()
+        first.save()
+        self.assertEqual(Notification.objects.filter(pk=second.pk).mark_read(self.user.pk), 1)
+        self.assertEqual(Notification.objects.filter(pk=second.pk).mark_read(self.user.pk), 0)
+        self.assertEqual(self.unread(self.user), 1)
+        Notification.objects.get(pk=third.pk).delete()
+        Notification.objects.filter(user=self.user).delete()
+        self.assertEqual(self.unread(self.user), 0)
+
+    def test_views_read_the_counter(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.notify(self.user)
+        self.notify(self.user)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('unread_notifications'))
+        self.assertEqual(response.json()['unread_count'], 2)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        notification = self.notify(self.user)
+        self.client.post(reverse('mark_notification_read', args=[notification.pk]))
+        self.assertEqual(self.client.get(reverse('unread_notifications')).json()['unread_count'], 2)
+        self.client.post(reverse('mark_all_notifications_read'))
+        self.assertEqual(self.client.get(reverse('unread_notifications')).json()['unread_count'], 0)
+
+    def test_saving_a_stale_user_keeps_the_counter(self):
+        stale = get_user_model().objects.get(pk=self.user.pk)
+        self.notify(self.user)
+        stale.first_name = 'Stale'
+        stale.save()
+        self.assertEqual(self.unread(self.user), 1)
+
+    def test_reconcile_corrects_drift(self):
+        from django.core.management import call_command
+        self.notify(self.user)
+        self.notify(self.other)
+        get_user_model().objects.filter(pk=self.user.pk).update(unread_notifications=7)
+        out = StringIO()
+        call_command('reconcile_unread_counts', '--batch-size', '1', stdout=out)
+        self.assertIn('corrected 1 unread counts', out.getvalue())
+        self.assertEqual(self.unread(self.user), 1)
+        self.assertEqual(self.unread(self.other), 1)
+
+
+class NotificationPageTests(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        from .models import Notification
+        self.user = get_user_model().objects.create_user(
+            username='inbox', email='inbox@example.com', password='TestPass123!'
+        )
+        Notification.objects.bulk_create([
+            Notification(user=self.user, type='DAILY_REMINDER', title=f'Reminder {i}', message='Log today')
+            for i in range(25)
+        ])
+        # Identical timestamps, so pages are cut on the id tiebreaker
+        Notification.objects.filter(user=self.user).update(created_at=timezone.now())
+        self.client.force_login(self.user)
+
+    def test_pages_mark_only_displayed_rows_read(self):
+        from .models import Notification
+        response = self.client.get(reverse('notifications'))
+        first = response.context['notifications']
+        self.assertEqual(len(first), 20)
+        self.assertEqual(response.context['unread_count'], 20)
+        self.assertFalse(any(notification.is_read for notification in first))
+        self.assertEqual(Notification.objects.filter(user=self.user, is_read=False).count(), 5)
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).unread_notifications, 5)
+
+        data = self.client.get(reverse('notifications_api'), {'cursor': response.context['next_cursor']}).json()
+        self.assertEqual(len(data['notifications']), 5)
+        self.assertIsNone(data['next_cursor'])
+        ids = [notification.pk for notification in first] + [notification['id'] for notification in data['notifications']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_invalid_cursor_starts_over(self):
+        data = self.client.get(reverse('notifications_api'), {'cursor': 'forged', 'size': 3}).json()
+        self.assertEqual([n['title'] for n in data['notifications']], ['Reminder 24', 'Reminder 23', 'Reminder 22'])
+        self.assertIsNotNone(data['next_cursor'])
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='hoarder', email='hoarder@example.com', password='TestPass123!'
+        )
+
+    def unread(self):
+        return get_user_model().objects.get(pk=self.user.pk).unread_notifications
+
+    def test_notify_updates_todays_notification(self):
+        from .models import Notification
+        first = Notification.objects.notify(self.user, 'DAILY_REMINDER', 'Reminder', 'Log today')
+        Notification.objects.filter(pk=first.pk).mark_read(self.user.pk)
+        again = Notification.objects.notify(self.user, 'DAILY_REMINDER', 'Reminder', 'Log today, really')
+        Notification.objects.notify(self.user, 'WEIGHT_MILESTONE', 'Milestone', 'Well done')
+        Notification.objects.notify(self.user, 'WEIGHT_MILESTONE', 'Milestone', 'Well done')
+        self.assertEqual(again.pk, first.pk)
+        again.refresh_from_db()
+        self.assertEqual((again.occurrences, again.is_read, again.message), (2, False, 'Log today, really'))
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.unread(), 3)
+
+    def test_records_from_the_form_notify_against_the_users_goal(self):
+        from .models import Notification
+        self.user.weight_goal = 70
+        self.user.save()
+        self.client.force_login(self.user)
+        for weight in (80, 79):
+            response = self.client.post(reverse('add_health_record'), {
+                'sleep_hours': 7, 'water_intake': 2, 'mood': 'GOOD', 'weight': weight,
+            })
+            self.assertEqual(response.status_code, 302)
+        goal = Notification.objects.get(user=self.user, type='WEIGHT_GOAL')
+        self.assertEqual(goal.occurrences, 2)
+        self.assertIn('goal weight of 70.0 kg', goal.message)
+
+    def test_compaction_merges_duplicates(self):
+        from .models import Notification
+        from .retention import compact_notifications
+        Notification.objects.bulk_create([
+            Notification(user=self.user, type='DAILY_REMINDER', title='Reminder', message='Log today', is_read=is_read)
+            for is_read in (False, True, True)
+        ] + [Notification(user=self.user, type='ANOMALY_ALERT', title='Alert', message='Check') for _ in range(2)])
+        self.assertEqual(compact_notifications(batch_size=1), 2)
+        reminder = Notification.objects.get(user=self.user, type='DAILY_REMINDER')
+        self.assertEqual((reminder.occurrences, reminder.is_read), (3, False))
+        self.assertEqual(Notification.objects.filter(user=self.user, type='ANOMALY_ALERT').count(), 2)
+        self.assertEqual(self.unread(), 3)
+        self.assertEqual(compact_notifications(), 0)
+
+    def test_archive_moves_old_read_notifications(self):
+        import gzip
+        import json
+        from django.utils import timezone
+        from .models import Notification
+        from .retention import archive_notifications
+        Notification.objects.bulk_create([
+            Notification(user=self.user, type='WEIGHT_GOAL', title=f'Goal {i}', message='Close', is_read=i != 4)
+            for i in range(6)
+        ])
+        old = list(Notification.objects.order_by('pk').values_list('pk', flat=True)[:5])
+        Notification.objects.filter(pk__in=old).update(created_at=timezone.now() - timedelta(days=120))
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+
+        archived, path = archive_notifications(older_than_days=90, archive_dir=archive_dir, batch_size=2)
+        self.assertEqual(archived, 4)
+        with gzip.open(path, 'rt') as archive:
+            titles = [json.loads(line)['title'] for line in archive]
+        self.assertEqual(titles, ['Goal 0', 'Goal 1', 'Goal 2', 'Goal 3'])
+        self.assertEqual(sorted(Notification.objects.values_list('title', flat=True)), ['Goal 4', 'Goal 5'])
+        self.assertEqual(archive_notifications(older_than_days=90, archive_dir=archive_dir), (0, None))
+
+
+class WeeklySummaryTests(TestCase):
+    def setUp(self):
+        from datetime import date
+        from .models import DailyReminderSetting
+        User = get_user_model()
+        self.week_end = date(2026, 10, 11)
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='TestPass123!',
+                                              first_name='Alice', sleep_goal=7, water_goal=2)
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='TestPass123!')
+        DailyReminderSetting.objects.create(user=self.alice, reminder_time='08:00', send_email=True)
+        DailyReminderSetting.objects.create(user=self.bob, reminder_time='08:00', send_email=False)
+        self.add_records(self.alice, [(8, 2.5, 70, 'GOOD'), (6, 1.5, 70, 'BAD'), (7, 2.0, 71, 'GOOD')], days_back=0)
+        self.add_records(self.alice, [(6, 1.0, 72, 'NEUTRAL')], days_back=7)
+        self.add_records(self.bob, [(5, 1.0, None, 'TERRIBLE')], days_back=0)
+        # Only last week: no summary
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='TestPass123!')
+        self.add_records(self.carol, [(8, 2.0, None, 'GOOD')], days_back=7)
+
+    def add_records(self, user, values, days_back):
+        records = HealthRecord.objects.bulk_create([
+            HealthRecord(user=user, sleep_hours=sleep, water_intake=water, weight=weight, mood=mood)
+            for sleep, water, weight, mood in values
+        ])
+        for i, record in enumerate(records):
+            HealthRecord.objects.filter(pk=record.pk).update(date=self.week_end - timedelta(days=days_back + i))
+
+    def test_summaries_are_created_and_emailed(self):
+        from django.core import mail
+        from .models import Notification
+        from .summaries import send_weekly_summaries
+        self.assertEqual(send_weekly_summaries(self.week_end), {'notifications': 2, 'emails': 1})
+        summary = Notification.objects.get(user=self.alice, type='WEEKLY_SUMMARY')
+        self.assertEqual(summary.title, 'Your week: Oct 5 - Oct 11, 2026')
+        self.assertEqual(summary.message.splitlines(), [
+            '3 entries logged this week.',
+            'Sleep: 7.0 h average (+1.0 vs last week), goal met 2 of 3 days.',
+            'Water: 2.0 L average (+1.0 vs last week), goal met 2 of 3 days.',
+            'Weight: 70.3 kg average (-1.7 vs last week).',
+            'Mood: 2 good, 1 bad.',
+        ])
+        bob = Notification.objects.get(user=self.bob, type='WEEKLY_SUMMARY').message
+        self.assertIn('Sleep: 5.0 h average.', bob)
+        self.assertNotIn('Weight', bob)
+        self.assertFalse(Notification.objects.filter(user=self.carol).exists())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['alice@example.com'])
+        self.assertIn('Hi Alice,', mail.outbox[0].body)
+
+        self.assertEqual(send_weekly_summaries(self.week_end), {'notifications': 0, 'emails': 0})
+
+    def test_backfill_of_an_older_week(self):
+        from .models import Notification
+        from .summaries import send_weekly_summaries
+        self.assertEqual(send_weekly_summaries(self.week_end, email=False)['notifications'], 2)
+        # The later week being done does not mark the one before as done
+        self.assertEqual(send_weekly_summaries(self.week_end - timedelta(days=7), email=False)['notifications'], 2)
+        self.assertEqual(Notification.objects.filter(user=self.alice, type='WEEKLY_SUMMARY').count(), 2)
+
+    def test_query_count_does_not_grow_with_users(self):
+        from .summaries import send_weekly_summaries
+        for i in range(5):
+            user = get_user_model().objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+            self.add_records(user, [(7, 2.0, None, 'GOOD')], days_back=0)
+        # Summary rows, users already done, the insert and the counter update
+        with self.assertNumQueries(4):
+            self.assertEqual(send_weekly_summaries(self.week_end, email=False)['notifications'], 7)
+
+
+@override_settings(EMAIL_BACKEND='tracker.mail.QueuedEmailBackend',
+                   EMAIL_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailQueueTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='mailer', email='mailer@example.com', password='TestPass123!'
+        )
+
+    def queue(self, count):
+        from django.core.mail import EmailMessage, get_connection
+        get_connection().send_messages([
+            EmailMessage(f'Message {i}', 'Body', to=[f'user{i}@example.com']) for i in range(count)
+        ])
+
+    def test_password_reset_is_queued_then_delivered(self):
+        from django.core import mail
+        from .mail import EmailQueueWorker
+        from .models import OutboundEmail
+        self.client.post(reverse('password_reset'), {'email': 'mailer@example.com'})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().status, 'PENDING')
+
+        worker = EmailQueueWorker(threads=2)
+        self.assertEqual(worker.run_batch()['sent'], 1)
+        self.assertIsNone(worker.run_batch())
+        worker.close()
+        self.assertEqual(mail.outbox[0].to, ['mailer@example.com'])
+        self.assertIn('/reset/', mail.outbox[0].body)
+        self.assertEqual(OutboundEmail.objects.get().status, 'SENT')
+
+    def test_connections_are_reused_across_batches(self):
+        from unittest.mock import patch
+        from django.core import mail
+        from django.core.mail import get_connection
+        from .mail import EmailQueueWorker
+        self.queue(12)
+        worker = EmailQueueWorker(batch_size=4, threads=2)
+        with patch('tracker.mail.get_connection', wraps=get_connection) as opened:
+            batches = [worker.run_batch() for _ in range(3)]
+        worker.close()
+        self.assertEqual([batch['sent'] for batch in batches], [4, 4, 4])
+        self.assertLessEqual(opened.call_count, 2)
+        self.assertEqual(len(mail.outbox), 12)
+
+    def test_failures_are_retried_with_backoff(self):
+        import smtplib
+        from unittest.mock import patch
+        from django.utils import timezone
+        from .mail import EmailQueueWorker
+        from .models import OutboundEmail
+        self.queue(1)
+        now = [timezone.now()]
+        worker = EmailQueueWorker(threads=1, max_attempts=2, clock=lambda: now[0])
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                   side_effect=smtplib.SMTPServerDisconnected('gone')):
+            self.assertEqual(worker.run_batch()['retrying'], 1)
+            email = OutboundEmail.objects.get()
+            self.assertEqual((email.attempts, email.last_error), (1, 'SMTPServerDisconnected: gone'))
+            self.assertGreater(email.next_attempt_at, now[0])
+            self.assertIsNone(worker.run_batch())
+            now[0] = email.next_attempt_at
+            self.assertEqual(worker.run_batch()['failed'], 1)
+        worker.close()
+        self.assertEqual(OutboundEmail.objects.get().status, 'FAILED')
+
+    def test_attachments_respect_fail_silently(self):
+        from django.core.mail import EmailMessage
+        from .mail import QueuedEmailBackend
+        message = EmailMessage('Report', 'Body', to=['user@example.com'])
+        message.attach('report.csv', 'a,b', 'text/csv')
+        self.assertEqual(QueuedEmailBackend(fail_silently=True).send_messages([message]), 0)
+        with self.assertRaises(ValueError):
+            QueuedEmailBackend().send_messages([message])
+
+    def test_claim_is_extended_while_sending(self):
+        import time
+        from datetime import timedelta
+        from unittest.mock import patch
+        from django.utils import timezone
+        from .mail import EmailQueueWorker
+        from .models import OutboundEmail
+        self.queue(1)
+        now = [timezone.now()]
+
+        def slow_send(messages):
+            time.sleep(0.3)
+            return len(messages)
+
+        worker = EmailQueueWorker(threads=1, clock=lambda: now[0])
+        with patch('tracker.mail.CLAIM_TIMEOUT', 0.1), \
+                patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=slow_send), \
+                patch.object(worker, 'extend_claim', wraps=worker.extend_claim) as extend_claim:
+            self.assertEqual(worker.run_batch()['sent'], 1)
+        worker.close()
+        extend_claim.assert_called_with([OutboundEmail.objects.get().pk])
+
+        # An extended claim stays hidden from other workers
+        self.queue(1)
+        email = OutboundEmail.objects.get(status='PENDING')
+        now[0] = email.next_attempt_at
+        claimer = EmailQueueWorker(threads=1, clock=lambda: now[0])
+        self.assertEqual(claimer.claim(), [email])
+        now[0] += timedelta(seconds=200)
+        claimer.extend_claim([email.pk])
+        now[0] += timedelta(seconds=200)
+        other = EmailQueueWorker(clock=lambda: now[0])
+        self.assertEqual(other.claim(), [])
+        claimer.close()
+        other.close()
+
+    def test_command_reports_throughput(self):
+        from django.core.management import call_command
+        self.queue(3)
+        out = StringIO()
+        call_command('send_queued_email', '--once', '--threads', '2', stdout=out)
+        self.assertIn('Batch: 3 sent, 0 retrying, 0 failed', out.getvalue())
+        self.assertIn('messages/s', out.getvalue())
@@ -11,12 +11,19 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('mood-journal/', views.get_mood_journal, name='mood_journal'),
     path('notifications/', views.notifications, name='notifications'),
+    path('notifications/stream/', views.notification_events, name='notification_events'),
+    path('api/notifications/', views.notifications_api, name='notifications_api'),
     path('api/unread-notifications/', views.get_unread_notifications, name='unread_notifications'),
     path('api/mark-notification-read/<int:notification_id>/', views.mark_notification_read, name='mark_notification_read'),
     path('api/mark-all-notifications-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     path('daily-reminder/', views.daily_reminder, name='daily_reminder'),
     path('daily-reminder-settings/', views.daily_reminder_settings, name='daily_reminder_settings'),
     path('profile/', views.user_profile, name='user_profile'),
+    path('cohorts/', views.cohort_analytics, name='cohort_analytics'),
+    path('patients/', views.patient_roster, name='patient_roster'),
+    path('api/cohort-position/<int:patient_id>/', views.cohort_position_api, name='cohort_position'),
+    path('api/rate-limits/', views.rate_limit_stats_api, name='rate_limit_stats'),
+    path('api/bulkheads/', views.bulkhead_stats_api, name='bulkhead_stats'),
     
     # Password Reset URLs
     path('password_reset/', auth_views.PasswordResetView.as_view(
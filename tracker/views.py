@@ -1,12 +1,21 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .forms import HealthRecordForm, UserProfileForm, DailyReminderSettingForm
-from .models import HealthRecord, Notification, DailyReminderSetting, FoodRecommendation
+from .models import HealthRecord, Notification, DailyReminderSetting, FoodRecommendation, WeightTrend, CustomUser, CohortStatistic
+from .decorators import bulkhead, role_required
+from .cohorts import cohort_position
+from .roster import roster_page, SORT_FIELDS as ROSTER_SORT_FIELDS
+from .ranking import user_ranks
+from .middleware import rate_limit_stats
+from .bulkhead import bulkhead_stats
+from .events import notification_event, notification_stream
+from .inbox import notification_page
+from django.conf import settings
 from django.db import models
 from datetime import datetime, timedelta
 import csv
@@ -82,6 +91,11 @@ def dashboard(request):
         if request.user.water_goal and latest_record.water_intake:
             goal_progress['water'] = min(100, max(0, (latest_record.water_intake / request.user.water_goal) * 100))
     
+    # Weight goal forecast from the cached trend fit
+    weight_forecast = None
+    if request.user.weight_goal:
+        weight_forecast = WeightTrend.for_user(request.user).project(request.user.weight_goal)
+
     weekly_stats = {
         'avg_sleep': weekly_records.aggregate(avg_sleep=models.Avg('sleep_hours'))['avg_sleep'] or 0,
         'avg_water': weekly_records.aggregate(avg_water=models.Avg('water_intake'))['avg_water'] or 0,
@@ -165,6 +179,8 @@ def dashboard(request):
         'latest_record': latest_record,
         'weekly_stats': weekly_stats,
         'goal_progress': goal_progress,
+        'weight_forecast': weight_forecast,
+        'metric_ranks': user_ranks(request.user),
         'weekly_analytics': weekly_analytics,
         'monthly_analytics': monthly_analytics,
     })
@@ -260,16 +276,21 @@ def user_profile(request):
 # Notifications
 @login_required
 def notifications(request):
-    # Get user's notifications, ordered by most recent
-    user_notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Mark notifications as read when user visits the page
-    unread_notifications = user_notifications.filter(is_read=False)
-    unread_notifications.update(is_read=True)
-    
+    # One page of the user's notifications; those shown are marked read
+    page = notification_page(request.user, request.GET)
     return render(request, 'tracker/notifications.html', {
-        'notifications': user_notifications,
-        'unread_count': unread_notifications.count()
+        'notifications': page['notifications'],
+        'next_cursor': page['next_cursor'],
+        'unread_count': page['marked']
+    })
+
+# API: Next page of notifications for infinite scroll
+@login_required
+def notifications_api(request):
+    page = notification_page(request.user, request.GET)
+    return JsonResponse({
+        'notifications': [notification_event(notification)['data'] for notification in page['notifications']],
+        'next_cursor': page['next_cursor'],
     })
 
 # Mood journal
@@ -280,27 +301,37 @@ def get_mood_journal(request):
 # API: Get unread notifications
 @login_required
 def get_unread_notifications(request):
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    # The counter is read from the row: request.user may come from the cache
+    unread_count = CustomUser.objects.filter(pk=request.user.pk).values_list('unread_notifications', flat=True).first()
     return JsonResponse({'unread_count': unread_count})
 
+# Server-sent events replacing the unread count polling; needs ASGI
+@login_required
+async def notification_events(request):
+    if not getattr(settings, 'NOTIFICATION_SSE_ENABLED', False):
+        raise Http404('Notification stream is disabled')
+    user = await request.auser()
+    return StreamingHttpResponse(
+        notification_stream(user.pk),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 @login_required
 def mark_notification_read(request, notification_id):
-    try:
-        notification = Notification.objects.get(id=notification_id, user=request.user)
-        notification.is_read = True
-        notification.save()
-        return JsonResponse({'success': True})
-    except Notification.DoesNotExist:
+    notification = Notification.objects.filter(id=notification_id, user=request.user)
+    if not notification.mark_read(request.user.pk) and not notification.exists():
         return JsonResponse({'success': False}, status=404)
+    return JsonResponse({'success': True})
 
 @login_required
 def mark_all_notifications_read(request):
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    Notification.objects.filter(user=request.user).mark_read(request.user.pk)
     return JsonResponse({'success': True})
 
 def create_achievement_notification(user, achievement_type, message):
     """Create an achievement notification for the user"""
-    notification = Notification.objects.create(
+    notification = Notification.objects.notify(
         user=user,
         type=Notification.NotificationType.WEIGHT_MILESTONE if 'weight' in achievement_type else Notification.NotificationType.WEIGHT_GOAL,
         title=f"Achievement Unlocked: {achievement_type.title()}",
@@ -317,7 +348,8 @@ def daily_reminder(request):
     
     if not has_logged_today:
         # Create reminder notification
-        notification = Notification.objects.create(
+        # Repeated clicks update today's reminder instead of adding rows
+        notification = Notification.objects.notify(
             user=request.user,
             type=Notification.NotificationType.DAILY_REMINDER,
             title="Daily Health Check-in",
@@ -336,6 +368,7 @@ def export_dashboard(request):
     return render(request, 'tracker/export_dashboard.html')
 
 @login_required
+@bulkhead('reports', cost=1)
 def export_csv(request):
     """Export health records to CSV"""
     # Get date range from request
@@ -375,6 +408,7 @@ def export_csv(request):
     return response
 
 @login_required
+@bulkhead('reports', cost=3)
 def export_pdf(request):
     """Export health report to PDF using xhtml2pdf"""
     records = HealthRecord.objects.filter(user=request.user).order_by('-date')[:30]
@@ -402,6 +436,7 @@ def export_pdf(request):
     return response
 
 @login_required
+@bulkhead('reports', cost=1)
 def export_summary(request):
     """Export weekly/monthly summary"""
     period = request.GET.get('period', 'week')  # week or month
@@ -427,10 +462,11 @@ def export_summary(request):
         'start_date': start_date,
         'end_date': today,
         'total_records': records.count(),
-        'avg_sleep': records.aggregate(avg=models.Avg('sleep_hours'))['avg_sleep__avg'] or 0,
-        'avg_water': records.aggregate(avg=models.Avg('water_intake'))['avg_water__avg'] or 0,
-        'avg_weight': records.aggregate(avg=models.Avg('weight'))['avg_weight__avg'] or 0,
-        'mood_distribution': records.values('mood').annotate(count=models.Count('mood'))
+        'avg_sleep': records.aggregate(avg=models.Avg('sleep_hours'))['avg'] or 0,
+        'avg_water': records.aggregate(avg=models.Avg('water_intake'))['avg'] or 0,
+        'avg_weight': records.aggregate(avg=models.Avg('weight'))['avg'] or 0,
+        'mood_distribution': records.values('mood').annotate(count=models.Count('mood')),
+        'ranks': user_ranks(request.user),
     }
     
     return render(request, 'tracker/export_summary.html', summary)
@@ -460,6 +496,64 @@ def daily_reminder_settings(request):
         'reminder_setting': reminder_setting
     })
 
+# Cohort analytics for doctors
+@role_required([CustomUser.Role.DOCTOR, CustomUser.Role.ADMIN])
+def cohort_analytics(request):
+    """Population histograms per cohort, optionally comparing one patient."""
+    age_band = request.GET.get('age_band', CohortStatistic.ALL)
+    gender = request.GET.get('gender', CohortStatistic.ALL)
+    statistics = CohortStatistic.objects.filter(age_band=age_band, gender=gender)
+
+    patient = None
+    position = None
+    patient_id = request.GET.get('patient')
+    if patient_id:
+        try:
+            patient_id = int(patient_id)
+        except ValueError:
+            raise Http404('Invalid patient id')
+        patient = get_object_or_404(CustomUser, id=patient_id, role=CustomUser.Role.PATIENT)
+        position = cohort_position(patient)
+
+    return render(request, 'tracker/cohort_analytics.html', {
+        'statistics': statistics,
+        'age_band': age_band,
+        'gender': gender,
+        'age_bands': CohortStatistic.objects.values_list('age_band', flat=True).distinct().order_by('age_band'),
+        'genders': CohortStatistic.objects.values_list('gender', flat=True).distinct().order_by('gender'),
+        'patient': patient,
+        'position': position,
+    })
+
+# API: Where a patient sits within their cohort
+@role_required([CustomUser.Role.DOCTOR, CustomUser.Role.ADMIN])
+def cohort_position_api(request, patient_id):
+    patient = get_object_or_404(CustomUser, id=patient_id, role=CustomUser.Role.PATIENT)
+    return JsonResponse({'patient_id': patient.id, 'metrics': cohort_position(patient)})
+
+# API: Rate limit counters per limit class
+@role_required([CustomUser.Role.ADMIN])
+def rate_limit_stats_api(request):
+    return JsonResponse({'limits': rate_limit_stats()})
+
+# API: Load on the bulkheads guarding expensive views
+@role_required([CustomUser.Role.ADMIN])
+def bulkhead_stats_api(request):
+    return JsonResponse({'bulkheads': bulkhead_stats()})
+
+# Patient roster for doctors
+@role_required([CustomUser.Role.DOCTOR, CustomUser.Role.ADMIN])
+def patient_roster(request):
+    page = roster_page(request.GET)
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return render(request, 'tracker/patient_roster.html', {
+        **page,
+        'sort_fields': ROSTER_SORT_FIELDS,
+        'query_string': params.urlencode(),
+        'filters': request.GET,
+    })
+
 # Error handlers
 def handler404(request, exception, template_name='tracker/404.html'):
     response = render(request, template_name, status=404)